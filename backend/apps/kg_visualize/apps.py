@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from django.apps import AppConfig
+
+
+class KgVisualizeConfig(AppConfig):
+    name = 'backend.apps.kg_visualize'
+    label = 'kg_visualize'
+
+    def ready(self):
+        # 注册信号处理（图谱版本号/缓存失效）
+        from . import signals  # noqa: F401
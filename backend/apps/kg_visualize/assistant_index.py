@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+本地AI助手（generate_local_ai_response）使用的预计算索引
+
+对一份 nodes/links（快照缓存中的图谱，或旧客户端上传的 graphData）构建一次，之后每条消息只做查表：
+- by_id / position：实体ID -> 实体及其下标；adjacency：实体ID -> 相关关系下标（按关系顺序，自环只记一次）
+- domain_stats / relation_types：领域、关系类型直方图；most_active：关系最多的实体
+- grams：单字/二字 -> 名称、ID 或描述含有它的实体下标（升序数组），子串匹配先求查询各二字倒排列表的交集，
+  再逐字段校验候选实体；类型、领域取值很少，按取值编码数组向量化匹配
+- exact_names / exact_ids：小写名称、ID -> 实体下标；在消息中查找实体名称时按出现过的名称长度枚举消息子串
+- latin / semantic：名称含英文字母的实体、名称或描述含各语义关键词的实体
+
+search() 的打分与排序规则与原先逐实体扫描的实现一致（同分按实体顺序）。
+快照缓存中的图谱按 (领域, 图谱版本) 缓存索引；上传的 graphData 每次请求构建一次。
+"""
+import numpy as np
+from django.conf import settings
+
+from .graph_cache import GraphSnapshotCache
+
+# 查询含关键字 key 时，名称或描述含其任一近义词的实体加分
+SEMANTIC_KEYWORDS = {
+    'ai': ['人工智能', '机器学习', '深度学习', '神经网络', '算法'],
+    'medical': ['医学', '医疗', '疾病', '治疗', '药物', '医院'],
+    'finance': ['金融', '投资', '股票', '基金', '理财', '银行'],
+    'education': ['教育', '学习', '培训', '学校', '课程'],
+    'tech': ['技术', '软件', '编程', '开发', '系统'],
+}
+LATIN_LETTERS = frozenset('abcdefghijklmnopqrstuvwxyz')
+
+assistant_index_cache = GraphSnapshotCache(
+    max_entries=getattr(settings, "KG_ASSISTANT_INDEX_CACHE_MAX_ENTRIES", 8),
+    ttl=0,
+)
+
+
+def _endpoint(value):
+    """关系端点：ID，或 d3 替换后的实体对象"""
+    return value.get('id') if isinstance(value, dict) else value
+
+
+def _lower(node, field, default=''):
+    return str(node.get(field, default) or '').lower()
+
+
+class AssistantIndex:
+    """一份 nodes/links 的查询索引（不复制、不修改原始列表）"""
+
+    def __init__(self, graph_data):
+        self.nodes = graph_data.get('nodes', [])
+        self.links = graph_data.get('links', [])
+
+    def build(self):
+        nodes, links = self.nodes, self.links
+        self.by_id = {}
+        self.domain_stats = {}
+        self.relation_types = {}
+        self.adjacency = {}
+        for e, link in enumerate(links):
+            rel_type = link.get('type', '未知')
+            self.relation_types[rel_type] = self.relation_types.get(rel_type, 0) + 1
+            source, target = _endpoint(link.get('source')), _endpoint(link.get('target'))
+            self.adjacency.setdefault(source, []).append(e)
+            if target != source:
+                self.adjacency.setdefault(target, []).append(e)
+
+        # 检索字段（小写）：名称、ID、描述；类型、领域编码
+        self.fields = []
+        self.exact_names = {}
+        self.exact_ids = {}
+        grams = {}
+        categories = ({}, {})
+        category_codes = ([], [])
+        latin = []
+        semantic = {key: [] for key in SEMANTIC_KEYWORDS}
+        self.most_active = None
+        self.position = {}
+        for i, node in enumerate(nodes):
+            self.by_id.setdefault(node.get('id'), node)
+            self.position.setdefault(node.get('id'), i)
+            domain = node.get('domain', 'default')
+            self.domain_stats[domain] = self.domain_stats.get(domain, 0) + 1
+            activity = len(self.adjacency.get(node.get('id'), ()))
+            if self.most_active is None or activity > self.most_active[1]:
+                self.most_active = (node, activity)
+
+            fields = tuple(_lower(node, field) for field in ('name', 'id', 'description'))
+            self.fields.append(fields)
+            name, entity_id, description = fields
+            for values, codes, field in zip(categories, category_codes, ('type', 'domain')):
+                codes.append(values.setdefault(_lower(node, field), len(values)))
+            self.exact_names.setdefault(name, []).append(i)
+            self.exact_ids.setdefault(entity_id, []).append(i)
+            node_grams = set()
+            for text in fields:
+                node_grams.update(text)
+                node_grams.update(text[j:j + 2] for j in range(len(text) - 1))
+            for gram in node_grams:
+                grams.setdefault(gram, []).append(i)
+            if not LATIN_LETTERS.isdisjoint(name):
+                latin.append(i)
+            for key, keywords in SEMANTIC_KEYWORDS.items():
+                if any(keyword in name or keyword in description for keyword in keywords):
+                    semantic[key].append(i)
+
+        self.grams = {gram: np.array(members, dtype=np.int64) for gram, members in grams.items()}
+        (self.type_values, self.domain_values), (self.type_codes, self.domain_codes) = (
+            [list(values) for values in categories],
+            [np.array(codes, dtype=np.int64) for codes in category_codes],
+        )
+        self.name_lengths = sorted({len(name) for name in self.exact_names if len(name) > 1})
+        self.latin = np.array(latin, dtype=np.int64)
+        self.semantic = {key: np.array(members, dtype=np.int64) for key, members in semantic.items()}
+        return self
+
+    @property
+    def total_nodes(self):
+        return len(self.nodes)
+
+    @property
+    def total_links(self):
+        return len(self.links)
+
+    def relations(self, entity_id):
+        """实体的相关关系（按关系顺序）"""
+        return [self.links[e] for e in self.adjacency.get(entity_id, ())]
+
+    def name_of(self, value):
+        if isinstance(value, dict):
+            return value.get('name', '')
+        entity = self.by_id.get(value)
+        return entity.get('name', value) if entity else value
+
+    def neighbors(self, entity_id, limit):
+        """相关实体（按关系顺序去重，不含自身）"""
+        related = {}
+        for link in self.relations(entity_id):
+            for end in (_endpoint(link.get('source')), _endpoint(link.get('target'))):
+                if end != entity_id and end in self.by_id:
+                    related.setdefault(end, self.by_id[end])
+            if len(related) >= limit:
+                break
+        return list(related.values())[:limit]
+
+    def name_in(self, message):
+        """消息中出现的名称（长度 > 1）对应的第一个实体；没有时返回 None"""
+        first = None
+        for length in self.name_lengths:
+            if length > len(message):
+                break
+            for start in range(len(message) - length + 1):
+                matches = self.exact_names.get(message[start:start + length])
+                if matches and (first is None or matches[0] < first):
+                    first = matches[0]
+        return None if first is None else self.nodes[first]
+
+    def _containing(self, text):
+        """名称、ID 或描述可能含 text 的候选实体下标（各倒排列表的交集，调用方逐字段校验）"""
+        keys = {text} if len(text) < 2 else {text[j:j + 2] for j in range(len(text) - 1)}
+        postings = [self.grams.get(key) for key in keys]
+        if any(posting is None for posting in postings):
+            return []
+        postings.sort(key=len)
+        candidates = postings[0]
+        for posting in postings[1:]:
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        return candidates.tolist()
+
+    def _category_bonus(self, word):
+        """类型含 word 的实体 25 分，否则领域含 word 的 20 分；都不含任何实体时返回 None"""
+        bonus = None
+        for values, codes, points in ((self.domain_values, self.domain_codes, 20),
+                                      (self.type_values, self.type_codes, 25)):
+            matched = [code for code, value in enumerate(values) if word in value]
+            if matched:
+                if bonus is None:
+                    bonus = np.zeros(len(codes), dtype=np.int64)
+                bonus[np.isin(codes, matched)] = points
+        return bonus
+
+    def search(self, query, limit):
+        """
+        按相关度返回至多 limit 个实体：
+        完全匹配名称/ID、整句包含于名称/ID/描述、分词包含于名称/描述/类型/领域、
+        英文查询匹配英文名称、语义关键词
+        """
+        query_lower = query.lower()
+        scores = np.zeros(len(self.nodes), dtype=np.int64)
+        if not len(scores):
+            return []
+        fields = self.fields
+
+        # 1. 精确匹配
+        for i in self.exact_names.get(query_lower, ()):
+            scores[i] += 100
+        for i in self.exact_ids.get(query_lower, ()):
+            if fields[i][0] != query_lower:
+                scores[i] += 90
+
+        # 2. 包含匹配
+        for i in self._containing(query_lower):
+            name, entity_id, description = fields[i]
+            if query_lower in name:
+                scores[i] += 80
+            elif query_lower in entity_id:
+                scores[i] += 70
+            elif query_lower in description:
+                scores[i] += 60
+
+        # 3. 分词匹配：名称 > 描述 > 类型 > 领域，只计最高的一项
+        for word in query_lower.split():
+            if len(word) > 1:
+                bonus = self._category_bonus(word)
+                for i in self._containing(word):
+                    name, _, description = fields[i]
+                    if word in name or word in description:
+                        if bonus is not None:
+                            bonus[i] = 0
+                        scores[i] += 40 if word in name else 30
+                if bonus is not None:
+                    scores += bonus
+
+        # 4. 英文查询匹配英文名称
+        if not LATIN_LETTERS.isdisjoint(query_lower):
+            scores[self.latin] += 15
+
+        # 5. 语义关键词
+        for key, members in self.semantic.items():
+            if key in query_lower:
+                scores[members] += 35
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > limit:
+            kth = np.partition(scores[hits], -limit)[-limit]
+            hits = hits[scores[hits] >= kth]
+        # 稳定排序：同分按实体顺序
+        ranked = hits[np.argsort(-scores[hits], kind="stable")[:limit]]
+        return [self.nodes[i] for i in ranked.tolist()]
+
+
+def get_assistant_index(graph_data, domain=None):
+    """domain 不为空时 graph_data 为该领域当前版本的快照，索引随图谱版本缓存"""
+    if domain is None:
+        return AssistantIndex(graph_data).build()
+    return assistant_index_cache.get_or_build(domain, lambda: AssistantIndex(graph_data).build())
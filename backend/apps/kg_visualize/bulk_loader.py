@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+暂存表快速导入（import_kg_data --fast）
+
+先把数据批量装入临时暂存表（PostgreSQL 使用 COPY，其它数据库使用 executemany），
+再用集合式 SQL 一次性合并到 Entity / Relationship 表，适合千万行级别的导入。
+
+语义为“只插入不覆盖”（相当于 --conflict-resolution skip / --strategy skip）：
+- 目标领域内已存在的实体/关系保持不变，计为 skipped
+- ID 已被其它领域占用的实体、端点不在目标领域的关系计为 errors
+- 文件内重复的记录以第一次出现的为准
+"""
+import csv
+import io
+import time
+from itertools import islice
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .importer import DEFAULT_BATCH_SIZE, new_import_stats
+from .models import Entity, Relationship
+from .search_index import index_entities
+
+STAGE_ENTITY = "kg_stage_entity"
+STAGE_RELATIONSHIP = "kg_stage_relationship"
+# 每个键第一次出现的 seq（MySQL 不允许在同一语句中引用同一临时表两次，因此单独建表）
+STAGE_ENTITY_FIRST = "kg_stage_entity_first"
+STAGE_RELATIONSHIP_FIRST = "kg_stage_relationship_first"
+# 本次需要插入的实体（暂存表中的 seq），插入后据此写入检索索引
+STAGE_ENTITY_NEW = "kg_stage_entity_new"
+
+
+class StagingLoader:
+    def __init__(self, domain="default", batch_size=None, progress=None):
+        self.domain = domain
+        self.batch_size = max(1, int(batch_size or DEFAULT_BATCH_SIZE))
+        # progress(kind, rows_done, elapsed_seconds)，与 GraphImporter 一致
+        self.progress = progress
+        self.stats = new_import_stats()
+
+    @transaction.atomic
+    def run(self, nodes, links):
+        with connection.cursor() as cursor:
+            self._create_stage_tables(cursor)
+            try:
+                self._load_entities(cursor, nodes)
+                self._merge_entities(cursor)
+                self._load_relationships(cursor, links)
+                self._merge_relationships(cursor)
+            finally:
+                self._drop_stage_tables(cursor)
+        return self.stats
+
+    # -----------------------------
+    # Staging tables
+    # -----------------------------
+
+    def _create_stage_tables(self, cursor):
+        self._drop_stage_tables(cursor)
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {STAGE_ENTITY} ("
+            "seq BIGINT NOT NULL, id VARCHAR(100) NOT NULL, name VARCHAR(200) NOT NULL, "
+            "type VARCHAR(100) NOT NULL, description TEXT NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {STAGE_RELATIONSHIP} ("
+            "seq BIGINT NOT NULL, source_id VARCHAR(100) NOT NULL, target_id VARCHAR(100) NOT NULL, "
+            "type VARCHAR(100) NOT NULL, description TEXT NOT NULL)"
+        )
+
+    def _drop_stage_tables(self, cursor):
+        # MySQL 中只有 DROP TEMPORARY TABLE 不会隐式提交事务
+        drop = "DROP TEMPORARY TABLE" if connection.vendor == "mysql" else "DROP TABLE"
+        for table in (STAGE_ENTITY, STAGE_RELATIONSHIP, STAGE_ENTITY_FIRST, STAGE_RELATIONSHIP_FIRST,
+                      STAGE_ENTITY_NEW):
+            cursor.execute(f"{drop} IF EXISTS {table}")
+
+    def _create_first_seq_table(self, cursor, table, source, key_columns):
+        """记录每个键第一次出现的 seq，用于去重"""
+        self._create_seq_table(
+            cursor, table, f"SELECT MIN(seq) AS seq FROM {source} GROUP BY {', '.join(key_columns)}"
+        )
+
+    def _create_seq_table(self, cursor, table, select):
+        """用查询结果建立只含 seq 列（带索引）的临时表"""
+        # MySQL 中对临时表 CREATE INDEX 会隐式提交事务，因此索引直接写在建表语句中
+        index = "(seq BIGINT, INDEX (seq)) " if connection.vendor == "mysql" else ""
+        cursor.execute(f"CREATE TEMPORARY TABLE {table} {index}AS {select}")
+        if not index:
+            cursor.execute(f"CREATE INDEX {table}_seq ON {table} (seq)")
+
+    def _copy_rows(self, cursor, table, columns, rows):
+        """批量写入暂存表：PostgreSQL 走 COPY，其它数据库走 executemany"""
+        raw = cursor.cursor
+        if connection.vendor == "postgresql" and (hasattr(raw, "copy_expert") or hasattr(raw, "copy")):
+            buf = io.StringIO()
+            csv.writer(buf).writerows(rows)
+            buf.seek(0)
+            sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+            if hasattr(raw, "copy_expert"):  # psycopg2
+                raw.copy_expert(sql, buf)
+            else:  # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buf.getvalue())
+            return
+        placeholders = ", ".join(["%s"] * len(columns))
+        cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+    def _load(self, cursor, kind, records, table, columns, to_row):
+        stats = self.stats["entities" if kind == "nodes" else "relationships"]
+        started = time.monotonic()
+        iterator = iter(records)
+        seq = 0
+        processed = 0
+        while True:
+            chunk = list(islice(iterator, self.batch_size))
+            if not chunk:
+                return
+            rows = []
+            for record in chunk:
+                row = to_row(record)
+                if row is None:
+                    stats["errors"] += 1
+                    continue
+                seq += 1
+                rows.append((seq,) + row)
+            if rows:
+                self._copy_rows(cursor, table, columns, rows)
+            processed += len(chunk)
+            if self.progress:
+                self.progress(kind, processed, time.monotonic() - started)
+
+    # -----------------------------
+    # Entities
+    # -----------------------------
+
+    def _load_entities(self, cursor, nodes):
+        def to_row(node):
+            if not node.get("id") or not node.get("name"):
+                return None
+            return (str(node["id"]), node["name"], node.get("type") or "", node.get("description") or "")
+
+        self._load(cursor, "nodes", nodes, STAGE_ENTITY, ("seq", "id", "name", "type", "description"), to_row)
+        self._create_first_seq_table(cursor, STAGE_ENTITY_FIRST, STAGE_ENTITY, ("id",))
+
+    def _merge_entities(self, cursor):
+        entity_table = Entity._meta.db_table
+        stats = self.stats["entities"]
+
+        cursor.execute(f"SELECT COUNT(*) FROM {STAGE_ENTITY}")
+        staged = cursor.fetchone()[0]
+        # ID 已被其它领域占用
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {STAGE_ENTITY} s "
+            f"WHERE EXISTS (SELECT 1 FROM {entity_table} e WHERE e.id = s.id AND e.domain <> %s)",
+            [self.domain],
+        )
+        other_domain = cursor.fetchone()[0]
+        stats["errors"] += other_domain
+
+        # 先记下需要插入的实体：插入后据此找到新实体写入检索索引，不依赖创建时间的精度
+        self._create_seq_table(
+            cursor, STAGE_ENTITY_NEW,
+            f"SELECT s.seq FROM {STAGE_ENTITY} s INNER JOIN {STAGE_ENTITY_FIRST} f ON f.seq = s.seq "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {entity_table} e WHERE e.id = s.id)",
+        )
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        cursor.execute(
+            f"INSERT INTO {entity_table} (id, name, type, description, domain, created_at, updated_at) "
+            f"SELECT s.id, s.name, s.type, s.description, %s, %s, %s "
+            f"FROM {STAGE_ENTITY} s INNER JOIN {STAGE_ENTITY_NEW} n ON n.seq = s.seq",
+            [self.domain, now, now],
+        )
+        created = cursor.rowcount
+        stats["created"] += created
+        stats["skipped"] += staged - created - other_domain
+        self._index_new_entities(cursor)
+
+    def _index_new_entities(self, cursor):
+        """按 seq 分批读取本次插入的实体ID，写入检索索引"""
+        last = 0
+        while True:
+            cursor.execute(
+                f"SELECT s.seq, s.id FROM {STAGE_ENTITY} s INNER JOIN {STAGE_ENTITY_NEW} n ON n.seq = s.seq "
+                f"WHERE s.seq > %s ORDER BY s.seq LIMIT {self.batch_size}",
+                [last],
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            index_entities(list(
+                Entity.objects.filter(id__in=[entity_id for _, entity_id in rows]).only("id", "name", "description")
+            ))
+
+    # -----------------------------
+    # Relationships
+    # -----------------------------
+
+    def _load_relationships(self, cursor, links):
+        def to_row(link):
+            source = link.get("source")
+            target = link.get("target")
+            rel_type = link.get("type")
+            if not source or not target or not rel_type or source == target:
+                return None
+            return (str(source), str(target), rel_type, link.get("description") or "")
+
+        self._load(cursor, "links", links, STAGE_RELATIONSHIP,
+                   ("seq", "source_id", "target_id", "type", "description"), to_row)
+        self._create_first_seq_table(
+            cursor, STAGE_RELATIONSHIP_FIRST, STAGE_RELATIONSHIP, ("source_id", "target_id", "type")
+        )
+
+    def _merge_relationships(self, cursor):
+        entity_table = Entity._meta.db_table
+        relationship_table = Relationship._meta.db_table
+        stats = self.stats["relationships"]
+
+        cursor.execute(f"SELECT COUNT(*) FROM {STAGE_RELATIONSHIP}")
+        staged = cursor.fetchone()[0]
+        endpoint_in_domain = (
+            "EXISTS (SELECT 1 FROM {entity} e WHERE e.id = s.{column} AND e.domain = %s)"
+        )
+        endpoints_ok = " AND ".join(
+            endpoint_in_domain.format(entity=entity_table, column=column) for column in ("source_id", "target_id")
+        )
+        # 端点不存在于目标领域
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {STAGE_RELATIONSHIP} s WHERE NOT ({endpoints_ok})",
+            [self.domain, self.domain],
+        )
+        missing = cursor.fetchone()[0]
+        stats["errors"] += missing
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        cursor.execute(
+            f"INSERT INTO {relationship_table} (source_id, target_id, type, description, domain, created_at) "
+            f"SELECT s.source_id, s.target_id, s.type, s.description, %s, %s "
+            f"FROM {STAGE_RELATIONSHIP} s INNER JOIN {STAGE_RELATIONSHIP_FIRST} f ON f.seq = s.seq "
+            f"WHERE {endpoints_ok} "
+            f"AND NOT EXISTS (SELECT 1 FROM {relationship_table} r WHERE r.source_id = s.source_id "
+            f"AND r.target_id = s.target_id AND r.type = s.type AND r.domain = %s)",
+            [self.domain, now, self.domain, self.domain, self.domain],
+        )
+        created = cursor.rowcount
+        stats["created"] += created
+        stats["skipped"] += staged - created - missing
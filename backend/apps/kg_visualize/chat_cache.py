@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+AI聊天（POST /api/kg/ai-chat）的回复缓存
+
+键为 (规范化的消息, 领域, 选中实体ID, 选中关系ID, 是否使用外部AI)，版本为数据库中的全局修订号：
+图谱有写入后修订号变化，旧回复自然失效。消息规范化为 NFKC 小写并合并空白，
+"统计" 与 " 统计 " 命中同一条缓存。
+
+- 默认使用进程内的 LRU + TTL 缓存（GraphSnapshotCache）
+- KG_AI_CACHE_BACKEND 设为 Django 缓存别名（settings.CACHES）时改用该缓存，多个 worker 共享回复；
+  键取 SHA-1 摘要，兼容 memcached 的键长度与字符限制
+- 请求中 noCache 为 true 时跳过读取（仍写入新回复）；命中、未命中与跳过次数见 GET /api/kg/stats
+
+只有由服务端解析图谱上下文的请求才会缓存；旧客户端上传 graphData 时内容不受修订号约束，不缓存。
+外部AI调用失败时的本地兜底回复也不缓存。
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .graph_cache import GraphSnapshotCache
+from .search_index import normalize
+
+MAX_ENTRIES = getattr(settings, "KG_AI_CACHE_MAX_ENTRIES", 256)
+TTL = getattr(settings, "KG_AI_CACHE_TTL", 3600)
+BACKEND = getattr(settings, "KG_AI_CACHE_BACKEND", None)
+KEY_PREFIX = "kg:ai-chat:"
+
+
+def normalize_message(message):
+    return " ".join(normalize(message).split())
+
+
+def cache_key(message, domain, node_id, link_id, use_external_ai):
+    return (normalize_message(message), domain, node_id, link_id, bool(use_external_ai))
+
+
+class ChatResponseCache:
+    """按 (键, 修订号) 缓存回复；backend 为 Django 缓存别名时使用共享缓存"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, backend=BACKEND):
+        self.local = GraphSnapshotCache(max_entries=max_entries, ttl=ttl)
+        self.ttl = ttl
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def _shared_key(self, key, revision):
+        digest = hashlib.sha1(json.dumps([key, revision], ensure_ascii=False).encode("utf-8")).hexdigest()
+        return KEY_PREFIX + digest
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key, revision):
+        if self.backend:
+            value = caches[self.backend].get(self._shared_key(key, revision))
+        else:
+            value = self.local.get(key, revision)
+        self._count("misses" if value is None else "hits")
+        return value
+
+    def set(self, key, revision, value):
+        if self.backend:
+            caches[self.backend].set(self._shared_key(key, revision), value, timeout=self.ttl or None)
+        else:
+            self.local.set(key, revision, value)
+
+    def bypass(self):
+        self._count("bypassed")
+
+    def clear(self):
+        self.local.clear()
+        with self._lock:
+            self.hits = self.misses = self.bypassed = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {
+                "backend": self.backend or "local",
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+        if not self.backend:
+            local = self.local.stats()
+            stats.update(entries=local["entries"], max_entries=local["max_entries"], evictions=local["evictions"])
+        return stats
+
+
+chat_response_cache = ChatResponseCache()
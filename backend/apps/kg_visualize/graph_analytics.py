@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+图分析：中心性指标（GET /api/kg/analytics/centrality）
+
+基于 graph_index 的 CSR 索引做向量化计算，结果按 (领域, 指标, 参数, 图谱版本) 缓存：
+- degree：无向度数，并给出归一化度中心性 degree / (n - 1)
+- pagerank：有向幂迭代，稀疏矩阵乘法用 np.bincount 实现（安装了 SciPy 时使用 scipy.sparse），
+  悬挂节点的分值均匀分配
+- betweenness：Brandes 算法，每个源点一次按层向量化的 BFS 和反向依赖累加；
+  节点数超过 sample 时随机抽取 sample 个源点并按 n / sample 缩放（近似值）
+betweenness 在去重后的无向简单图上计算，与 networkx 的归一化方式一致。
+
+另有连通分量与社区划分（结果的持久化见 graph_communities.py）：
+- connected_components：弱连通分量，向量化的并查集（挂接根节点 + 路径压缩，直到所有关系两端同根）
+- label_propagation：半同步标签传播，每轮随机选取一半节点改用邻居中最多的标签（当前标签并列最多时保留），
+  避免同步更新在二分结构上来回振荡
+两者的编号都按规模从大到小重新编为 0, 1, 2, ...
+"""
+import numpy as np
+from django.conf import settings
+
+from .graph_cache import GraphSnapshotCache
+
+try:
+    from scipy import sparse
+except ImportError:  # 可选依赖
+    sparse = None
+
+METRICS = ("degree", "pagerank", "betweenness")
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-8
+PAGERANK_MAX_ITERATIONS = 100
+COMMUNITY_MAX_ITERATIONS = getattr(settings, "KG_COMMUNITY_MAX_ITERATIONS", 20)
+BETWEENNESS_SAMPLE = getattr(settings, "KG_BETWEENNESS_SAMPLE", 32)
+# 请求可指定的最大源点数：抽样数决定计算量，且是缓存键的一部分，需要有上限
+BETWEENNESS_MAX_SAMPLE = getattr(settings, "KG_BETWEENNESS_MAX_SAMPLE", BETWEENNESS_SAMPLE)
+
+centrality_cache = GraphSnapshotCache(
+    max_entries=getattr(settings, "KG_ANALYTICS_CACHE_MAX_ENTRIES", 16),
+    ttl=0,
+)
+
+
+def degree_centrality(index):
+    degree = np.diff(np.asarray(index.offsets)).astype(np.float64)
+    n = index.node_count
+    return degree / (n - 1) if n > 1 else degree
+
+
+def pagerank(index, damping=PAGERANK_DAMPING, tolerance=PAGERANK_TOLERANCE, max_iterations=PAGERANK_MAX_ITERATIONS):
+    """返回 (分值数组, 迭代次数)"""
+    n = index.node_count
+    if n == 0:
+        return np.zeros(0), 0
+    sources = np.asarray(index.edge_source)
+    targets = np.asarray(index.edge_target)
+    out_degree = np.bincount(sources, minlength=n).astype(np.float64)
+    dangling = out_degree == 0
+    weights = 1.0 / out_degree[sources]
+
+    matrix = None
+    if sparse is not None:
+        # matrix[t, s] = 1 / out_degree(s)
+        matrix = sparse.csr_matrix((weights, (targets, sources)), shape=(n, n))
+
+    rank = np.full(n, 1.0 / n)
+    for iteration in range(1, max_iterations + 1):
+        if matrix is not None:
+            spread = matrix @ rank
+        else:
+            spread = np.bincount(targets, weights=rank[sources] * weights, minlength=n)
+        new_rank = (1.0 - damping) / n + damping * (spread + rank[dangling].sum() / n)
+        delta = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if delta < n * tolerance:
+            break
+    return rank, iteration
+
+
+def _simple_undirected_csr(index):
+    """去掉方向、重复边后的 (offsets, neighbors)"""
+    n = index.node_count
+    sources = np.asarray(index.edge_source, dtype=np.int64)
+    targets = np.asarray(index.edge_target, dtype=np.int64)
+    low, high = np.minimum(sources, targets), np.maximum(sources, targets)
+    pairs = np.unique(low * n + high)
+    low, high = pairs // n, pairs % n
+    heads = np.concatenate([low, high])
+    tails = np.concatenate([high, low])
+    order = np.argsort(heads, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(heads, minlength=n), out=offsets[1:])
+    return offsets, tails[order]
+
+
+def _expand_frontier(offsets, neighbors, frontier):
+    """前沿节点的全部 (父节点, 邻居) 对"""
+    starts = offsets[frontier]
+    counts = offsets[frontier + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    parents = np.repeat(frontier, counts)
+    # 每个前沿节点的邻居区间拼接后的下标
+    shifts = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+    return parents, neighbors[np.arange(total) + shifts]
+
+
+def betweenness(index, sample=BETWEENNESS_SAMPLE, seed=0):
+    """返回 (分值数组, 实际使用的源点数)"""
+    n = index.node_count
+    scores = np.zeros(n)
+    if n < 3:
+        return scores, n
+    offsets, neighbors = _simple_undirected_csr(index)
+    if sample and sample < n:
+        sources = np.random.default_rng(seed).choice(n, size=sample, replace=False)
+    else:
+        sources = np.arange(n)
+
+    for source in sources:
+        distance = np.full(n, -1, dtype=np.int64)
+        sigma = np.zeros(n)
+        distance[source] = 0
+        sigma[source] = 1.0
+        frontier = np.array([source], dtype=np.int64)
+        levels = []  # 每层的 (父节点, 子节点) 最短路径边
+        depth = 0
+        while frontier.size:
+            parents, children = _expand_frontier(offsets, neighbors, frontier)
+            distance[children[distance[children] < 0]] = depth + 1
+            on_path = distance[children] == depth + 1
+            parents, children = parents[on_path], children[on_path]
+            if not children.size:
+                break
+            # np.bincount 比 np.add.at 快一个数量级
+            sigma += np.bincount(children, weights=sigma[parents], minlength=n)
+            levels.append((parents, children))
+            frontier = np.flatnonzero(distance == depth + 1)
+            depth += 1
+
+        delta = np.zeros(n)
+        for parents, children in reversed(levels):
+            delta += np.bincount(
+                parents, weights=sigma[parents] / sigma[children] * (1.0 + delta[children]), minlength=n
+            )
+        delta[source] = 0.0
+        scores += delta
+
+    scale = 1.0 / ((n - 1) * (n - 2))
+    if len(sources) < n:
+        scale *= n / len(sources)
+    return scores * scale, len(sources)
+
+
+def _relabel_by_size(labels):
+    """标签重新编号：最大的组为 0，其余按规模递减"""
+    if not len(labels):
+        return labels.astype(np.int64)
+    unique, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(unique), dtype=np.int64)
+    rank[np.argsort(-counts, kind="stable")] = np.arange(len(unique))
+    return rank[inverse]
+
+
+def connected_components(index):
+    """弱连通分量编号数组"""
+    n = index.node_count
+    parent = np.arange(n, dtype=np.int64)
+    sources = np.asarray(index.edge_source, dtype=np.int64)
+    targets = np.asarray(index.edge_target, dtype=np.int64)
+    while True:
+        # 每轮开始时 parent 已完全压缩，parent[x] 即 x 的根
+        roots_s, roots_t = parent[sources], parent[targets]
+        split = roots_s != roots_t
+        if not split.any():
+            break
+        # 较大的根挂到较小的根下（同一根有多个候选时任取其一，下一轮继续合并）
+        low = np.minimum(roots_s[split], roots_t[split])
+        high = np.maximum(roots_s[split], roots_t[split])
+        parent[high] = low
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+    return _relabel_by_size(parent)
+
+
+def label_propagation(index, max_iterations=COMMUNITY_MAX_ITERATIONS, seed=0):
+    """返回 (社区编号数组, 迭代轮数)"""
+    n = index.node_count
+    labels = np.arange(n, dtype=np.int64)
+    if n == 0:
+        return labels, 0
+    offsets, neighbors = _simple_undirected_csr(index)
+    heads = np.repeat(np.arange(n, dtype=np.int64), np.diff(offsets))
+    rng = np.random.default_rng(seed)
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        # 每个 (节点, 邻居标签) 的出现次数；unique 的结果按节点、标签有序
+        pairs, counts = np.unique(heads * n + labels[neighbors], return_counts=True)
+        nodes, candidates = pairs // n, pairs % n
+        # 当前标签 +0.5，随机打破其余并列
+        score = counts + 0.5 * (candidates == labels[nodes]) + 0.25 * rng.random(len(pairs))
+        starts = np.flatnonzero(np.r_[True, nodes[1:] != nodes[:-1]])
+        best = np.maximum.reduceat(score, starts)
+        chosen = score == np.repeat(best, np.diff(np.r_[starts, len(pairs)]))
+        proposal = labels.copy()
+        proposal[nodes[chosen]] = candidates[chosen]
+        update = rng.random(n) < 0.5
+        changed = update & (proposal != labels)
+        if not changed.any() and np.array_equal(proposal, labels):
+            break
+        labels[changed] = proposal[changed]
+    return _relabel_by_size(labels), iteration
+
+
+def compute_centrality(index, metric, sample=BETWEENNESS_SAMPLE):
+    """返回 (分值数组, 附加信息)"""
+    if metric == "degree":
+        return degree_centrality(index), {}
+    if metric == "pagerank":
+        scores, iterations = pagerank(index)
+        return scores, {"iterations": iterations}
+    if metric == "betweenness":
+        scores, used = betweenness(index, sample=sample)
+        return scores, {"sampled_sources": used, "exact": used >= index.node_count}
+    raise ValueError(f"Unknown metric: {metric}")
+
+
+def get_centrality(index, metric, sample=BETWEENNESS_SAMPLE):
+    """按图谱版本缓存的中心性结果"""
+    key = (index.domain, metric, sample if metric == "betweenness" else None)
+    return centrality_cache.get_or_build(key, lambda: compute_centrality(index, metric, sample))
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+图谱快照缓存
+
+- 图谱版本号：任何 Entity/Relationship 写操作都会使版本号 +1（见 signals.py 以及批量写入路径）
+- 快照缓存：按 (domain, 版本号) 缓存 get_graph_data 序列化后的 nodes/links，
+  版本号变化后旧快照自然失效，并按容量(LRU)和TTL淘汰
+
+版本号只在当前进程内有效；同时每次写入会推进数据库中的 GraphRevision 修订号，
+用于 ETag/Last-Modified，并在读取修订号时同步其它 worker 的写入（见 observe_graph_revision）。
+
+随 get_graph_data 返回的派生数据（社区标签、布局坐标）保存后只推进单独的派生修订号：
+它参与 ETag 和快照缓存的键，但不改变图谱版本号和全局修订号，
+因此不会使邻接索引等缓存失效，派生结果之间也不会互相判定对方过期。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import GraphRevision
+
+
+# -----------------------------
+# Graph version
+# -----------------------------
+
+GLOBAL_REVISION_KEY = "global"
+DERIVED_REVISION_KEY = "derived"
+
+_version_lock = threading.Lock()
+_graph_version = 0
+_last_seen_revision = None
+_deferred = threading.local()
+
+
+def get_graph_version():
+    """当前进程内的图谱版本号"""
+    return _graph_version
+
+
+def bump_graph_version():
+    """图谱发生写操作后调用，返回新的版本号"""
+    global _graph_version
+    with _version_lock:
+        _graph_version += 1
+        return _graph_version
+
+
+def _bump_revision(key):
+    updated = GraphRevision.objects.filter(key=key).update(revision=F("revision") + 1, updated_at=timezone.now())
+    if not updated:
+        GraphRevision.objects.get_or_create(key=key, defaults={"revision": 1})
+
+
+def bump_graph_revision():
+    """推进数据库中的全局修订号（与写操作处于同一事务）"""
+    _bump_revision(GLOBAL_REVISION_KEY)
+
+
+def bump_derived_revision():
+    """派生数据（社区标签、布局坐标）保存后推进派生修订号"""
+    _bump_revision(DERIVED_REVISION_KEY)
+
+
+def scope_lock_key(prefix, domain):
+    """派生数据计算任务的范围锁行键（如 communities:<范围>），超长的范围名取哈希"""
+    key = prefix + domain
+    max_length = GraphRevision._meta.get_field("key").max_length
+    if len(key) > max_length:
+        key = prefix + hashlib.sha1(domain.encode("utf-8")).hexdigest()
+    return key[:max_length]
+
+
+def lock_scope(prefix, domain):
+    """
+    在当前事务中锁定范围的锁行，直到事务结束：UPDATE 在 PostgreSQL/MySQL 上持有行锁，
+    在 SQLite 上取得写锁（作为事务的第一条语句，其它事务排队等待而不是因锁升级失败）；
+    锁行的 revision 记录该范围的计算次数
+    """
+    key = scope_lock_key(prefix, domain)
+    if not GraphRevision.objects.filter(key=key).update(revision=F("revision") + 1):
+        GraphRevision.objects.get_or_create(key=key)
+        GraphRevision.objects.filter(key=key).update(revision=F("revision") + 1)
+
+
+def get_graph_revision():
+    """读取全局修订号，返回 (revision, updated_at)；尚无写入时返回 (0, None)"""
+    row = GraphRevision.objects.filter(key=GLOBAL_REVISION_KEY).values_list("revision", "updated_at").first()
+    revision, updated_at = row if row else (0, None)
+    observe_graph_revision(revision)
+    return revision, updated_at
+
+
+def get_payload_revision():
+    """
+    一次查询读取 get_graph_data 响应所依赖的修订号，返回 (全局修订号, 派生修订号, 最近更新时间)
+    """
+    rows = {
+        key: (revision, updated_at)
+        for key, revision, updated_at in GraphRevision.objects.filter(
+            key__in=(GLOBAL_REVISION_KEY, DERIVED_REVISION_KEY)
+        ).values_list("key", "revision", "updated_at")
+    }
+    revision, updated_at = rows.get(GLOBAL_REVISION_KEY, (0, None))
+    derived, derived_at = rows.get(DERIVED_REVISION_KEY, (0, None))
+    observe_graph_revision(revision)
+    return revision, derived, max((t for t in (updated_at, derived_at) if t), default=None)
+
+
+def observe_graph_revision(revision):
+    """修订号与本进程上次看到的不同，说明有（其它进程的）写入，推进本地版本号"""
+    global _last_seen_revision
+    with _version_lock:
+        changed = _last_seen_revision is not None and _last_seen_revision != revision
+        _last_seen_revision = revision
+    if changed:
+        bump_graph_version()
+
+
+def invalidate_graph():
+    """
+    标记图谱已变更：立即推进版本号和数据库修订号；若处于事务中，提交后再推进一次本地版本号，
+    避免并发读请求在提交前读到旧数据并缓存到新版本号下
+    """
+    bump_graph_version()
+    bump_graph_revision()
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        # 同一事务内只注册一次提交回调
+        if not any(entry[1] is bump_graph_version for entry in connection.run_on_commit):
+            transaction.on_commit(bump_graph_version)
+
+
+class deferred_invalidation:
+    """
+    批量写入期间暂停逐行信号触发的失效，退出时统一失效一次
+    （批量删除会为每一行发送 post_delete 信号，逐行推进修订号代价很高）
+    """
+
+    def __enter__(self):
+        _deferred.depth = getattr(_deferred, "depth", 0) + 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _deferred.depth -= 1
+        if exc_type is None and not _deferred.depth:
+            invalidate_graph()
+        return False
+
+
+def invalidation_deferred():
+    return getattr(_deferred, "depth", 0) > 0
+
+
+# -----------------------------
+# Snapshot cache
+# -----------------------------
+
+class GraphSnapshotCache:
+    """按 (key, version) 缓存图谱快照的 LRU + TTL 缓存"""
+
+    def __init__(self, max_entries=32, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, expires_at, value)
+        self._lock = threading.Lock()
+        # key -> [构建锁, 等待/持有该锁的线程数]：同一键同时只有一个线程在构建
+        self._build_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        with self._lock:
+            value = self._lookup(key, version)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def _lookup(self, key, version):
+        """调用方持有 self._lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entry_version, expires_at, value = entry
+        if entry_version == version and (expires_at is None or expires_at > time.monotonic()):
+            self._entries.move_to_end(key)
+            return value
+        # 版本过期或TTL到期
+        del self._entries[key]
+        return None
+
+    def set(self, key, version, value):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (version, expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_build(self, key, builder):
+        """
+        命中则直接返回缓存，否则调用 builder() 构建并缓存；
+        同一键的并发未命中只构建一次，其余线程等待构建完成后直接使用结果
+        """
+        # 构建前读取版本号：构建期间若有写入，结果会落在旧版本下，不会被后续请求误用
+        version = get_graph_version()
+        value = self.get(key, version)
+        if value is not None:
+            return value
+        with self._lock:
+            entry = self._build_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                with self._lock:
+                    value = self._lookup(key, version)
+                if value is None:
+                    value = builder()
+                    self.set(key, version, value)
+                return value
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._build_locks[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "graph_version": get_graph_version(),
+            }
+
+
+graph_snapshot_cache = GraphSnapshotCache(
+    max_entries=getattr(settings, "KG_GRAPH_CACHE_MAX_ENTRIES", 32),
+    ttl=getattr(settings, "KG_GRAPH_CACHE_TTL", 300),
+)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+连通分量与社区标签的计算任务（compute_kg_communities 命令、POST /api/kg/analytics/communities）
+
+- 在 graph_index 的 CSR 索引上计算弱连通分量和标签传播社区（算法见 graph_analytics.py）；
+  没有任何关系的实体不在索引中，各自成为单独的分量和社区，编号排在最后
+- 结果写入 EntityCommunity：每个范围（领域或 all）只保留最近一次的结果，并记录对应的图谱修订号，
+  修订号落后于当前修订号即为过期；读取（GET 接口、get_graph_data、LOD 视图）只使用已保存的结果，从不触发计算
+- 同一范围的计算按范围串行：事务先更新该范围的锁行（GraphRevision 中键为 communities:<范围> 的行）取得行锁，
+  并发的请求排队等待，拿到锁后结果已是最新的则直接返回，不会重复计算或重复写入
+- get_graph_data 的节点带有社区标签，因此写入结果后推进派生修订号（见 graph_cache.py），
+  使快照缓存和 ETag 随之更新；计算期间有其它写入时，结果记在计算开始时的修订号下，显示为过期，下次计算时更新
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+
+from .graph_analytics import COMMUNITY_MAX_ITERATIONS, connected_components, label_propagation
+from .graph_cache import bump_derived_revision, get_graph_revision, lock_scope
+from .graph_index import get_graph_index
+from .models import Entity, EntityCommunity
+
+INSERT_BATCH_SIZE = getattr(settings, "KG_COMMUNITY_INSERT_BATCH_SIZE", 5000)
+# POST /api/kg/analytics/communities 在请求线程中计算，只接受实体数不超过该值的范围
+HTTP_MAX_NODES = getattr(settings, "KG_COMMUNITY_HTTP_MAX_NODES", 100000)
+LOCK_KEY_PREFIX = "communities:"
+
+
+def stored_revision(domain="all"):
+    """已保存结果对应的修订号；尚未计算时返回 None"""
+    return EntityCommunity.objects.filter(scope=domain).values_list("revision", flat=True).first()
+
+
+def community_labels(domain="all"):
+    """实体ID -> (分量编号, 社区编号)，为最近一次保存的结果（可能已过期）"""
+    return {
+        entity_id: (component, community)
+        for entity_id, component, community in EntityCommunity.objects.filter(scope=domain)
+        .values_list("entity_id", "component", "community")
+        .iterator(chunk_size=INSERT_BATCH_SIZE)
+    }
+
+
+def _scope_entity_ids(domain):
+    queryset = Entity.objects.all() if domain == "all" else Entity.objects.filter(domain=domain)
+    return queryset.order_by().values_list("id", flat=True).iterator(chunk_size=INSERT_BATCH_SIZE)
+
+
+def detect_communities(domain="all", max_iterations=COMMUNITY_MAX_ITERATIONS, force=True):
+    """
+    计算并保存一个范围的标签，返回 {"revision", "iterations", "entities", "recomputed"}；
+    force 为 False 时，拿到范围锁后已保存的结果是最新的（如其它请求刚算完）则不再计算
+    """
+    with transaction.atomic():
+        lock_scope(LOCK_KEY_PREFIX, domain)
+        revision, _ = get_graph_revision()
+        if not force and stored_revision(domain) == revision:
+            return {
+                "revision": revision,
+                "iterations": 0,
+                "entities": EntityCommunity.objects.filter(scope=domain).count(),
+                "recomputed": False,
+            }
+
+        index = get_graph_index(domain)
+        components = connected_components(index).tolist()
+        communities, iterations = label_propagation(index, max_iterations)
+        communities = communities.tolist()
+
+        rows = [(entity_id, components[i], communities[i]) for i, entity_id in enumerate(index.ids)]
+        next_component = max(components, default=-1) + 1
+        next_community = max(communities, default=-1) + 1
+        for entity_id in _scope_entity_ids(domain):
+            if entity_id not in index.index:
+                rows.append((entity_id, next_component, next_community))
+                next_component += 1
+                next_community += 1
+        if not rows:
+            return {"revision": revision, "iterations": iterations, "entities": 0, "recomputed": True}
+
+        EntityCommunity.objects.filter(scope=domain).delete()
+        _insert_rows(domain, revision, rows)
+        bump_derived_revision()
+    return {"revision": revision, "iterations": iterations, "entities": len(rows), "recomputed": True}
+
+
+def _insert_rows(domain, revision, rows):
+    """直接 executemany（行数与实体数相同，逐行构造模型实例开销较大）"""
+    sql = (
+        f"INSERT INTO {EntityCommunity._meta.db_table} (scope, revision, entity_id, component, community) "
+        "VALUES (%s, %s, %s, %s, %s)"
+    )
+    rows = iter(rows)
+    with connection.cursor() as cursor:
+        while True:
+            chunk = list(islice(rows, INSERT_BATCH_SIZE))
+            if not chunk:
+                return
+            cursor.executemany(sql, [(domain, revision, *row) for row in chunk])
+
+
+def ensure_communities(domain="all"):
+    """结果缺失或过期时重新计算（同一范围的并发调用只计算一次），返回 (修订号, 是否重新计算)"""
+    result = detect_communities(domain, force=False)
+    return result["revision"], result["recomputed"]
+
+
+def community_summary(domain="all", limit=100):
+    """按规模从大到小的社区列表及总数"""
+    queryset = EntityCommunity.objects.filter(scope=domain)
+    totals = queryset.aggregate(
+        entities=Count("id"), components=Max("component"), communities=Max("community")
+    )
+    rows = (
+        queryset.values("community")
+        .annotate(size=Count("id"), component=Min("component"))
+        .order_by("community")[:limit]
+    )
+    return {
+        "entity_count": totals["entities"],
+        "component_count": (totals["components"] + 1) if totals["entities"] else 0,
+        "community_count": (totals["communities"] + 1) if totals["entities"] else 0,
+        "communities": list(rows),
+    }
+
+
+def community_members(domain, community, limit=100):
+    return list(
+        Entity.objects.filter(communities__scope=domain, communities__community=community)
+        .order_by("id")
+        .values("id", "name", "type", "domain")[:limit]
+    )
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+数据模式保存（save_data_mode）的差量写入
+
+与数据库中当前范围（某个领域，或 currentDomain == "all" 时的全部数据）比较，
+计算新增 / 修改 / 删除的实体（按 id）和关系（按 (source, target, type, domain)），
+在一个事务内只写入差量：bulk_create / bulk_update / 按主键批量删除。
+
+- 指定领域时，所有实体和关系写入该领域；ID 已被其它领域占用的实体计为 errors
+- 重复的实体ID / 关系键以第一次出现的为准，其余计为 errors
+- 关系端点必须是已存在（或本次保存）的实体，否则计为 errors
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .graph_cache import deferred_invalidation
+from .importer import DEFAULT_BATCH_SIZE, _chunked
+from .models import Entity, Relationship
+from .search_index import index_entities
+
+ENTITY_FIELDS = ("name", "type", "description", "domain")
+
+
+def new_diff_stats():
+    return {
+        "entities": {"added": 0, "changed": 0, "removed": 0, "unchanged": 0, "errors": 0},
+        "relationships": {"added": 0, "changed": 0, "removed": 0, "unchanged": 0, "errors": 0},
+    }
+
+
+class GraphDiff:
+    def __init__(self, current_domain="all", batch_size=None):
+        self.current_domain = current_domain
+        self.batch_size = max(1, int(batch_size or DEFAULT_BATCH_SIZE))
+        self.stats = new_diff_stats()
+
+    @property
+    def all_domains(self):
+        return self.current_domain == "all"
+
+    def _scope(self, model):
+        if self.all_domains:
+            return model.objects.all()
+        return model.objects.filter(domain=self.current_domain)
+
+    def _domain_of(self, item):
+        if self.all_domains:
+            return item.get("domain") or "default"
+        return self.current_domain
+
+    @transaction.atomic
+    def apply(self, nodes, links):
+        with deferred_invalidation():
+            self._apply_entities(nodes)
+            self._apply_relationships(links)
+        return self.stats
+
+    # -----------------------------
+    # Entities
+    # -----------------------------
+
+    def _apply_entities(self, nodes):
+        stats = self.stats["entities"]
+        existing = {
+            row["id"]: row
+            for row in self._scope(Entity).values("id", *ENTITY_FIELDS).order_by().iterator(self.batch_size)
+        }
+
+        desired = {}
+        for node in nodes:
+            if not isinstance(node, dict) or not node.get("id") or str(node["id"]) in desired:
+                stats["errors"] += 1
+                continue
+            desired[str(node["id"])] = {
+                "name": node.get("name") or "",
+                "type": node.get("type") or "",
+                "description": node.get("description") or "",
+                "domain": self._domain_of(node),
+            }
+
+        added = [entity_id for entity_id in desired if entity_id not in existing]
+        if not self.all_domains:
+            # 不在当前领域范围内、但ID已存在的实体属于其它领域
+            taken = set()
+            for chunk in _chunked(added, self.batch_size):
+                taken.update(Entity.objects.filter(id__in=chunk).values_list("id", flat=True))
+            stats["errors"] += len(taken)
+            added = [entity_id for entity_id in added if entity_id not in taken]
+
+        changed = []
+        now = timezone.now()
+        for entity_id, values in desired.items():
+            row = existing.get(entity_id)
+            if row is None:
+                continue
+            if any(row[field] != values[field] for field in ENTITY_FIELDS):
+                changed.append(Entity(id=entity_id, updated_at=now, **values))
+            else:
+                stats["unchanged"] += 1
+        removed = [entity_id for entity_id in existing if entity_id not in desired]
+
+        # 删除实体会级联删除其关系
+        for chunk in _chunked(removed, self.batch_size):
+            Entity.objects.filter(id__in=chunk).delete()
+        created = Entity.objects.bulk_create(
+            [Entity(id=entity_id, **desired[entity_id]) for entity_id in added], batch_size=self.batch_size
+        )
+        Entity.objects.bulk_update(changed, ENTITY_FIELDS + ("updated_at",), batch_size=self.batch_size)
+        index_entities(created + changed)
+
+        stats["added"] += len(added)
+        stats["changed"] += len(changed)
+        stats["removed"] += len(removed)
+
+    # -----------------------------
+    # Relationships
+    # -----------------------------
+
+    def _apply_relationships(self, links):
+        stats = self.stats["relationships"]
+        existing = {
+            (row["source_id"], row["target_id"], row["type"], row["domain"]): (row["id"], row["description"])
+            for row in self._scope(Relationship)
+            .values("id", "source_id", "target_id", "type", "domain", "description")
+            .order_by()
+            .iterator(self.batch_size)
+        }
+
+        candidates = []
+        for link in links:
+            if not isinstance(link, dict):
+                stats["errors"] += 1
+                continue
+            source = link.get("source")
+            target = link.get("target")
+            rel_type = link.get("type")
+            if not source or not target or not rel_type or isinstance(source, (dict, list)) \
+                    or isinstance(target, (dict, list)):
+                stats["errors"] += 1
+                continue
+            candidates.append((str(source), str(target), rel_type, self._domain_of(link),
+                                link.get("description") or ""))
+
+        endpoints = {c[0] for c in candidates} | {c[1] for c in candidates}
+        known = set()
+        for chunk in _chunked(endpoints, self.batch_size):
+            known.update(Entity.objects.filter(id__in=chunk).values_list("id", flat=True))
+
+        desired = {}
+        for source, target, rel_type, domain, description in candidates:
+            key = (source, target, rel_type, domain)
+            if source not in known or target not in known or key in desired:
+                stats["errors"] += 1
+                continue
+            desired[key] = description
+
+        added = []
+        changed = []
+        for key, description in desired.items():
+            current = existing.get(key)
+            if current is None:
+                added.append(Relationship(
+                    source_id=key[0], target_id=key[1], type=key[2], domain=key[3], description=description
+                ))
+            elif current[1] != description:
+                changed.append(Relationship(id=current[0], description=description))
+            else:
+                stats["unchanged"] += 1
+        removed = [pk for key, (pk, _) in existing.items() if key not in desired]
+
+        for chunk in _chunked(removed, self.batch_size):
+            Relationship.objects.filter(id__in=chunk).delete()
+        Relationship.objects.bulk_create(added, batch_size=self.batch_size)
+        Relationship.objects.bulk_update(changed, ["description"], batch_size=self.batch_size)
+
+        stats["added"] += len(added)
+        stats["changed"] += len(changed)
+        stats["removed"] += len(removed)
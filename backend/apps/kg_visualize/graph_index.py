@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+内存邻接索引（CSR）与路径查询
+
+- 邻接索引：按领域从数据库读取一次关系，实体ID映射为 int32 下标，关系类型映射为整数编码，
+  以 CSR（offsets / neighbors 数组）存储无向邻接，另有按关系下标排列的 source/target/type/pk 数组（NumPy）；
+  按图谱版本号缓存，有写入后在下次访问时重建；路径查询和图分析共用同一份索引
+- 最短路径：双向 BFS，每次扩展较小的一侧前沿
+- 全部路径（不超过 k 跳）：先从终点做有界 BFS 得到到终点的距离，再从起点 DFS，只走仍可能在剩余步数内到达终点的邻居
+
+所有查询都有节点扩展预算（expansion budget），在稠密图上也有界。
+"""
+import time
+from array import array
+from collections import deque
+
+import numpy as np
+from django.conf import settings
+
+from .graph_cache import GraphSnapshotCache
+from .models import Relationship
+
+PATH_EXPANSION_BUDGET = getattr(settings, "KG_PATH_EXPANSION_BUDGET", 100000)
+
+
+class GraphIndex:
+    """
+    一个领域的 CSR 邻接索引
+
+    - ids[i] / index[id]：节点下标与实体ID互查（只包含至少有一条关系的实体）
+    - type_names[c] / type_codes[name]：关系类型编码
+    - edge_source / edge_target / edge_type / edge_pk：第 e 条关系的端点下标、类型编码、数据库主键
+    - offsets / neighbors / slot_edges：节点 i 的邻居为 neighbors[offsets[i]:offsets[i + 1]]，
+      对应的关系下标在 slot_edges 的同一区间（无向：每条关系在两端各出现一次）
+    """
+
+    def __init__(self, domain="all"):
+        self.domain = domain
+        self.ids = []
+        self.index = {}
+        self.type_names = []
+        self.type_codes = {}
+
+    @property
+    def node_count(self):
+        return len(self.ids)
+
+    @property
+    def edge_count(self):
+        return len(self.edge_pk)
+
+    def _intern(self, node_id):
+        i = self.index.get(node_id)
+        if i is None:
+            i = self.index[node_id] = len(self.ids)
+            self.ids.append(node_id)
+        return i
+
+    def build(self):
+        queryset = Relationship.objects.all()
+        if self.domain != "all":
+            queryset = queryset.filter(domain=self.domain)
+        sources, targets, types, pks = array("i"), array("i"), array("i"), array("q")
+        for pk, source, target, rel_type in queryset.order_by().values_list(
+            "id", "source_id", "target_id", "type"
+        ).iterator(chunk_size=5000):
+            code = self.type_codes.get(rel_type)
+            if code is None:
+                code = self.type_codes[rel_type] = len(self.type_names)
+                self.type_names.append(rel_type)
+            sources.append(self._intern(source))
+            targets.append(self._intern(target))
+            types.append(code)
+            pks.append(pk)
+        self._build_csr(sources, targets, types, pks)
+        return self
+
+    def _build_csr(self, sources, targets, types, pks):
+        n = self.node_count
+        self.edge_source = np.frombuffer(sources, dtype=np.int32).copy()
+        self.edge_target = np.frombuffer(targets, dtype=np.int32).copy()
+        self.edge_type = np.frombuffer(types, dtype=np.int32).copy()
+        self.edge_pk = np.frombuffer(pks, dtype=np.int64).copy()
+        m = len(self.edge_pk)
+        heads = np.concatenate([self.edge_source, self.edge_target])
+        tails = np.concatenate([self.edge_target, self.edge_source])
+        slots = np.concatenate([np.arange(m, dtype=np.int32), np.arange(m, dtype=np.int32)])
+        order = np.argsort(heads, kind="stable")
+        self.neighbors = tails[order]
+        self.slot_edges = slots[order]
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=n), out=self.offsets[1:])
+
+    def __contains__(self, node_id):
+        return node_id in self.index
+
+    def codes_for(self, types):
+        """关系类型名称 -> 编码集合；None 表示不过滤（未知类型得到空集合）"""
+        if not types:
+            return None
+        return {self.type_codes[t] for t in types if t in self.type_codes}
+
+    def degree(self, i):
+        return int(self.offsets[i + 1] - self.offsets[i])
+
+    def adjacent(self, i, codes=None):
+        """节点下标 i 的 (邻居下标, 关系下标) 列表"""
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        neighbors = self.neighbors[start:end].tolist()
+        slots = self.slot_edges[start:end].tolist()
+        if codes is None:
+            return list(zip(neighbors, slots))
+        edge_type = self.edge_type
+        return [(j, e) for j, e in zip(neighbors, slots) if edge_type[e] in codes]
+
+    def memory_bytes(self):
+        """数组部分占用的字节数（不含ID字符串本身）"""
+        arrays = (self.edge_source, self.edge_target, self.edge_type, self.edge_pk,
+                  self.offsets, self.neighbors, self.slot_edges)
+        return sum(a.nbytes for a in arrays)
+
+
+graph_index_cache = GraphSnapshotCache(
+    max_entries=getattr(settings, "KG_GRAPH_INDEX_CACHE_MAX_ENTRIES", 4),
+    ttl=0,
+)
+
+
+def get_graph_index(domain="all"):
+    """当前图谱版本的 CSR 索引（调用方应先读取修订号，以同步其它进程的写入）"""
+    return graph_index_cache.get_or_build(domain, lambda: GraphIndex(domain).build())
+
+
+class PathSearch:
+    """
+    在邻接索引上查找路径；结果中的 expanded 为已扩展的节点数，
+    budget_exhausted 为 True 表示因预算耗尽而提前停止（未找到不代表不存在）
+    """
+
+    def __init__(self, index, types=None, budget=None):
+        self.index = index
+        self.codes = index.codes_for(types)
+        self.budget = budget or PATH_EXPANSION_BUDGET
+        self.expanded = 0
+        self.budget_exhausted = False
+
+    def _expand(self, i):
+        if self.expanded >= self.budget:
+            self.budget_exhausted = True
+            return None
+        self.expanded += 1
+        return self.index.adjacent(i, self.codes)
+
+    def _resolve(self, nodes, edges):
+        """节点下标/关系下标 -> (实体ID列表, 关系主键列表)"""
+        return [self.index.ids[i] for i in nodes], [int(self.index.edge_pk[e]) for e in edges]
+
+    def shortest_path(self, source, target, max_depth):
+        """双向 BFS，返回 (实体ID列表, 关系主键列表)；不可达或超出 max_depth 时返回 None"""
+        if source == target:
+            return [source], []
+        if source not in self.index or target not in self.index:
+            return None
+        source, target = self.index.index[source], self.index.index[target]
+        # 节点 -> (父节点, 关系ID)
+        parents = [{source: None}, {target: None}]
+        frontiers = [[source], [target]]
+        depths = [0, 0]
+
+        while frontiers[0] and frontiers[1] and depths[0] + depths[1] < max_depth:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            seen, other = parents[side], parents[1 - side]
+            next_frontier = []
+            meeting = None
+            for node_id in frontiers[side]:
+                neighbors = self._expand(node_id)
+                if neighbors is None:
+                    return None
+                for neighbor, edge_id in neighbors:
+                    if neighbor in seen:
+                        continue
+                    seen[neighbor] = (node_id, edge_id)
+                    if neighbor in other:
+                        meeting = neighbor
+                        break
+                    next_frontier.append(neighbor)
+                if meeting is not None:
+                    break
+            depths[side] += 1
+            if meeting is not None:
+                return self._resolve(*self._join(parents, meeting))
+            frontiers[side] = next_frontier
+        return None
+
+    def _join(self, parents, meeting):
+        nodes, edges = [meeting], []
+        node_id = meeting
+        while parents[0][node_id] is not None:
+            node_id, edge_id = parents[0][node_id]
+            nodes.insert(0, node_id)
+            edges.insert(0, edge_id)
+        node_id = meeting
+        while parents[1][node_id] is not None:
+            node_id, edge_id = parents[1][node_id]
+            nodes.append(node_id)
+            edges.append(edge_id)
+        return nodes, edges
+
+    def all_paths(self, source, target, max_depth, max_paths=10):
+        """不超过 max_depth 跳的简单路径（最多 max_paths 条），按发现顺序返回 [(实体ID列表, 关系主键列表)]"""
+        if source not in self.index or target not in self.index:
+            return []
+        source, target = self.index.index[source], self.index.index[target]
+        # 反向有界 BFS：到终点的距离
+        distance = {target: 0}
+        queue = deque([target])
+        while queue:
+            node_id = queue.popleft()
+            if distance[node_id] >= max_depth:
+                continue
+            neighbors = self._expand(node_id)
+            if neighbors is None:
+                break
+            for neighbor, _ in neighbors:
+                if neighbor not in distance:
+                    distance[neighbor] = distance[node_id] + 1
+                    queue.append(neighbor)
+        if source not in distance:
+            return []
+
+        paths = []
+        nodes, edges, on_path = [source], [], {source}
+
+        def walk(node_id, remaining):
+            if len(paths) >= max_paths:
+                return
+            if node_id == target:
+                paths.append(self._resolve(nodes, edges))
+                return
+            neighbors = self._expand(node_id)
+            if neighbors is None:
+                return
+            for neighbor, edge_id in neighbors:
+                if neighbor in on_path or distance.get(neighbor, max_depth + 1) > remaining - 1:
+                    continue
+                nodes.append(neighbor)
+                edges.append(edge_id)
+                on_path.add(neighbor)
+                walk(neighbor, remaining - 1)
+                on_path.discard(neighbor)
+                nodes.pop()
+                edges.pop()
+                if len(paths) >= max_paths or self.budget_exhausted:
+                    return
+
+        walk(source, max_depth)
+        return paths
+
+
+def timed(func, *args, **kwargs):
+    """返回 (结果, 耗时毫秒)"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, round((time.perf_counter() - started) * 1000, 3)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+分层细节（LOD）视图：GET /api/kg/data?lod=n&group_by=community|type|domain&expand=<cluster>
+
+把一个领域的实体按社区（见 graph_communities.py）、实体类型或领域分组，返回至多 n 个超级节点：
+- 规模最大的 n - 1 组各为一个超级节点，其余的组合并为一个 "其它" 节点（OTHER_CLUSTER）
+- 超级节点之间的关系聚合为带权重（关系条数）的元关系，组内关系计入 internal_edges
+- expand 展开其中一组：该组的实体（按度数取前 EXPAND_MAX_NODES 个）以原始节点返回，
+  组内关系原样返回，组员与其它超级节点之间的关系按 (组员, 超级节点) 聚合
+
+实体的分组编码按 (领域, 分组方式, 派生修订号, 图谱版本) 缓存，派生修订号与 ETag 中的相同；
+按社区分组时使用已保存的社区标签，没有保存过时由调用方返回错误。
+聚合在 graph_index 的 CSR 索引上向量化计算，客户端不会收到原始的全量图谱。
+"""
+import numpy as np
+from django.conf import settings
+
+from .graph_cache import GraphSnapshotCache
+from .graph_communities import community_labels
+from .importer import _chunked
+from .models import Entity
+
+GROUP_BY = ("community", "type", "domain")
+OTHER_CLUSTER = "__other__"
+MAX_CLUSTERS = getattr(settings, "KG_LOD_MAX_CLUSTERS", 500)
+EXPAND_MAX_NODES = getattr(settings, "KG_LOD_EXPAND_MAX_NODES", 2000)
+
+NODE_FIELDS = ("id", "name", "type", "description", "domain")
+
+lod_cache = GraphSnapshotCache(
+    max_entries=getattr(settings, "KG_LOD_CACHE_MAX_ENTRIES", 16),
+    ttl=0,
+)
+
+
+class ClusterAssignment:
+    """
+    一个范围内所有实体的分组
+
+    - ids：实体ID；前 index.node_count 个与 CSR 索引的节点下标一致，其后为没有关系的实体
+    - keys[c] / codes[i]：分组名称与第 i 个实体的分组编码
+    - degree[i]：无向度数（没有关系的实体为 0）
+    """
+
+    def __init__(self, index, group_by):
+        self.index = index
+        self.group_by = group_by
+
+    def build(self):
+        index = self.index
+        values = self._group_values()
+        self.ids = list(index.ids) + [entity_id for entity_id in values if entity_id not in index.index]
+        codes = {}
+        self.keys = []
+        self.codes = np.empty(len(self.ids), dtype=np.int64)
+        for i, entity_id in enumerate(self.ids):
+            key = values.get(entity_id, "")
+            code = codes.get(key)
+            if code is None:
+                code = codes[key] = len(self.keys)
+                self.keys.append(key)
+            self.codes[i] = code
+        self.key_codes = codes
+        self.degree = np.zeros(len(self.ids), dtype=np.int64)
+        self.degree[:index.node_count] = np.diff(np.asarray(index.offsets))
+        return self
+
+    def _group_values(self):
+        """实体ID -> 分组名称（范围内的实体，以及索引中属于其它领域的关系端点）"""
+        domain = self.index.domain
+        if self.group_by == "community":
+            return {entity_id: str(labels[1]) for entity_id, labels in community_labels(domain).items()}
+        queryset = Entity.objects.all() if domain == "all" else Entity.objects.filter(domain=domain)
+        values = dict(queryset.order_by().values_list("id", self.group_by).iterator(chunk_size=5000))
+        missing = [entity_id for entity_id in self.index.ids if entity_id not in values]
+        for chunk in _chunked(missing, 5000):
+            values.update(Entity.objects.filter(id__in=chunk).values_list("id", self.group_by))
+        return values
+
+
+def get_cluster_assignment(index, group_by, derived_revision=None):
+    """
+    当前图谱版本的分组；derived_revision 为请求读取到的派生修订号（社区标签保存后推进），
+    group_by 为 community 时分组随之更新
+    """
+    key = (index.domain, group_by, derived_revision if group_by == "community" else None)
+    return lod_cache.get_or_build(key, lambda: ClusterAssignment(index, group_by).build())
+
+
+def _cluster_node_id(key):
+    return f"cluster:{key}"
+
+
+def _entity_rows(ids):
+    rows = {}
+    for chunk in _chunked(ids, 5000):
+        rows.update((row["id"], row) for row in Entity.objects.filter(id__in=chunk).values(*NODE_FIELDS))
+    return rows
+
+
+def cluster_view(assignment, max_clusters, expand=None):
+    """
+    返回 {"nodes", "links", "lod"}；expand 不是已知的分组时返回 None
+    """
+    index = assignment.index
+    codes = assignment.codes
+    expand_code = None
+    if expand is not None:
+        expand_code = assignment.key_codes.get(expand)
+        if expand_code is None:
+            return None
+
+    # 参与聚合的实体（展开的组单独处理）
+    grouped = codes != expand_code if expand_code is not None else np.ones(len(codes), dtype=bool)
+    sizes = np.bincount(codes[grouped], minlength=len(assignment.keys))
+    order = [c for c in np.argsort(-sizes, kind="stable").tolist() if sizes[c]]
+    kept = order if len(order) <= max_clusters else order[:max_clusters - 1]
+    has_other = len(kept) < len(order)
+
+    # 分组编码 -> 超级节点下标；"其它" 排在最后，展开的组为 -1
+    slot_of = np.full(len(assignment.keys), len(kept), dtype=np.int64)
+    slot_of[kept] = np.arange(len(kept))
+    slot_keys = [assignment.keys[c] for c in kept] + ([OTHER_CLUSTER] if has_other else [])
+    slots = len(slot_keys)
+    node_slot = slot_of[codes]
+
+    members = np.zeros(0, dtype=np.int64)
+    truncated = False
+    if expand_code is not None:
+        node_slot[codes == expand_code] = -1
+        members = np.flatnonzero(codes == expand_code)
+        if len(members) > EXPAND_MAX_NODES:
+            truncated = True
+            members = members[np.argsort(-assignment.degree[members], kind="stable")[:EXPAND_MAX_NODES]]
+    # 展开后显示的组员下标 -> 在 members 中的位置
+    member_pos = np.full(len(codes), -1, dtype=np.int64)
+    member_pos[members] = np.arange(len(members))
+
+    sources = np.asarray(index.edge_source, dtype=np.int64)
+    targets = np.asarray(index.edge_target, dtype=np.int64)
+    slot_s, slot_t = node_slot[sources], node_slot[targets]
+
+    # 超级节点之间（无向，按较小下标在前合并）与组内的关系
+    both = (slot_s >= 0) & (slot_t >= 0)
+    internal = np.bincount(slot_s[both & (slot_s == slot_t)], minlength=slots)
+    cross = both & (slot_s != slot_t)
+    low = np.minimum(slot_s[cross], slot_t[cross])
+    high = np.maximum(slot_s[cross], slot_t[cross])
+    pairs, weights = np.unique(low * slots + high, return_counts=True)
+
+    sizes_by_slot = np.bincount(node_slot[node_slot >= 0], minlength=slots)
+    representative = _representatives(assignment, node_slot, slots)
+    names = _entity_rows([assignment.ids[i] for i in representative if i >= 0] +
+                         [assignment.ids[i] for i in members.tolist()])
+
+    nodes = []
+    for slot, key in enumerate(slot_keys):
+        rep_id = assignment.ids[representative[slot]] if representative[slot] >= 0 else None
+        rep_name = names.get(rep_id, {}).get("name") if rep_id else None
+        if key == OTHER_CLUSTER:
+            name = "其它"
+        elif assignment.group_by == "community":
+            name = rep_name or key
+        else:
+            name = key or "未分类"
+        nodes.append({
+            "id": _cluster_node_id(key),
+            "name": name,
+            "type": "cluster",
+            "cluster": key,
+            "size": int(sizes_by_slot[slot]),
+            "internal_edges": int(internal[slot]),
+            "representative": rep_id,
+        })
+    links = [
+        {
+            "source": _cluster_node_id(slot_keys[pair // slots]),
+            "target": _cluster_node_id(slot_keys[pair % slots]),
+            "type": "aggregate",
+            "weight": weight,
+        }
+        for pair, weight in zip(pairs.tolist(), weights.tolist())
+    ]
+
+    if expand_code is not None:
+        nodes.extend(dict(names[assignment.ids[i]], cluster=expand) for i in members.tolist()
+                     if assignment.ids[i] in names)
+        links.extend(_member_links(assignment, member_pos, node_slot, slot_keys))
+
+    return {
+        "nodes": nodes,
+        "links": links,
+        "lod": {
+            "group_by": assignment.group_by,
+            "clusters": slots,
+            "max_clusters": max_clusters,
+            "entity_count": len(assignment.ids),
+            "edge_count": index.edge_count,
+            "expanded": expand,
+            "expanded_members": int((codes == expand_code).sum()) if expand_code is not None else 0,
+            "truncated": truncated,
+        },
+    }
+
+
+def _representatives(assignment, node_slot, slots):
+    """每个超级节点中度数最大的实体下标（没有成员时为 -1）"""
+    representative = np.full(slots, -1, dtype=np.int64)
+    candidates = np.flatnonzero(node_slot >= 0)
+    if not len(candidates):
+        return representative
+    # 按 (超级节点, 度数降序) 排序后取每组第一个
+    order = np.lexsort((-assignment.degree[candidates], node_slot[candidates]))
+    ranked = candidates[order]
+    ranked_slots = node_slot[ranked]
+    first = np.r_[True, ranked_slots[1:] != ranked_slots[:-1]]
+    representative[ranked_slots[first]] = ranked[first]
+    return representative
+
+
+def _member_links(assignment, member_pos, node_slot, slot_keys):
+    """展开的组内关系原样返回；组员与超级节点之间的关系按 (组员, 超级节点) 聚合"""
+    index = assignment.index
+    sources = np.asarray(index.edge_source, dtype=np.int64)
+    targets = np.asarray(index.edge_target, dtype=np.int64)
+    pos_s, pos_t = member_pos[sources], member_pos[targets]
+    links = []
+
+    inner = np.flatnonzero((pos_s >= 0) & (pos_t >= 0))
+    for e in inner.tolist():
+        links.append({
+            "id": int(index.edge_pk[e]),
+            "source": assignment.ids[sources[e]],
+            "target": assignment.ids[targets[e]],
+            "type": index.type_names[int(index.edge_type[e])],
+        })
+
+    # 一端为显示的组员、另一端属于某个超级节点
+    outward_s = (pos_s >= 0) & (node_slot[targets] >= 0)
+    outward_t = (pos_t >= 0) & (node_slot[sources] >= 0)
+    member = np.concatenate([sources[outward_s], targets[outward_t]])
+    slot = np.concatenate([node_slot[targets[outward_s]], node_slot[sources[outward_t]]])
+    slots = len(slot_keys)
+    pairs, weights = np.unique(member * slots + slot, return_counts=True)
+    for pair, weight in zip(pairs.tolist(), weights.tolist()):
+        links.append({
+            "source": assignment.ids[pair // slots],
+            "target": _cluster_node_id(slot_keys[pair % slots]),
+            "type": "aggregate",
+            "weight": weight,
+        })
+    return links
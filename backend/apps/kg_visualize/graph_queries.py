@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+图查询：k 跳邻域（ego graph）
+
+逐层扩展：每一跳用 source_id__in、target_id__in 两次查询取出与当前前沿相连的关系，
+并设有上限，探索枢纽节点时数据库耗时和返回体积都有界：
+- 每个前沿节点最多展开 fanout 条关系（按关系ID取前 fanout 条）：上限在数据库中按前沿节点分别生效
+  （ROW_NUMBER() OVER (PARTITION BY 前沿端点)），一个枢纽节点不会占满整跳的配额
+- 每跳最多展开 MAX_EDGES_PER_HOP 条关系
+- 结果最多 limit 个节点
+任一上限生效时返回 truncated=True。
+"""
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Entity, Relationship
+
+MAX_EDGES_PER_HOP = getattr(settings, "KG_NEIGHBORHOOD_MAX_EDGES_PER_HOP", 20000)
+
+NODE_FIELDS = ("id", "name", "type", "description", "domain")
+
+
+def _hop_edges(frontier, fanout, types=None, domain=None):
+    """
+    前沿节点各自的前 fanout 条关系，返回 ([(前沿端点, 关系), ...], 是否有节点超过 fanout)。
+    两端都在前沿时计在 source 上，来时经过的关系也计入；每个前沿节点多取一条用于判断是否截断
+    """
+    rows = {}
+    for anchor, queryset in (
+        ("source_id", Relationship.objects.filter(source_id__in=frontier)),
+        ("target_id", Relationship.objects.filter(target_id__in=frontier).exclude(source_id__in=frontier)),
+    ):
+        if types:
+            queryset = queryset.filter(type__in=types)
+        if domain:
+            queryset = queryset.filter(domain=domain)
+        queryset = queryset.annotate(
+            rank=Window(RowNumber(), partition_by=F(anchor), order_by=F("id").asc())
+        ).filter(rank__lte=fanout + 1)
+        for row in queryset.values("id", "source_id", "target_id", "type", "description"):
+            rows.setdefault(row[anchor], []).append(row)
+
+    edges = []
+    capped = False
+    for node_id in frontier:
+        candidates = sorted(rows.get(node_id, ()), key=lambda row: row["id"])
+        capped = capped or len(candidates) > fanout
+        edges.extend((node_id, row) for row in candidates[:fanout])
+    return edges, capped
+
+
+def neighborhood(entity_id, depth=1, limit=200, fanout=50, types=None, domain=None):
+    """
+    返回 {"nodes": [...], "links": [...], "truncated": bool}；节点带 depth（到中心实体的跳数）。
+    中心实体不存在时返回 None
+    """
+    if not Entity.objects.filter(id=entity_id).exists():
+        return None
+
+    depths = {entity_id: 0}
+    links = {}
+    truncated = False
+    frontier = [entity_id]
+
+    for hop in range(1, depth + 1):
+        if not frontier or len(depths) >= limit:
+            break
+        rows, capped = _hop_edges(frontier, fanout, types, domain)
+        truncated = truncated or capped
+        if len(rows) > MAX_EDGES_PER_HOP:
+            truncated = True
+            rows = rows[:MAX_EDGES_PER_HOP]
+
+        next_frontier = []
+        for anchor, row in rows:
+            if row["id"] in links:
+                continue
+            other = row["target_id"] if anchor == row["source_id"] else row["source_id"]
+            if other not in depths:
+                if len(depths) >= limit:
+                    truncated = True
+                    continue
+                depths[other] = hop
+                next_frontier.append(other)
+            links[row["id"]] = row
+        frontier = next_frontier
+
+    entities = {row["id"]: row for row in Entity.objects.filter(id__in=list(depths)).values(*NODE_FIELDS)}
+    nodes = [dict(entities[node_id], depth=d) for node_id, d in depths.items() if node_id in entities]
+    return {
+        "nodes": nodes,
+        "links": [
+            {
+                "id": row["id"],
+                "source": row["source_id"],
+                "target": row["target_id"],
+                "type": row["type"],
+                "description": row["description"],
+            }
+            for row in links.values()
+        ],
+        "truncated": truncated,
+    }
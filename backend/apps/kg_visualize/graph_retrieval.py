@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+外部AI（generate_ai_response）的检索式上下文
+
+不再把图谱的前 20 个实体、前 15 条关系和全部统计放进提示词，而是按问题检索：
+- BM25：文档为实体的名称（词频按 NAME_WEIGHT 加权）、ID 与描述，
+  词项与实体全文检索相同（search_index.py：NFKC 小写后的二字，名称另加单字），中文无需分词；
+  倒排列表按词项以 CSR 存储，打分对每个查询词项做一次向量化累加
+- 取得分最高的 TOP_K 个实体（选中的实体排在最前），再逐个展开其 1 跳邻居：
+  关系按邻居的得分排序，每个实体最多 NEIGHBORS_PER_ENTITY 条
+- 按上述顺序把实体行、关系行写入上下文，估算的 token 数达到 CONTEXT_TOKENS 时停止；
+  问题与任何实体都不相关时（如 "统计"）改用关系最多的实体
+- 领域、关系类型分布只列出最多的 STATS_TOP 项
+
+BM25 索引挂在本地助手索引（assistant_index.py）上，随其按 (领域, 图谱版本) 缓存，首次用到时构建。
+"""
+import numpy as np
+from django.conf import settings
+
+from .assistant_index import _endpoint
+from .search_index import ngrams, normalize, query_tokens
+
+K1 = 1.2
+B = 0.75
+NAME_WEIGHT = 3
+CONTEXT_TOKENS = getattr(settings, "KG_AI_CONTEXT_TOKENS", 600)
+TOP_K = getattr(settings, "KG_AI_RETRIEVAL_TOP_K", 10)
+NEIGHBORS_PER_ENTITY = getattr(settings, "KG_AI_NEIGHBORS_PER_ENTITY", 5)
+STATS_TOP = getattr(settings, "KG_AI_STATS_TOP", 10)
+
+
+def estimate_tokens(text):
+    """粗略估算：中日韩字符约 1 个 token，其它字符约 4 个一个 token"""
+    wide = sum(1 for char in text if char >= "⺀")
+    return wide + (len(text) - wide + 3) // 4
+
+
+class BM25Index:
+    """
+    一份 nodes 的 BM25 倒排索引
+
+    - terms[token]：词项编号；词项 t 的文档为 docs[offsets[t]:offsets[t + 1]]，词频在 tfs 的同一区间
+    - idf[t]、norm[d]：逆文档频率与文档长度归一化项 k1 * (1 - b + b * |d| / avgdl)
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def build(self):
+        self.terms = {}
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = np.zeros(len(self.nodes), dtype=np.float64)
+        for d, node in enumerate(self.nodes):
+            counts = {}
+            fields = (
+                (node.get('name'), True, NAME_WEIGHT),
+                (node.get('id'), True, 1),
+                (node.get('description'), False, 1),
+            )
+            for text, unigrams, weight in fields:
+                for gram in ngrams(normalize(text), unigrams):
+                    counts[gram] = counts.get(gram, 0) + weight
+            for gram, tf in counts.items():
+                term_ids.append(self.terms.setdefault(gram, len(self.terms)))
+                doc_ids.append(d)
+                tfs.append(tf)
+            lengths[d] = sum(counts.values())
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        self.docs = np.array(doc_ids, dtype=np.int64)[order]
+        self.tfs = np.array(tfs, dtype=np.float64)[order]
+        df = np.bincount(term_ids, minlength=len(self.terms))
+        self.offsets = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(df, out=self.offsets[1:])
+        n = len(self.nodes)
+        self.idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        avgdl = lengths.mean() if n and lengths.mean() else 1.0
+        self.norm = K1 * (1 - B + B * lengths / avgdl)
+        return self
+
+    def scores(self, question):
+        scores = np.zeros(len(self.nodes), dtype=np.float64)
+        for token in query_tokens(question):
+            t = self.terms.get(token)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs, tfs = self.docs[start:end], self.tfs[start:end]
+            scores[docs] += self.idf[t] * tfs * (K1 + 1) / (tfs + self.norm[docs])
+        return scores
+
+
+def bm25_index(assistant_index):
+    """本地助手索引上的 BM25 索引（首次用到时构建；并发构建时保留任意一份，结果相同）"""
+    bm25 = getattr(assistant_index, "bm25", None)
+    if bm25 is None:
+        bm25 = assistant_index.bm25 = BM25Index(assistant_index.nodes).build()
+    return bm25
+
+
+def _top(scores, k):
+    """得分最高的 k 个下标（只含得分 > 0 的；同分按下标）"""
+    hits = np.flatnonzero(scores > 0)
+    if len(hits) > k:
+        hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits.sort()
+    return hits[np.argsort(-scores[hits], kind="stable")].tolist()
+
+
+def _entity_line(node):
+    line = f"{node.get('name', '')} (ID: {node.get('id', '')})"
+    if node.get('description'):
+        line += f" - {node.get('description', '')[:80]}"
+    if node.get('domain') and node.get('domain') != 'default':
+        line += f" [领域: {node.get('domain')}]"
+    return line
+
+
+def relation_line(index, link):
+    line = f"{index.name_of(link.get('source'))} --[{link.get('type', '')}]--> {index.name_of(link.get('target'))}"
+    if link.get('description'):
+        line += f" ({link.get('description', '')[:30]})"
+    return line
+
+
+def distribution_lines(counts, unit):
+    """按数量降序列出最多的 STATS_TOP 项"""
+    ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    lines = [f"{name}: {count} {unit}" for name, count in ranked[:STATS_TOP]]
+    if len(ranked) > STATS_TOP:
+        lines.append(f"... 其余 {len(ranked) - STATS_TOP} 类共 {sum(c for _, c in ranked[STATS_TOP:])} {unit}")
+    return lines
+
+
+def retrieve_context(index, question, selected_node=None, budget=CONTEXT_TOKENS, top_k=TOP_K):
+    """
+    返回 (实体行, 关系行, 检索信息)；实体行与关系行合计不超过 budget 个估算 token
+    """
+    nodes = index.nodes
+    scores = bm25_index(index).scores(question) if nodes else np.zeros(0)
+    seeds = _top(scores, top_k)
+    fallback = not seeds
+    if fallback:
+        # 问题与实体无关：使用关系最多的实体
+        degree = np.array([len(index.adjacency.get(node.get('id'), ())) for node in nodes], dtype=np.float64)
+        seeds = _top(degree + 1, top_k)
+    selected = index.position.get(selected_node.get('id')) if selected_node else None
+    if selected is not None:
+        seeds = [selected] + [i for i in seeds if i != selected]
+
+    entity_lines, relation_lines = [], []
+    shown_entities, shown_links = set(), set()
+    used = 0
+
+    def add(lines, line):
+        nonlocal used
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            return False
+        lines.append(line)
+        used += cost
+        return True
+
+    def add_entity(i):
+        if i in shown_entities:
+            return True
+        if not add(entity_lines, _entity_line(nodes[i])):
+            return False
+        shown_entities.add(i)
+        return True
+
+    # 先列出检索到的实体，再按实体顺序展开其 1 跳邻居
+    full = not all(add_entity(i) for i in seeds)
+    for i in seeds:
+        if full or i not in shown_entities:
+            break
+        entity_id = nodes[i].get('id')
+        neighbors = []
+        for e in index.adjacency.get(entity_id, ()):
+            if e in shown_links:
+                continue
+            link = index.links[e]
+            other = _endpoint(link.get('target'))
+            if other == entity_id:
+                other = _endpoint(link.get('source'))
+            j = index.position.get(other)
+            neighbors.append((-(scores[j] if j is not None else 0.0), e, j))
+        # 与问题更相关的邻居优先；同分按关系顺序
+        neighbors.sort(key=lambda item: (item[0], item[1]))
+        for _, e, j in neighbors[:NEIGHBORS_PER_ENTITY]:
+            if not add(relation_lines, relation_line(index, index.links[e])):
+                full = True
+                break
+            shown_links.add(e)
+            if j is not None and not add_entity(j):
+                full = True
+                break
+
+    return entity_lines, relation_lines, {
+        "seeds": len(seeds),
+        "entities": len(entity_lines),
+        "relations": len(relation_lines),
+        "tokens": used,
+        "truncated": full,
+        "fallback": fallback,
+    }
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+图谱统计（GET /api/kg/stats）
+
+全部在数据库端聚合，每项一次 GROUP BY 查询，不把实体/关系读入内存：
+- 按领域的实体数、关系数；按实体类型、关系类型的计数
+- 度数分布：先把关系两端展开（UNION ALL）按实体分组得到度数，再按度数分组得到直方图，
+  百分位数由直方图累加得到；没有任何关系的实体计为度数 0。指定领域时端点与实体表关联，只统计该领域的实体
+
+结果按 (领域, 图谱版本) 缓存，图谱未变更时直接返回缓存。
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+
+from .graph_cache import GraphSnapshotCache
+from .models import Entity, Relationship
+
+PERCENTILES = (50, 90, 99)
+
+stats_cache = GraphSnapshotCache(
+    max_entries=getattr(settings, "KG_STATS_CACHE_MAX_ENTRIES", 16),
+    ttl=0,
+)
+
+
+def _scope(model, domain):
+    return model.objects.all() if domain == "all" else model.objects.filter(domain=domain)
+
+
+def _counts(queryset, field):
+    return {
+        row[field]: row["count"]
+        for row in queryset.order_by().values(field).annotate(count=Count("pk")).order_by("-count", field)
+    }
+
+
+def degree_histogram(domain="all"):
+    """
+    {度数: 实体数}（只含度数 >= 1 的实体）；指定领域时只统计该领域的关系中属于该领域的端点，
+    跨领域关系的另一端不计入，与 entity_count 的范围一致
+    """
+    table = Relationship._meta.db_table
+    if domain == "all":
+        endpoints = f"SELECT source_id AS node FROM {table} UNION ALL SELECT target_id AS node FROM {table}"
+        params = []
+    else:
+        entity_table = Entity._meta.db_table
+        endpoints = " UNION ALL ".join(
+            f"SELECT r.{column} AS node FROM {table} r JOIN {entity_table} e ON e.id = r.{column}"
+            " WHERE r.domain = %s AND e.domain = %s"
+            for column in ("source_id", "target_id")
+        )
+        params = [domain] * 4
+    sql = (
+        "SELECT degree, COUNT(*) FROM ("
+        f" SELECT node, COUNT(*) AS degree FROM ({endpoints}) endpoints GROUP BY node"
+        ") degrees GROUP BY degree ORDER BY degree"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return dict(cursor.fetchall())
+
+
+def _degree_summary(histogram, entity_count):
+    connected = sum(histogram.values())
+    isolated = max(entity_count - connected, 0)
+    total = connected + isolated
+    degrees = ([(0, isolated)] if isolated else []) + sorted(histogram.items())
+    summary = {
+        "isolated": isolated,
+        "max": degrees[-1][0] if degrees else 0,
+        "mean": round(sum(d * c for d, c in degrees) / total, 4) if total else 0.0,
+    }
+    # 百分位数：累计实体数首次达到 p% 时的度数
+    for p in PERCENTILES:
+        cumulative = 0
+        summary[f"p{p}"] = 0
+        for degree, count in degrees:
+            cumulative += count
+            if cumulative >= total * p / 100:
+                summary[f"p{p}"] = degree
+                break
+
+    # 按 2 的幂分桶：0, 1, 2, 3-4, 5-8, ...
+    buckets = {}
+    for degree, count in degrees:
+        upper = 1 << (degree - 1).bit_length() if degree else 0
+        label = str(degree) if upper <= 2 else f"{upper // 2 + 1}-{upper}"
+        buckets[label] = buckets.get(label, 0) + count
+    summary["histogram"] = buckets
+    return summary
+
+
+def compute_stats(domain="all"):
+    entities = _scope(Entity, domain)
+    relationships = _scope(Relationship, domain)
+    entities_by_domain = _counts(entities, "domain")
+    relationships_by_domain = _counts(relationships, "domain")
+    entity_count = sum(entities_by_domain.values())
+    return {
+        "domain": domain,
+        "entity_count": entity_count,
+        "relationship_count": sum(relationships_by_domain.values()),
+        "domains": [
+            {
+                "domain": name,
+                "entities": entities_by_domain.get(name, 0),
+                "relationships": relationships_by_domain.get(name, 0),
+            }
+            for name in sorted(set(entities_by_domain) | set(relationships_by_domain))
+        ],
+        "entity_types": _counts(entities, "type"),
+        "relation_types": _counts(relationships, "type"),
+        "degree": _degree_summary(degree_histogram(domain), entity_count),
+    }
+
+
+def get_stats(domain="all"):
+    """当前图谱版本的统计（调用方应先读取修订号，以同步其它进程的写入）"""
+    return stats_cache.get_or_build(domain, lambda: compute_stats(domain))
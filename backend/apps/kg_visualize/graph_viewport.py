@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+视口查询：GET /api/kg/data?bbox=x0,y0,x1,y1&zoom=z
+
+在预计算的布局坐标（见 graph_layout.py）上建立均匀网格空间索引：
+节点按所在网格排序，网格 c 的节点为 order[starts[c]:starts[c + 1]]（与 CSR 邻接索引同样的布局），
+查询时只检查与矩形相交的网格。网格边长按平均每格 CELL_TARGET 个节点选取。
+索引按 (领域, 派生修订号, 图谱版本) 缓存，布局或图谱变化后重建。
+
+- zoom：屏幕上一个像素对应 1 / zoom 个布局单位；矩形内按 DECLUTTER_PIXELS 像素见方的屏幕格去重，
+  每格只保留度数最大的节点，缩小时不会返回在屏幕上重叠的节点
+- 结果最多 limit 个节点（按度数优先），另返回与这些节点相连的关系（最多 MAX_LINKS 条）；
+  关系另一端在矩形外时，该端点以 outside=True 的节点返回，便于前端画出连线；
+  另一端在矩形内但被去重或截断时不返回该关系
+- 没有布局坐标的实体不会出现在视口查询结果中
+"""
+import numpy as np
+from django.conf import settings
+
+from .graph_cache import GraphSnapshotCache
+from .graph_layout import stored_layout
+from .importer import _chunked
+from .models import Entity
+
+CELL_TARGET = 16
+DECLUTTER_PIXELS = getattr(settings, "KG_VIEWPORT_DECLUTTER_PIXELS", 8)
+MAX_NODES = getattr(settings, "KG_VIEWPORT_MAX_NODES", 5000)
+MAX_LINKS = getattr(settings, "KG_VIEWPORT_MAX_LINKS", 20000)
+
+NODE_FIELDS = ("id", "name", "type", "description", "domain")
+
+viewport_cache = GraphSnapshotCache(
+    max_entries=getattr(settings, "KG_VIEWPORT_CACHE_MAX_ENTRIES", 8),
+    ttl=0,
+)
+
+
+class SpatialGrid:
+    """
+    一个范围的布局坐标网格索引
+
+    - ids / xs / ys：有坐标的实体及其坐标
+    - slots[i]：第 i 个实体在 CSR 邻接索引中的下标（没有关系的实体为 -1），degree[i] 为其度数
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def build(self):
+        coordinates, _ = stored_layout(self.index.domain)
+        self.ids = list(coordinates)
+        points = np.array(list(coordinates.values()), dtype=np.float64).reshape(len(self.ids), 2)
+        self.xs, self.ys = points[:, 0], points[:, 1]
+        self.slots = np.array([self.index.index.get(entity_id, -1) for entity_id in self.ids], dtype=np.int64)
+        offsets = np.asarray(self.index.offsets)
+        self.degree = np.where(self.slots >= 0, offsets[self.slots + 1] - offsets[self.slots], 0)
+
+        n = len(self.ids)
+        self.origin = points.min(axis=0) if n else np.zeros(2)
+        span = np.maximum(points.max(axis=0) - self.origin, 1.0) if n else np.ones(2)
+        # 每边的格数，使平均每格约 CELL_TARGET 个节点
+        side = max(1, int(np.sqrt(n / CELL_TARGET)))
+        self.cell = span / side * (1 + 1e-9)
+        self.columns = side
+        cells = self._cell_of(self.xs, self.ys)
+        self.order = np.argsort(cells, kind="stable")
+        self.starts = np.zeros(side * side + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=side * side), out=self.starts[1:])
+        # CSR 节点下标 -> 坐标数组下标（没有布局坐标的为 -1）
+        self.position = np.full(self.index.node_count, -1, dtype=np.int64)
+        placed = self.slots >= 0
+        self.position[self.slots[placed]] = np.flatnonzero(placed)
+        return self
+
+    def _cell_coords(self, xs, ys):
+        cx = np.clip(((xs - self.origin[0]) // self.cell[0]).astype(np.int64), 0, self.columns - 1)
+        cy = np.clip(((ys - self.origin[1]) // self.cell[1]).astype(np.int64), 0, self.columns - 1)
+        return cx, cy
+
+    def _cell_of(self, xs, ys):
+        cx, cy = self._cell_coords(xs, ys)
+        return cx * self.columns + cy
+
+    def query(self, x0, y0, x1, y1):
+        """矩形内（含边界）的节点下标"""
+        if not self.ids:
+            return np.zeros(0, dtype=np.int64)
+        (cx0, cx1), (cy0, cy1) = self._cell_coords(np.array([x0, x1]), np.array([y0, y1]))
+        rows = np.arange(cx0, cx1 + 1) * self.columns
+        first, last = rows + cy0, rows + cy1 + 1
+        starts, ends = self.starts[first], self.starts[last]
+        counts = ends - starts
+        if not counts.sum():
+            return np.zeros(0, dtype=np.int64)
+        # 每一列网格在 order 中是连续的一段
+        shifts = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+        candidates = self.order[np.arange(int(counts.sum())) + shifts]
+        xs, ys = self.xs[candidates], self.ys[candidates]
+        return candidates[(xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)]
+
+
+def get_spatial_grid(index, derived_revision):
+    return viewport_cache.get_or_build(
+        (index.domain, derived_revision), lambda: SpatialGrid(index).build()
+    )
+
+
+def _declutter(grid, hits, zoom):
+    """每个 DECLUTTER_PIXELS 见方的屏幕格只保留度数最大的节点"""
+    size = DECLUTTER_PIXELS / zoom
+    cx = np.floor(grid.xs[hits] / size).astype(np.int64)
+    cy = np.floor(grid.ys[hits] / size).astype(np.int64)
+    order = np.lexsort((-grid.degree[hits], cy, cx))
+    ranked = hits[order]
+    keys = np.stack([cx[order], cy[order]], axis=1)
+    first = np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)]
+    return ranked[first]
+
+
+def viewport(grid, bbox, zoom=None, limit=MAX_NODES):
+    """返回 {"nodes", "links", "viewport"}"""
+    x0, y0, x1, y1 = bbox
+    x0, x1 = min(x0, x1), max(x0, x1)
+    y0, y1 = min(y0, y1), max(y0, y1)
+    box = hits = grid.query(x0, y0, x1, y1)
+    if zoom:
+        hits = _declutter(grid, hits, zoom)
+    truncated = len(hits) > limit
+    if truncated:
+        hits = hits[np.argsort(-grid.degree[hits], kind="stable")[:limit]]
+
+    index = grid.index
+    slots = grid.slots[hits]
+    slots = slots[slots >= 0]
+    offsets = np.asarray(index.offsets)
+    starts = offsets[slots]
+    counts = offsets[slots + 1] - starts
+    total = int(counts.sum())
+    shifts = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+    edges = np.unique(np.asarray(index.slot_edges)[np.arange(total) + shifts]) if total else np.zeros(0, np.int64)
+    if len(edges) > MAX_LINKS:
+        truncated = True
+        edges = edges[:MAX_LINKS]
+
+    # 没有布局坐标的端点无法绘制；矩形内未返回的端点（被去重或截断）也不画
+    source_pos = grid.position[np.asarray(index.edge_source)[edges]]
+    target_pos = grid.position[np.asarray(index.edge_target)[edges]]
+    hidden = np.setdiff1d(box, hits)
+    drawable = (source_pos >= 0) & (target_pos >= 0) & ~np.isin(source_pos, hidden) & ~np.isin(target_pos, hidden)
+    edges, source_pos, target_pos = edges[drawable], source_pos[drawable], target_pos[drawable]
+    outside = set(np.setdiff1d(np.concatenate([source_pos, target_pos]), hits).tolist())
+    shown = hits.tolist() + sorted(outside)
+
+    rows = {}
+    for chunk in _chunked([grid.ids[i] for i in shown], 5000):
+        rows.update((row["id"], row) for row in Entity.objects.filter(id__in=chunk).values(*NODE_FIELDS))
+    nodes = []
+    for i in shown:
+        row = rows.get(grid.ids[i])
+        if row is not None:
+            nodes.append(dict(row, x=float(grid.xs[i]), y=float(grid.ys[i]), degree=int(grid.degree[i]),
+                              outside=i in outside))
+    links = [
+        {
+            "id": int(index.edge_pk[e]),
+            "source": grid.ids[s],
+            "target": grid.ids[t],
+            "type": index.type_names[int(index.edge_type[e])],
+        }
+        for e, s, t in zip(edges.tolist(), source_pos.tolist(), target_pos.tolist())
+    ]
+    return {
+        "nodes": nodes,
+        "links": links,
+        "viewport": {
+            "bbox": [x0, y0, x1, y1],
+            "zoom": zoom,
+            "in_box": len(box),
+            "returned": len(hits),
+            "truncated": truncated,
+        },
+    }
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""
+批量导入引擎
+
+按块处理节点和关系：每块一次 in_bulk 批量查询已有数据，在内存中完成冲突处理
+（auto_id / merge_data / skip），再用 bulk_create / bulk_update 批量写入。
+逐条导入时每个节点/关系需要若干次查询，这里每块只需常数次查询。
+
+调用方负责外层事务（transaction.atomic）以及写入后的 invalidate_graph()。
+
+两种语义：
+- scope_to_domain=False（import_graph 接口）：按ID全局查找，节点/关系可自带 domain
+- scope_to_domain=True（import_kg_data 命令）：只在目标领域内查找，所有数据写入目标领域；
+  其它领域已占用的ID记为错误
+track_mapping=False 时只在内存中保留被改写的ID（auto_id），关系端点通过数据库批量查询解析，
+内存占用与导入规模无关（流式导入使用）。
+"""
+import time
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Entity, Relationship
+from .search_index import index_entities
+
+DEFAULT_BATCH_SIZE = getattr(settings, "KG_IMPORT_BATCH_SIZE", 1000)
+
+# auto_id 冲突时一次预取的候选ID数量（{id}_1 ... {id}_N）
+AUTO_ID_PREFETCH = 8
+
+
+def new_import_stats():
+    return {
+        "entities": {"created": 0, "updated": 0, "skipped": 0, "conflicts": 0, "errors": 0},
+        "relationships": {"created": 0, "skipped": 0, "errors": 0},
+        "conflicts": []
+    }
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class GraphImporter:
+    """
+    导入节点和关系，统计结果写入 self.stats（与 import_graph 返回的 import_stats 格式一致），
+    原ID到实际ID的映射写入 self.entity_id_mapping
+    """
+
+    def __init__(self, domain="default", strategy="merge", conflict_resolution="auto_id", batch_size=None,
+                 scope_to_domain=False, track_mapping=True, progress=None):
+        self.domain = domain
+        self.strategy = strategy
+        self.conflict_resolution = conflict_resolution
+        self.batch_size = max(1, int(batch_size or DEFAULT_BATCH_SIZE))
+        self.scope_to_domain = scope_to_domain
+        self.track_mapping = track_mapping
+        # progress(kind, rows_done, elapsed_seconds)，每处理完一块调用一次
+        self.progress = progress
+        self.stats = new_import_stats()
+        self.entity_id_mapping = {}
+        self.processed = {"nodes": 0, "links": 0}
+        self._failed_ids = set()
+
+    def run(self, nodes, links):
+        self.import_nodes(nodes)
+        self.import_links(links)
+        return self.stats
+
+    # -----------------------------
+    # Entities
+    # -----------------------------
+
+    def import_nodes(self, nodes):
+        started = time.monotonic()
+        for chunk in _chunked(nodes, self.batch_size):
+            self._import_node_chunk(chunk)
+            self._report("nodes", len(chunk), started)
+
+    def _report(self, kind, rows, started):
+        self.processed[kind] += rows
+        if self.progress:
+            self.progress(kind, self.processed[kind], time.monotonic() - started)
+
+    def _map_id(self, node_id, actual_id):
+        if self.track_mapping or node_id != actual_id:
+            self.entity_id_mapping[node_id] = actual_id
+
+    def _import_node_chunk(self, chunk):
+        stats = self.stats["entities"]
+        valid = []
+        for node in chunk:
+            if not node.get("id") or not node.get("name"):
+                stats["errors"] += 1
+            else:
+                valid.append(node)
+        if not valid:
+            return
+
+        existing = Entity.objects.in_bulk([node["id"] for node in valid])
+        prefetched, taken_ids = self._prefetch_auto_id_candidates(valid, existing)
+
+        pending_new = {}      # id -> Entity，本块待创建
+        pending_update = {}   # id -> Entity，本块待更新（已存在于数据库）
+        origins = {}          # 实际ID -> 原ID
+
+        for node in valid:
+            node_id = node["id"]
+            existing_entity = pending_new.get(node_id) or existing.get(node_id)
+
+            if existing_entity is None:
+                pending_new[node_id] = self._build_entity(node_id, node)
+                origins[node_id] = node_id
+                self._map_id(node_id, node_id)
+                stats["created"] += 1
+                continue
+
+            if self.scope_to_domain and existing_entity.domain != self.domain:
+                # ID 已被其它领域占用，无法在目标领域创建
+                stats["errors"] += 1
+                continue
+
+            # 处理冲突
+            if self.conflict_resolution == "skip":
+                stats["skipped"] += 1
+                self._map_id(node_id, node_id)
+            elif self.conflict_resolution == "merge_data":
+                # 合并数据：保留现有数据，补充缺失字段
+                updated = False
+                if not existing_entity.type and node.get("type"):
+                    existing_entity.type = node.get("type")
+                    updated = True
+                if not existing_entity.description and node.get("description"):
+                    existing_entity.description = node.get("description")
+                    updated = True
+                if updated:
+                    if node_id not in pending_new:
+                        pending_update[node_id] = existing_entity
+                    stats["updated"] += 1
+                else:
+                    stats["skipped"] += 1
+                self._map_id(node_id, node_id)
+            elif self.conflict_resolution == "auto_id":
+                # 自动生成新ID
+                stats["conflicts"] += 1
+                self.stats["conflicts"].append({
+                    "type": "entity_id_conflict",
+                    "original_id": node_id,
+                    "message": f"Entity ID '{node_id}' already exists, will generate new ID"
+                })
+                new_id = self._next_free_id(node_id, node_id in prefetched, taken_ids, pending_new)
+                pending_new[new_id] = self._build_entity(new_id, node)
+                origins[new_id] = node_id
+                self._map_id(node_id, new_id)
+                stats["created"] += 1
+
+        self._flush_entities(list(pending_new.values()), list(pending_update.values()), origins)
+
+    def _build_entity(self, entity_id, node):
+        return Entity(
+            id=entity_id,
+            name=node["name"],
+            type=node.get("type", ""),
+            description=node.get("description", ""),
+            domain=self.domain if self.scope_to_domain else node.get("domain", self.domain)
+        )
+
+    def _prefetch_auto_id_candidates(self, nodes, existing):
+        """为可能冲突的ID一次性查询 {id}_1..{id}_N 的占用情况，返回 (已预取的ID, 已占用的候选ID)"""
+        if self.conflict_resolution != "auto_id":
+            return set(), set()
+        seen = set()
+        conflicting = set()
+        for node in nodes:
+            node_id = node["id"]
+            if node_id in existing or node_id in seen:
+                conflicting.add(node_id)
+            seen.add(node_id)
+        candidates = [f"{node_id}_{n}" for node_id in conflicting for n in range(1, AUTO_ID_PREFETCH + 1)]
+        if not candidates:
+            return conflicting, set()
+        return conflicting, set(Entity.objects.filter(id__in=candidates).values_list("id", flat=True))
+
+    def _next_free_id(self, node_id, prefetched, taken_ids, pending_new):
+        counter = 1
+        new_id = f"{node_id}_{counter}"
+        # 超出预取范围（或未预取）的候选ID回退到逐个查询
+        while new_id in taken_ids or new_id in pending_new or (
+            (not prefetched or counter > AUTO_ID_PREFETCH) and Entity.objects.filter(id=new_id).exists()
+        ):
+            counter += 1
+            new_id = f"{node_id}_{counter}"
+        return new_id
+
+    def _flush_entities(self, to_create, to_update, origins):
+        if to_create:
+            try:
+                with transaction.atomic():
+                    Entity.objects.bulk_create(to_create, batch_size=self.batch_size)
+                    index_entities(to_create)
+            except Exception:
+                # 批量写入失败时逐条写入，定位出错的行
+                for entity in to_create:
+                    self._create_entity_row(entity, origins[entity.id])
+        if to_update:
+            now = timezone.now()
+            for entity in to_update:
+                entity.updated_at = now
+            Entity.objects.bulk_update(to_update, ["type", "description", "updated_at"], batch_size=self.batch_size)
+            index_entities(to_update)
+
+    def _create_entity_row(self, entity, original_id):
+        stats = self.stats["entities"]
+        try:
+            with transaction.atomic():
+                entity.save(force_insert=True)
+        except Exception as e:
+            stats["created"] -= 1
+            if Entity.objects.filter(id=entity.id).exists():
+                # 可能是并发写入，视为已存在
+                stats["skipped"] += 1
+                return
+            if self.entity_id_mapping.get(original_id) == entity.id:
+                del self.entity_id_mapping[original_id]
+            if not self.track_mapping:
+                self._failed_ids.add(original_id)
+            stats["errors"] += 1
+            self.stats["conflicts"].append({
+                "type": "entity_creation_error",
+                "entity_id": original_id,
+                "message": str(e)
+            })
+
+    # -----------------------------
+    # Relationships
+    # -----------------------------
+
+    def import_links(self, links):
+        started = time.monotonic()
+        for chunk in _chunked(links, self.batch_size):
+            self._import_link_chunk(chunk)
+            self._report("links", len(chunk), started)
+
+    def _resolve_endpoints(self, ids):
+        """返回 {原ID: 实际ID}；未保留完整映射时，其余ID通过数据库批量确认是否存在"""
+        if self.track_mapping:
+            return self.entity_id_mapping
+        resolved = {i: self.entity_id_mapping[i] for i in ids if i in self.entity_id_mapping}
+        unknown = [i for i in ids if i not in resolved and i not in self._failed_ids]
+        if unknown:
+            queryset = Entity.objects.filter(id__in=unknown)
+            if self.scope_to_domain:
+                queryset = queryset.filter(domain=self.domain)
+            resolved.update((i, i) for i in queryset.values_list("id", flat=True))
+        return resolved
+
+    def _import_link_chunk(self, chunk):
+        stats = self.stats["relationships"]
+        valid = []
+        for link in chunk:
+            source = link.get("source")
+            target = link.get("target")
+            if not source or not target or not link.get("type") or source == target:
+                stats["errors"] += 1
+            elif isinstance(source, (dict, list)) or isinstance(target, (dict, list)):
+                stats["errors"] += 1
+            else:
+                valid.append(link)
+        if not valid:
+            return
+
+        mapping = self._resolve_endpoints({i for link in valid for i in (link["source"], link["target"])})
+        resolved = []
+        for link in valid:
+            source = link["source"]
+            target = link["target"]
+            rel_type = link["type"]
+            # 使用映射后的ID
+            mapped_source = mapping.get(source)
+            mapped_target = mapping.get(target)
+            if not mapped_source or not mapped_target:
+                stats["errors"] += 1
+                continue
+            resolved.append((link, (mapped_source, mapped_target, rel_type)))
+        if not resolved:
+            return
+
+        existing = self._existing_relationships([key for _, key in resolved])
+        pending_new = {}     # key -> Relationship，本块待创建
+        pending_update = {}  # id -> Relationship，本块待更新
+
+        for link, key in resolved:
+            description = link.get("description", "")
+            existing_rel = pending_new.get(key) or existing.get(key)
+            if existing_rel is None:
+                pending_new[key] = Relationship(
+                    source_id=key[0], target_id=key[1], type=key[2], description=description,
+                    domain=self.domain if self.scope_to_domain else link.get("domain", self.domain)
+                )
+                stats["created"] += 1
+            elif self.strategy == "skip":
+                stats["skipped"] += 1
+            elif self.strategy == "merge":
+                # 合并关系描述
+                if not existing_rel.description and description:
+                    existing_rel.description = description
+                    if existing_rel.pk is not None:
+                        pending_update[existing_rel.pk] = existing_rel
+                    stats["created"] += 1  # 算作更新
+                else:
+                    stats["skipped"] += 1
+
+        self._flush_relationships(list(pending_new.values()), list(pending_update.values()))
+
+    def _existing_relationships(self, keys):
+        """一次查询本块涉及的已有关系，返回 {(source, target, type): Relationship}"""
+        wanted = set(keys)
+        queryset = Relationship.objects.filter(
+            source_id__in={k[0] for k in wanted},
+            target_id__in={k[1] for k in wanted},
+            type__in={k[2] for k in wanted},
+        )
+        if self.scope_to_domain:
+            queryset = queryset.filter(domain=self.domain)
+        queryset = queryset.only("id", "source_id", "target_id", "type", "description").order_by("id")
+        existing = {}
+        for rel in queryset:
+            key = (rel.source_id, rel.target_id, rel.type)
+            if key in wanted:
+                existing.setdefault(key, rel)
+        return existing
+
+    def _flush_relationships(self, to_create, to_update):
+        if to_create:
+            try:
+                with transaction.atomic():
+                    Relationship.objects.bulk_create(to_create, batch_size=self.batch_size)
+            except Exception:
+                for rel in to_create:
+                    self._create_relationship_row(rel)
+        if to_update:
+            Relationship.objects.bulk_update(to_update, ["description"], batch_size=self.batch_size)
+
+    def _create_relationship_row(self, rel):
+        try:
+            with transaction.atomic():
+                rel.save(force_insert=True)
+        except Exception as e:
+            self.stats["relationships"]["created"] -= 1
+            self.stats["relationships"]["errors"] += 1
+            self.stats["conflicts"].append({
+                "type": "relationship_creation_error",
+                "source": rel.source_id,
+                "target": rel.target_id,
+                "message": str(e)
+            })
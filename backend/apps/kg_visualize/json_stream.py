@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+JSON 流式读写工具
+
+- 写：大图谱导出时逐块序列化，峰值内存只与块大小相关，与图谱规模无关
+- 读：增量解析 {"nodes": [...], "links": [...]} 文档中的某个数组，逐个产出元素，
+  不把整个文件读入内存（安装了 ijson 时可选用 ijson 后端）
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import ijson
+except ImportError:  # 可选依赖
+    ijson = None
+
+
+def iter_json_array(rows, chunk_size=1000):
+    """把行序列逐块编码为 JSON 数组文本（含方括号），每 chunk_size 行产出一段"""
+    yield "["
+    buf = []
+    first = True
+    for row in rows:
+        buf.append(json.dumps(row, cls=DjangoJSONEncoder))
+        if len(buf) >= chunk_size:
+            yield ("" if first else ",") + ",".join(buf)
+            first = False
+            buf = []
+    if buf:
+        yield ("" if first else ",") + ",".join(buf)
+    yield "]"
+
+
+def iter_json_object(fields):
+    """
+    按顺序输出 JSON 对象；fields 为 (key, value) 列表，
+    value 可以是普通值，也可以是产出 JSON 文本片段的迭代器（如 iter_json_array 的结果）
+    """
+    yield "{"
+    for i, (key, value) in enumerate(fields):
+        yield ("" if i == 0 else ", ") + json.dumps(key) + ": "
+        if isinstance(value, (str, int, float, bool, dict, list, type(None))):
+            yield json.dumps(value, cls=DjangoJSONEncoder)
+        else:
+            yield from value
+    yield "}"
+
+
+# -----------------------------
+# Incremental reader
+# -----------------------------
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = ",:]}" + _WHITESPACE
+
+
+class JsonStreamError(ValueError):
+    pass
+
+
+class _JsonArrayReader:
+    """
+    纯 Python 增量解析器：按块读取文件，逐个解析目标数组的元素，
+    其它键的值逐元素解析后丢弃，不会整体载入内存
+    """
+
+    def __init__(self, fp, read_size=1 << 20):
+        self.fp = fp
+        self.read_size = read_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, min_size=None):
+        chunk = self.fp.read(max(self.read_size, min_size or 0))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """跳过空白，返回下一个字符（文件结束返回空串）"""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        ch = self._peek()
+        if not ch or ch not in chars:
+            raise JsonStreamError(f"Expected one of {chars!r} at offset {self.pos}, got {ch!r}")
+        self.pos += 1
+        return ch
+
+    def _read_value(self):
+        """解析一个完整的 JSON 值；跨块时扩大读取量重试"""
+        self._peek()
+        min_size = self.read_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # 数字可能恰好被块边界截断（如 "12|.5"），需确认其后是分隔符
+                if self.eof or (end < len(self.buf) and self.buf[end] in _DELIMITERS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise JsonStreamError(str(e))
+            if not self._fill(min_size):
+                continue
+            min_size *= 2
+
+    def _skip_value(self):
+        """跳过一个值：数组/对象逐个元素解析后丢弃，内存只与单个元素大小相关"""
+        ch = self._peek()
+        if ch == "[":
+            self.pos += 1
+            if self._peek() == "]":
+                self.pos += 1
+                return
+            while True:
+                self._read_value()
+                if self._expect(",]") == "]":
+                    return
+        if ch == "{":
+            self.pos += 1
+            if self._peek() == "}":
+                self.pos += 1
+                return
+            while True:
+                self._read_value()
+                self._expect(":")
+                self._read_value()
+                if self._expect(",}") == "}":
+                    return
+        self._read_value()
+
+    def iter_items(self, key):
+        """产出顶层对象中 key 对应数组的元素；key 不存在或不是数组时抛出 JsonStreamError"""
+        self._expect("{")
+        if self._peek() == "}":
+            raise JsonStreamError(f"Key '{key}' not found")
+        while True:
+            self._peek()
+            name = self._read_value()
+            self._expect(":")
+            if name == key:
+                if self._peek() != "[":
+                    raise JsonStreamError(f"'{key}' must be an array")
+                self.pos += 1
+                if self._peek() == "]":
+                    self.pos += 1
+                    return
+                while True:
+                    yield self._read_value()
+                    if self._expect(",]") == "]":
+                        return
+            self._skip_value()
+            if self._expect(",}") == "}":
+                raise JsonStreamError(f"Key '{key}' not found")
+
+
+def iter_json_file_items(file_path, key, backend="auto"):
+    """
+    增量读取 JSON 文件顶层对象中 key 对应数组的元素
+
+    backend: auto（有 ijson 则用 ijson）/ python / ijson
+    """
+    if backend == "ijson" and ijson is None:
+        raise JsonStreamError("ijson is not installed")
+    if backend == "ijson" or (backend == "auto" and ijson is not None):
+        with open(file_path, "rb") as f:
+            yield from ijson.items(f, f"{key}.item", use_float=True)
+        return
+    with open(file_path, "r", encoding="utf-8") as f:
+        yield from _JsonArrayReader(f).iter_items(key)
@@ -0,0 +1,195 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from backend.apps.kg_visualize.models import Entity, Relationship
+import random
+import time
+
+BENCH_PREFIX = 'bench'
+ENTITY_TYPES = ['概念', '技术', '人物', '机构', '产品', '事件', '地点', '方法']
+RELATION_TYPES = ['包含', '属于', '基于', '应用', '相关', '依赖']
+
+
+class Command(BaseCommand):
+    help = ('Build a synthetic knowledge graph and print query plans / timings of the hot '
+            'domain-filtered queries (with --drop-indexes, also without the composite indexes). '
+            'Run it against a throwaway database, not one that is serving traffic')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--entities',
+            type=int,
+            default=200000,
+            help='Number of synthetic entities (default: 200000)'
+        )
+        parser.add_argument(
+            '--relationships-per-entity',
+            type=int,
+            default=4,
+            help='Outgoing relationships per entity (default: 4, i.e. 1M rows in total)'
+        )
+        parser.add_argument(
+            '--domains',
+            type=int,
+            default=10,
+            help='Number of synthetic domains (default: 10)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Executions per query when timing (default: 5)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk insert (default: 5000)'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the synthetic data instead of deleting it afterwards'
+        )
+        parser.add_argument(
+            '--drop-indexes',
+            action='store_true',
+            help=('Also time the queries after dropping the composite indexes. The indexes are '
+                  'dropped from the configured database (and the tables locked) while the second '
+                  'report runs, so only use this on a throwaway database')
+        )
+
+    def handle(self, *args, **options):
+        entities = options['entities']
+        per_entity = options['relationships_per_entity']
+        domains = options['domains']
+        if entities < domains or domains < 1:
+            raise CommandError("--entities must be at least --domains (>= 1)")
+        if per_entity >= entities // domains:
+            raise CommandError("--relationships-per-entity must be smaller than entities per domain")
+
+        if Entity.objects.filter(domain__startswith=BENCH_PREFIX).exists():
+            raise CommandError(f"Synthetic data already present (domains '{BENCH_PREFIX}*'); remove it first")
+
+        try:
+            started = time.monotonic()
+            self._generate(entities, per_entity, domains, options['batch_size'])
+            self.stdout.write(f"Generated {entities} entities and {entities * per_entity} relationships "
+                              f"in {time.monotonic() - started:.1f}s")
+            with connection.cursor() as cursor:
+                if connection.vendor in ('sqlite', 'postgresql'):
+                    cursor.execute('ANALYZE')
+
+            queries = self._queries(entities, domains)
+            self._report("WITH composite indexes", queries, options['repeat'])
+            if options['drop_indexes']:
+                self._report_without_indexes(queries, options['repeat'])
+        finally:
+            if not options['keep']:
+                self._cleanup()
+
+    def _generate(self, entities, per_entity, domains, batch_size):
+        rng = random.Random(42)
+        batch = []
+        with transaction.atomic():
+            for i in range(entities):
+                batch.append(Entity(
+                    id=f"{BENCH_PREFIX}-{i}",
+                    name=f"实体{i}",
+                    type=rng.choice(ENTITY_TYPES),
+                    domain=f"{BENCH_PREFIX}{i % domains}",
+                ))
+                if len(batch) >= batch_size:
+                    self._flush(Entity, batch)
+            self._flush(Entity, batch)
+
+            # 目标实体与源实体同一领域（i ≡ j mod domains），且同一源实体的目标互不相同
+            for i in range(entities):
+                for k in range(1, per_entity + 1):
+                    j = (i + k * domains) % entities
+                    batch.append(Relationship(
+                        source_id=f"{BENCH_PREFIX}-{i}",
+                        target_id=f"{BENCH_PREFIX}-{j}",
+                        type=rng.choice(RELATION_TYPES),
+                        domain=f"{BENCH_PREFIX}{i % domains}",
+                    ))
+                if len(batch) >= batch_size:
+                    self._flush(Relationship, batch)
+            self._flush(Relationship, batch)
+
+    def _flush(self, model, batch):
+        if batch:
+            model.objects.bulk_create(batch)
+            batch.clear()
+
+    def _queries(self, entities, domains):
+        """各接口的热点查询（与 views 中的写法一致）"""
+        domain = f"{BENCH_PREFIX}0"
+        entity_id = f"{BENCH_PREFIX}-{entities // 2 // domains * domains}"
+        neighbours = [f"{BENCH_PREFIX}-{i * domains}" for i in range(100)]
+        return [
+            ("get_graph_data / export_graph: entities of a domain",
+             Entity.objects.filter(domain=domain).values("id", "name", "type", "description", "domain")),
+            ("get_graph_data / export_graph: relationships of a domain",
+             Relationship.objects.filter(domain=domain).values("source_id", "target_id", "type")),
+            ("entities of a domain and type",
+             Entity.objects.filter(domain=domain, type=ENTITY_TYPES[0]).values("id")),
+            ("list_or_create_relationships: source + type",
+             Relationship.objects.filter(source_id=entity_id, type=RELATION_TYPES[0]).values("id")),
+            ("list_or_create_relationships: target + type",
+             Relationship.objects.filter(target_id=entity_id, type=RELATION_TYPES[0]).values("id")),
+            ("one hop inside a domain: domain + source_id__in",
+             Relationship.objects.filter(domain=domain, source_id__in=neighbours).values("id", "target_id")),
+        ]
+
+    def _report(self, title, queries, repeat):
+        self.stdout.write("\n" + "=" * 70)
+        self.stdout.write(title)
+        self.stdout.write("=" * 70)
+        for label, queryset in queries:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = len(list(queryset.all()))
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            self.stdout.write(f"\n{label}")
+            self.stdout.write(f"  rows: {rows}, median: {timings[len(timings) // 2] * 1000:.2f} ms")
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f"  | {line}")
+
+    def _report_without_indexes(self, queries, repeat):
+        """
+        删除组合索引后再测一遍。PostgreSQL 在事务中删除并回滚，即使中途失败索引也不会丢失；
+        其它数据库删除后重新创建
+        """
+        indexes = self._composite_indexes()
+        if connection.vendor == 'postgresql':
+            with transaction.atomic(), connection.schema_editor(atomic=False) as editor:
+                for model, index in indexes:
+                    editor.remove_index(model, index)
+                self._report("WITHOUT composite indexes", queries, repeat)
+                transaction.set_rollback(True)
+            return
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.remove_index(model, index)
+        try:
+            self._report("WITHOUT composite indexes", queries, repeat)
+        finally:
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.add_index(model, index)
+
+    def _composite_indexes(self):
+        return [(model, index) for model in (Entity, Relationship) for index in model._meta.indexes]
+
+    def _cleanup(self):
+        # 直接用 SQL 删除，避免逐行发送 post_delete 信号
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {Relationship._meta.db_table} WHERE domain LIKE %s", [f"{BENCH_PREFIX}%"]
+            )
+            cursor.execute(
+                f"DELETE FROM {Entity._meta.db_table} WHERE domain LIKE %s", [f"{BENCH_PREFIX}%"]
+            )
+        self.stdout.write("\nSynthetic data removed")
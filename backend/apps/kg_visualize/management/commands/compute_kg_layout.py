@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from backend.apps.kg_visualize.graph_layout import compute_layout
+from backend.apps.kg_visualize.models import Entity
+import time
+
+
+class Command(BaseCommand):
+    help = ('Precompute force-directed layout coordinates per entity (incremental when a layout '
+            'already exists; one scope per domain, plus "all")')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--domain',
+            action='append',
+            help='Domain to lay out (repeatable; default: every domain and "all")'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute from scratch instead of only moving new or changed entities'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=None,
+            help='Layout iterations (default: KG_LAYOUT_ITERATIONS / KG_LAYOUT_INCREMENTAL_ITERATIONS)'
+        )
+
+    def handle(self, *args, **options):
+        domains = options['domain']
+        if not domains:
+            domains = sorted(Entity.objects.order_by().values_list('domain', flat=True).distinct()) + ['all']
+
+        for domain in domains:
+            started = time.perf_counter()
+            result = compute_layout(domain, full=options['full'], iterations=options['iterations'])
+            self.stdout.write(
+                f"{domain}: {result['mode']} layout, {result['moved']} of {result['nodes']} entities moved "
+                f"(revision {result['revision']}, {time.perf_counter() - started:.2f}s)"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Stored layouts for {len(domains)} scope(s)"))
@@ -2,9 +2,20 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from django.core.files import File
 from backend.apps.kg_visualize.models import Entity, Relationship
+from backend.apps.kg_visualize.bulk_loader import StagingLoader
+from backend.apps.kg_visualize.graph_cache import invalidate_graph
+from backend.apps.kg_visualize.importer import GraphImporter
+from backend.apps.kg_visualize.json_stream import JsonStreamError, iter_json_file_items
+from backend.apps.kg_visualize.line_formats import FORMATS, LineFormatError, iter_file_records
+from backend.apps.kg_visualize.parallel_import import ParallelRecordReader
+import csv
 import json
 import os
 import sys
+import time
+
+# 进度输出的最小间隔（秒）
+PROGRESS_INTERVAL = 2.0
 
 
 class Command(BaseCommand):
@@ -14,7 +25,15 @@ class Command(BaseCommand):
         parser.add_argument(
             'file_path',
             type=str,
-            help='Path to the JSON file containing graph data'
+            help='Path to the file containing graph data'
+        )
+        parser.add_argument(
+            '--format',
+            type=str,
+            choices=FORMATS,
+            default='json',
+            help="Input format: json document, ndjson (one node/link object per line) or csv "
+                 "(header row; rows with source/target are links) (default: json)"
         )
         parser.add_argument(
             '--domain',
@@ -46,6 +65,37 @@ class Command(BaseCommand):
             action='store_true',
             help='Enable verbose output'
         )
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Parse nodes and links incrementally instead of loading the whole file (for very large files)'
+        )
+        parser.add_argument(
+            '--parser',
+            type=str,
+            choices=['auto', 'python', 'ijson'],
+            default='auto',
+            help='Incremental JSON parser used with --stream (default: auto, ijson when installed)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Rows per database batch (default: KG_IMPORT_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--fast',
+            action='store_true',
+            help='Load through a staging table (COPY on PostgreSQL) and merge with set-based SQL; '
+                 'insert-only: existing entities and relationships are skipped'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Parse ndjson/csv input in N worker processes (entities first, then relationships); '
+                 'the main process writes to the database (default: 1)'
+        )
 
     def handle(self, *args, **options):
         file_path = options['file_path']
@@ -54,11 +104,23 @@ class Command(BaseCommand):
         conflict_resolution = options['conflict_resolution']
         dry_run = options['dry_run']
         verbose = options['verbose']
+        batch_size = options['batch_size']
+        workers = options['workers']
 
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+        if workers > 1 and options['format'] == 'json':
+            self.stderr.write("--workers only applies to --format ndjson/csv; importing JSON in a single process")
+            workers = 1
         # 检查文件是否存在
         if not os.path.exists(file_path):
             raise CommandError(f"File not found: {file_path}")
 
+        if options['stream'] or options['format'] != 'json':
+            self._handle_stream(file_path, domain, strategy, conflict_resolution, dry_run, verbose,
+                                batch_size, options['parser'], options['format'], options['fast'], workers)
+            return
+
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -88,16 +150,63 @@ class Command(BaseCommand):
         # 执行导入
         if dry_run:
             stats = self._dry_run_import(nodes, links, domain, strategy, conflict_resolution, verbose)
+        elif options['fast']:
+            stats = self._fast_import(nodes, links, domain, batch_size)
         else:
-            stats = self._perform_import(nodes, links, domain, strategy, conflict_resolution, verbose)
+            stats = self._perform_import(nodes, links, domain, strategy, conflict_resolution, verbose, batch_size)
 
         # 输出结果
         self._print_results(stats, verbose)
 
+    def _handle_stream(self, file_path, domain, strategy, conflict_resolution, dry_run, verbose, batch_size, parser,
+                       fmt='json', fast=False, workers=1):
+        """流式导入：分两遍增量读取 nodes 和 links，按批写入，内存占用与文件大小无关"""
+        reader = None
+        if fmt == 'json':
+            nodes = iter_json_file_items(file_path, 'nodes', backend=parser)
+            links = iter_json_file_items(file_path, 'links', backend=parser)
+        elif workers > 1:
+            # 子进程并行解析分片，主进程写入；全部实体写完后才开始解析关系
+            reader = ParallelRecordReader(file_path, fmt, workers)
+            nodes = reader.iter_records('nodes')
+            links = reader.iter_records('links')
+        else:
+            nodes = iter_file_records(file_path, fmt, 'nodes')
+            links = iter_file_records(file_path, fmt, 'links')
+
+        if verbose:
+            self.stdout.write(f"Streaming nodes and links from {file_path} ({fmt})")
+            if reader:
+                self.stdout.write(f"Workers: {workers} ({len(reader.ranges)} shards)")
+            self.stdout.write(f"Domain: {domain}")
+            self.stdout.write(f"Strategy: {strategy}")
+            self.stdout.write(f"Conflict resolution: {conflict_resolution}")
+            if dry_run:
+                self.stdout.write("DRY RUN MODE - No data will be imported")
+
+        try:
+            if dry_run:
+                stats = self._dry_run_import(nodes, links, domain, strategy, conflict_resolution, verbose)
+            elif fast:
+                stats = self._fast_import(nodes, links, domain, batch_size)
+            else:
+                stats = self._perform_import(nodes, links, domain, strategy, conflict_resolution, verbose,
+                                             batch_size, track_mapping=False)
+        except JsonStreamError as e:
+            raise CommandError(f"Invalid JSON file: {e}")
+        except (LineFormatError, csv.Error, UnicodeDecodeError) as e:
+            raise CommandError(f"Invalid {fmt.upper()} file: {e}")
+
+        if reader:
+            # 子进程中已剔除的无效记录
+            stats['entities']['errors'] += reader.errors['nodes']
+            stats['relationships']['errors'] += reader.errors['links']
+        self._print_results(stats, verbose)
+
     def _dry_run_import(self, nodes, links, domain, strategy, conflict_resolution, verbose):
         """执行模拟导入，不实际保存数据"""
         stats = {
-            "entities": {"created": 0, "updated": 0, "skipped": 0, "conflicts": 0},
+            "entities": {"created": 0, "updated": 0, "skipped": 0, "conflicts": 0, "errors": 0},
             "relationships": {"created": 0, "skipped": 0, "errors": 0},
             "conflicts": []
         }
@@ -165,150 +274,49 @@ class Command(BaseCommand):
         return stats
 
     @transaction.atomic
-    def _perform_import(self, nodes, links, domain, strategy, conflict_resolution, verbose):
-        """执行实际导入"""
-        stats = {
-            "entities": {"created": 0, "updated": 0, "skipped": 0, "conflicts": 0},
-            "relationships": {"created": 0, "skipped": 0, "errors": 0},
-            "conflicts": []
-        }
+    def _perform_import(self, nodes, links, domain, strategy, conflict_resolution, verbose,
+                        batch_size=None, track_mapping=True):
+        """执行实际导入（按批写入，nodes/links 可以是列表或迭代器）"""
+        importer = GraphImporter(
+            domain=domain,
+            strategy=strategy,
+            conflict_resolution=conflict_resolution,
+            batch_size=batch_size,
+            scope_to_domain=True,
+            track_mapping=track_mapping,
+            progress=self._progress_printer(),
+        )
+        importer.import_nodes(nodes)
+        importer.import_links(links)
+        invalidate_graph()
 
-        entity_id_mapping = {}
+        if verbose and importer.entity_id_mapping:
+            for original_id, new_id in importer.entity_id_mapping.items():
+                if original_id != new_id:
+                    self.stdout.write(f"  Created entity with new ID: {original_id} -> {new_id}")
 
-        # 处理实体导入
-        for node in nodes:
-            node_id = node.get("id")
-            name = node.get("name")
-            
-            if not node_id or not name:
-                stats["entities"]["errors"] += 1
-                continue
+        return importer.stats
 
-            try:
-                existing_entity = Entity.objects.filter(id=node_id, domain=domain).first()
-                
-                if existing_entity:
-                    if conflict_resolution == "skip":
-                        stats["entities"]["skipped"] += 1
-                        entity_id_mapping[node_id] = node_id
-                        if verbose:
-                            self.stdout.write(f"  Skipped entity: {node_id}")
-                    elif conflict_resolution == "merge_data":
-                        updated = False
-                        if not existing_entity.type and node.get("type"):
-                            existing_entity.type = node.get("type")
-                            updated = True
-                        if not existing_entity.description and node.get("description"):
-                            existing_entity.description = node.get("description")
-                            updated = True
-                        if updated:
-                            existing_entity.save()
-                            stats["entities"]["updated"] += 1
-                            if verbose:
-                                self.stdout.write(f"  Updated entity: {node_id}")
-                        else:
-                            stats["entities"]["skipped"] += 1
-                            if verbose:
-                                self.stdout.write(f"  Skipped entity (no changes): {node_id}")
-                        entity_id_mapping[node_id] = node_id
-                    elif conflict_resolution == "auto_id":
-                        stats["entities"]["conflicts"] += 1
-                        counter = 1
-                        new_id = f"{node_id}_{counter}"
-                        while Entity.objects.filter(id=new_id, domain=domain).exists():
-                            counter += 1
-                            new_id = f"{node_id}_{counter}"
-                        
-                        new_entity = Entity.objects.create(
-                            id=new_id,
-                            name=name,
-                            type=node.get("type", ""),
-                            description=node.get("description", ""),
-                            domain=domain
-                        )
-                        entity_id_mapping[node_id] = new_id
-                        stats["entities"]["created"] += 1
-                        if verbose:
-                            self.stdout.write(f"  Created entity with new ID: {node_id} -> {new_id}")
-                else:
-                    Entity.objects.create(
-                        id=node_id,
-                        name=name,
-                        type=node.get("type", ""),
-                        description=node.get("description", ""),
-                        domain=domain
-                    )
-                    entity_id_mapping[node_id] = node_id
-                    stats["entities"]["created"] += 1
-                    if verbose:
-                        self.stdout.write(f"  Created entity: {node_id}")
-                        
-            except Exception as e:
-                stats["entities"]["errors"] += 1
-                if verbose:
-                    self.stdout.write(f"  Error creating entity {node_id}: {e}")
+    def _fast_import(self, nodes, links, domain, batch_size=None):
+        """暂存表 + 集合式 SQL 合并（只插入新数据）"""
+        loader = StagingLoader(domain=domain, batch_size=batch_size, progress=self._progress_printer())
+        stats = loader.run(nodes, links)
+        invalidate_graph()
+        return stats
 
-        # 处理关系导入
-        for link in links:
-            source = link.get("source")
-            target = link.get("target")
-            rel_type = link.get("type")
-            description = link.get("description", "")
-            
-            if not source or not target or not rel_type or source == target:
-                stats["relationships"]["errors"] += 1
-                continue
+    def _progress_printer(self):
+        """返回进度回调：按间隔输出已处理行数和速率"""
+        last = {"nodes": 0.0, "links": 0.0}
 
-            try:
-                mapped_source = entity_id_mapping.get(source)
-                mapped_target = entity_id_mapping.get(target)
-                
-                if not mapped_source or not mapped_target:
-                    stats["relationships"]["errors"] += 1
-                    continue
-
-                src = Entity.objects.get(id=mapped_source, domain=domain)
-                tgt = Entity.objects.get(id=mapped_target, domain=domain)
-                
-                existing_rel = Relationship.objects.filter(
-                    source=src, target=tgt, type=rel_type, domain=domain
-                ).first()
-                
-                if existing_rel:
-                    if strategy == "skip":
-                        stats["relationships"]["skipped"] += 1
-                        if verbose:
-                            self.stdout.write(f"  Skipped relationship: {source} -> {target}")
-                    elif strategy == "merge":
-                        if not existing_rel.description and description:
-                            existing_rel.description = description
-                            existing_rel.save()
-                            stats["relationships"]["created"] += 1
-                            if verbose:
-                                self.stdout.write(f"  Updated relationship: {source} -> {target}")
-                        else:
-                            stats["relationships"]["skipped"] += 1
-                            if verbose:
-                                self.stdout.write(f"  Skipped relationship (no changes): {source} -> {target}")
-                else:
-                    Relationship.objects.create(
-                        source=src, target=tgt, type=rel_type, 
-                        description=description, domain=domain
-                    )
-                    stats["relationships"]["created"] += 1
-                    if verbose:
-                        self.stdout.write(f"  Created relationship: {source} -> {target}")
-                        
-            except Entity.DoesNotExist:
-                stats["relationships"]["errors"] += 1
-                if verbose:
-                    self.stdout.write(f"  Error: Entity not found for relationship {source} -> {target}")
-            except Exception as e:
-                stats["relationships"]["errors"] += 1
-                if verbose:
-                    self.stdout.write(f"  Error creating relationship {source} -> {target}: {e}")
+        def report(kind, rows, elapsed):
+            now = time.monotonic()
+            if now - last[kind] < PROGRESS_INTERVAL:
+                return
+            last[kind] = now
+            rate = rows / elapsed if elapsed > 0 else 0
+            self.stdout.write(f"  {kind}: {rows} rows processed ({rate:.0f} rows/s)")
 
-        return stats
+        return report
 
     def _print_results(self, stats, verbose):
         """打印导入结果"""
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kg_visualize', '0002_alter_relationship_unique_together_entity_domain_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GraphRevision',
+            fields=[
+                ('key', models.CharField(default='global', max_length=50, primary_key=True, serialize=False, verbose_name='revisionKey')),
+                ('revision', models.PositiveBigIntegerField(default=0, verbose_name='revision')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updatedTime')),
+            ],
+            options={
+                'verbose_name': 'graphRevision',
+                'verbose_name_plural': 'graphRevision',
+            },
+        ),
+    ]
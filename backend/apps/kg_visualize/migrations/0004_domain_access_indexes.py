@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kg_visualize', '0003_graphrevision'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entity',
+            index=models.Index(fields=['domain', 'updated_at'], name='kg_entity_domain_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entity',
+            index=models.Index(fields=['domain', 'type'], name='kg_entity_domain_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relationship',
+            index=models.Index(fields=['source', 'type'], name='kg_rel_source_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relationship',
+            index=models.Index(fields=['target', 'type'], name='kg_rel_target_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relationship',
+            index=models.Index(fields=['domain', 'source'], name='kg_rel_domain_source_idx'),
+        ),
+    ]
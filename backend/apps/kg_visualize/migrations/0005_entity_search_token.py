@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_search_index(apps, schema_editor):
+    from backend.apps.kg_visualize.search_index import entity_tokens, insert_token_rows
+
+    Entity = apps.get_model('kg_visualize', 'Entity')
+    EntitySearchToken = apps.get_model('kg_visualize', 'EntitySearchToken')
+    rows = (
+        (entity_id, token, weight)
+        for entity_id, name, description in Entity.objects.values_list('id', 'name', 'description').iterator(2000)
+        for token, weight in entity_tokens(entity_id, name, description).items()
+    )
+    with schema_editor.connection.cursor() as cursor:
+        insert_token_rows(cursor, EntitySearchToken._meta.db_table, rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kg_visualize', '0004_domain_access_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntitySearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=101, verbose_name='token')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='weight')),
+                ('entity', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='kg_visualize.entity', verbose_name='entity')),
+            ],
+            options={
+                'verbose_name': 'entitySearchToken',
+                'verbose_name_plural': 'entitySearchToken',
+                'indexes': [models.Index(fields=['token', 'entity'], name='kg_search_token_entity_idx')],
+                'unique_together': {('entity', 'token')},
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
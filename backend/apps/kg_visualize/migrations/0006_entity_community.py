@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kg_visualize', '0005_entity_search_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityCommunity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(help_text='计算范围：领域标识或 all', max_length=100, verbose_name='scope')),
+                ('revision', models.PositiveBigIntegerField(verbose_name='revision')),
+                ('component', models.PositiveIntegerField(verbose_name='component')),
+                ('community', models.PositiveIntegerField(verbose_name='community')),
+                ('entity', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='communities', to='kg_visualize.entity', verbose_name='entity')),
+            ],
+            options={
+                'verbose_name': 'entityCommunity',
+                'verbose_name_plural': 'entityCommunity',
+                'indexes': [models.Index(fields=['scope', 'community'], name='kg_community_scope_idx')],
+                'unique_together': {('scope', 'entity')},
+            },
+        ),
+    ]
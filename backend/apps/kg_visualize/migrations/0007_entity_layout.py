@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kg_visualize', '0006_entity_community'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(help_text='布局范围：领域标识或 all', max_length=100, verbose_name='scope')),
+                ('revision', models.PositiveBigIntegerField(verbose_name='revision')),
+                ('computed_at', models.DateTimeField(verbose_name='computedTime')),
+                ('x', models.FloatField(verbose_name='x')),
+                ('y', models.FloatField(verbose_name='y')),
+                ('entity', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='layouts', to='kg_visualize.entity', verbose_name='entity')),
+            ],
+            options={
+                'verbose_name': 'entityLayout',
+                'verbose_name_plural': 'entityLayout',
+                'unique_together': {('scope', 'entity')},
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:40
+
+from django.db import migrations
+from django.db.models.functions import Length
+
+# 0005 建索引时描述只索引前 500 个字符
+PREVIOUS_DESCRIPTION_LIMIT = 500
+
+
+def reindex_long_descriptions(apps, schema_editor):
+    from backend.apps.kg_visualize.search_index import entity_tokens, insert_token_rows
+
+    Entity = apps.get_model('kg_visualize', 'Entity')
+    EntitySearchToken = apps.get_model('kg_visualize', 'EntitySearchToken')
+    entities = (
+        Entity.objects.annotate(description_length=Length('description'))
+        .filter(description_length__gt=PREVIOUS_DESCRIPTION_LIMIT)
+        .values_list('id', 'name', 'description')
+    )
+    batch = []
+    for row in entities.iterator(2000):
+        batch.append(row)
+        if len(batch) >= 2000:
+            _reindex(schema_editor, EntitySearchToken, batch, entity_tokens, insert_token_rows)
+            batch = []
+    _reindex(schema_editor, EntitySearchToken, batch, entity_tokens, insert_token_rows)
+
+
+def _reindex(schema_editor, EntitySearchToken, batch, entity_tokens, insert_token_rows):
+    if not batch:
+        return
+    EntitySearchToken.objects.filter(entity_id__in=[entity_id for entity_id, _, _ in batch]).delete()
+    rows = (
+        (entity_id, token, weight)
+        for entity_id, name, description in batch
+        for token, weight in entity_tokens(entity_id, name, description).items()
+    )
+    with schema_editor.connection.cursor() as cursor:
+        insert_token_rows(cursor, EntitySearchToken._meta.db_table, rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kg_visualize', '0007_entity_layout'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_long_descriptions, migrations.RunPython.noop),
+    ]
@@ -20,6 +20,11 @@ class Entity(models.Model):
         app_label = "kg_visualize"
         # 增加复合唯一约束，同一领域内ID唯一
         unique_together = [("id", "domain")]
+        # 按领域读取（默认按更新时间倒序）以及按领域+类型筛选
+        indexes = [
+            models.Index(fields=["domain", "updated_at"], name="kg_entity_domain_updated_idx"),
+            models.Index(fields=["domain", "type"], name="kg_entity_domain_type_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.id}) - {self.domain}"
@@ -51,7 +56,119 @@ class Relationship(models.Model):
         verbose_name_plural = "entityRelation"
         # 同一领域内避免重复关系
         unique_together = [("source", "target", "type", "domain")]
+        # 按端点+关系类型筛选（list_or_create_relationships）以及按领域遍历某实体的出边
+        indexes = [
+            models.Index(fields=["source", "type"], name="kg_rel_source_type_idx"),
+            models.Index(fields=["target", "type"], name="kg_rel_target_type_idx"),
+            models.Index(fields=["domain", "source"], name="kg_rel_domain_source_idx"),
+        ]
         app_label = "kg_visualize"
 
     def __str__(self):
-        return f"{self.source.name} -[{self.type}]-> {self.target.name} ({self.domain})"
\ No newline at end of file
+        return f"{self.source.name} -[{self.type}]-> {self.target.name} ({self.domain})"
+
+class EntitySearchToken(models.Model):
+    """
+    n-gram inverted index for entity search (see search_index.py)
+    """
+    # (entity, token) 唯一约束的索引已覆盖按实体查找，无需单独的外键索引
+    entity = models.ForeignKey(
+        Entity,
+        on_delete=models.CASCADE,
+        related_name="search_tokens",
+        db_index=False,
+        verbose_name="entity"
+    )
+    token = models.CharField(max_length=101, verbose_name="token")
+    weight = models.PositiveIntegerField(default=1, verbose_name="weight")
+
+    class Meta:
+        verbose_name = "entitySearchToken"
+        verbose_name_plural = "entitySearchToken"
+        unique_together = [("entity", "token")]
+        indexes = [
+            models.Index(fields=["token", "entity"], name="kg_search_token_entity_idx"),
+        ]
+        app_label = "kg_visualize"
+
+    def __str__(self):
+        return f"{self.token} -> {self.entity_id} ({self.weight})"
+
+
+class GraphRevision(models.Model):
+    """
+    graph revision counter, advanced on every write (used for ETag / Last-Modified)
+
+    key "global" is the graph revision, "derived" the revision of stored communities / layouts;
+    "communities:<scope>" and "layout:<scope>" rows only serve as per-scope locks
+    (see graph_cache.lock_scope)
+    """
+    key = models.CharField(max_length=50, primary_key=True, default="global", verbose_name="revisionKey")
+    revision = models.PositiveBigIntegerField(default=0, verbose_name="revision")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="updatedTime")
+
+    class Meta:
+        verbose_name = "graphRevision"
+        verbose_name_plural = "graphRevision"
+        app_label = "kg_visualize"
+
+    def __str__(self):
+        return f"{self.key}: {self.revision}"
+
+
+class EntityCommunity(models.Model):
+    """
+    connected component / community labels per entity (see graph_communities.py)
+    """
+    scope = models.CharField(max_length=100, verbose_name="scope", help_text="计算范围：领域标识或 all")
+    # 每个范围只保留最近一次计算的结果；revision 为结果对应的图谱修订号
+    revision = models.PositiveBigIntegerField(verbose_name="revision")
+    entity = models.ForeignKey(
+        Entity,
+        on_delete=models.CASCADE,
+        related_name="communities",
+        db_index=False,
+        verbose_name="entity"
+    )
+    component = models.PositiveIntegerField(verbose_name="component")
+    community = models.PositiveIntegerField(verbose_name="community")
+
+    class Meta:
+        verbose_name = "entityCommunity"
+        verbose_name_plural = "entityCommunity"
+        unique_together = [("scope", "entity")]
+        indexes = [
+            models.Index(fields=["scope", "community"], name="kg_community_scope_idx"),
+        ]
+        app_label = "kg_visualize"
+
+    def __str__(self):
+        return f"{self.entity_id}: {self.community} ({self.scope}@{self.revision})"
+
+
+class EntityLayout(models.Model):
+    """
+    precomputed force-directed layout coordinates per entity (see graph_layout.py)
+    """
+    scope = models.CharField(max_length=100, verbose_name="scope", help_text="布局范围：领域标识或 all")
+    # 每个范围只保留最近一次的布局；revision / computed_at 为布局对应的图谱修订号和开始计算的时间
+    revision = models.PositiveBigIntegerField(verbose_name="revision")
+    computed_at = models.DateTimeField(verbose_name="computedTime")
+    entity = models.ForeignKey(
+        Entity,
+        on_delete=models.CASCADE,
+        related_name="layouts",
+        db_index=False,
+        verbose_name="entity"
+    )
+    x = models.FloatField(verbose_name="x")
+    y = models.FloatField(verbose_name="y")
+
+    class Meta:
+        verbose_name = "entityLayout"
+        verbose_name_plural = "entityLayout"
+        unique_together = [("scope", "entity")]
+        app_label = "kg_visualize"
+
+    def __str__(self):
+        return f"{self.entity_id}: ({self.x:.1f}, {self.y:.1f}) ({self.scope}@{self.revision})"
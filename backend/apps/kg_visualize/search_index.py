@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+实体全文检索（GET /api/kg/entities?q=）
+
+使用与数据库无关的 n-gram 倒排索引（EntitySearchToken 表）代替 LIKE '%q%' 全表扫描：
+- 文本经 NFKC 规范化、小写后切分为连续的字母数字/汉字片段，每个片段生成相邻二字 token
+  （名称和ID另加单字），中文无需分词即可检索任意子串
+- 每个 (实体, token) 一行，权重按字段累加：名称 > ID > 描述；另有一条整名 token 用于完全匹配加权
+- 检索时要求命中查询的全部 token，按权重和排序，分页在数据库中完成，耗时只与命中的倒排列表有关
+
+Entity.save() 通过信号同步索引；bulk_create / bulk_update 等批量路径需调用 index_entities()。
+"""
+import re
+import unicodedata
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+from .models import Entity, EntitySearchToken
+
+# (字段, 权重, 是否索引单字)：描述较长，只索引二字以控制索引体积，单字查询只匹配名称和ID
+FIELD_WEIGHTS = (("name", 4, True), ("id", 2, True), ("description", 1, False))
+EXACT_NAME_WEIGHT = 20
+EXACT_PREFIX = "="
+SEARCH_RESULT_FIELDS = ("id", "name", "type", "description", "domain")
+INSERT_BATCH_SIZE = 5000
+
+_SEGMENT_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text):
+    return unicodedata.normalize("NFKC", str(text or "")).lower()
+
+
+def ngrams(text, unigrams=True):
+    """相邻二字（unigrams=True 时另加单字；单字片段总是保留）"""
+    grams = []
+    for segment in _SEGMENT_RE.findall(text):
+        segment = segment.replace("_", "")
+        if unigrams or len(segment) == 1:
+            grams.extend(segment)
+        grams.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return grams
+
+
+def _exact_token(name):
+    max_length = EntitySearchToken._meta.get_field("token").max_length
+    return (EXACT_PREFIX + normalize(name).strip())[:max_length]
+
+
+def entity_tokens(entity_id, name, description):
+    """返回 {token: 权重}"""
+    weights = {}
+    fields = {"name": name, "id": entity_id, "description": description}
+    for field, field_weight, unigrams in FIELD_WEIGHTS:
+        for gram in set(ngrams(normalize(fields[field]), unigrams)):
+            weights[gram] = weights.get(gram, 0) + field_weight
+    if name:
+        weights[_exact_token(name)] = EXACT_NAME_WEIGHT
+    return weights
+
+
+def query_tokens(q):
+    """查询文本的必选 token：每个片段取其相邻二字（更有区分度），单字片段取单字"""
+    tokens = set()
+    for segment in _SEGMENT_RE.findall(normalize(q)):
+        segment = segment.replace("_", "")
+        if len(segment) == 1:
+            tokens.add(segment)
+        else:
+            tokens.update(segment[i:i + 2] for i in range(len(segment) - 1))
+    return sorted(tokens)
+
+
+def insert_token_rows(cursor, table, rows, batch_size=INSERT_BATCH_SIZE):
+    """rows: (entity_id, token, weight)；直接 executemany，逐行构造模型实例的开销远大于写入本身"""
+    sql = f"INSERT INTO {table} (entity_id, token, weight) VALUES (%s, %s, %s)"
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            return
+        cursor.executemany(sql, chunk)
+
+
+@transaction.atomic
+def index_entities(entities):
+    """重建给定实体（Entity 实例）的索引行"""
+    entities = list(entities)
+    if not entities:
+        return
+    EntitySearchToken.objects.filter(entity_id__in=[entity.id for entity in entities]).delete()
+    rows = (
+        (entity.id, token, weight)
+        for entity in entities
+        for token, weight in entity_tokens(entity.id, entity.name, entity.description).items()
+    )
+    with connection.cursor() as cursor:
+        insert_token_rows(cursor, EntitySearchToken._meta.db_table, rows)
+
+
+def search_entities(q, limit=20, offset=0, domain=None, fields=None):
+    """
+    返回 (按相关度排序的实体字典列表, 命中总数)；查询中没有可检索字符时返回 None，由调用方回退
+
+    domain 只检索该领域的实体；fields 为返回的实体字段（默认全部），结果另含 score
+    """
+    required = query_tokens(q)
+    if not required:
+        return None
+    exact = _exact_token(q)
+    ranked = (
+        EntitySearchToken.objects.filter(token__in=required + [exact])
+        .values("entity_id")
+        .annotate(matched=Count("token", filter=Q(token__in=required)), score=Sum("weight"))
+        .filter(matched=len(required))
+    )
+    if domain:
+        ranked = ranked.filter(entity__domain=domain)
+    total = ranked.count()
+    page = list(ranked.order_by("-score", "entity_id")[offset:offset + limit])
+    fields = list(fields or SEARCH_RESULT_FIELDS)
+    entities = Entity.objects.only(*fields).in_bulk([row["entity_id"] for row in page])
+    results = []
+    for row in page:
+        entity = entities.get(row["entity_id"])
+        if entity is None:
+            continue
+        result = {field: getattr(entity, field) for field in fields}
+        result["score"] = row["score"]
+        results.append(result)
+    return results, total
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""实体/关系写操作的信号处理：推进图谱版本号，使快照缓存失效；同步实体检索索引"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .graph_cache import invalidate_graph, invalidation_deferred
+from .models import Entity, Relationship
+from .search_index import index_entities
+
+
+@receiver(post_save, sender=Entity)
+@receiver(post_delete, sender=Entity)
+@receiver(post_save, sender=Relationship)
+@receiver(post_delete, sender=Relationship)
+def on_graph_changed(sender, **kwargs):
+    if not invalidation_deferred():
+        invalidate_graph()
+
+
+@receiver(post_save, sender=Entity)
+def on_entity_saved(sender, instance, raw=False, **kwargs):
+    # 同步实体检索索引（删除时随外键级联删除）
+    if not raw:
+        index_entities([instance])
@@ -0,0 +1,877 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .chat_cache import chat_response_cache
+from .graph_cache import GraphSnapshotCache, graph_snapshot_cache
+from .graph_index import GraphIndex
+from .models import Entity, EntityLayout, EntitySearchToken, GraphRevision, Relationship
+
+
+class GraphSnapshotCacheTests(TestCase):
+    def setUp(self):
+        graph_snapshot_cache.clear()
+        a = Entity.objects.create(id="a", name="人工智能", domain="ai")
+        b = Entity.objects.create(id="b", name="机器学习", domain="ai")
+        Relationship.objects.create(source=a, target=b, type="包含", domain="ai")
+
+    def test_repeat_read_only_checks_revision(self):
+        first = self.client.get("/api/kg/data", {"domain": "ai"}).json()
+        self.assertEqual(len(first["data"]["nodes"]), 2)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get("/api/kg/data", {"domain": "ai"}).json()
+        # 仅剩读取修订号（ETag）的一次查询
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(first, second)
+
+    def test_write_invalidates_snapshot(self):
+        self.client.get("/api/kg/data", {"domain": "ai"})
+        Entity.objects.create(id="c", name="深度学习", domain="ai")
+        data = self.client.get("/api/kg/data", {"domain": "ai"}).json()
+        self.assertEqual(len(data["data"]["nodes"]), 3)
+
+    def test_cascading_delete_bumps_revision_once(self):
+        for i in range(5):
+            Relationship.objects.create(source_id="a", target=Entity.objects.create(id=f"x{i}", name=f"x{i}"),
+                                        type="相关", domain="ai")
+        revision = GraphRevision.objects.get(key="global").revision
+        self.client.delete("/api/kg/entities/a")
+        self.assertEqual(GraphRevision.objects.get(key="global").revision, revision + 1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post("/api/kg/clear-all")
+        self.assertEqual(GraphRevision.objects.get(key="global").revision, revision + 2)
+        self.assertEqual(len([q for q in ctx.captured_queries if "kg_visualize_graphrevision" in q["sql"]
+                              and q["sql"].startswith("UPDATE")]), 1)
+
+
+    def test_concurrent_misses_build_once(self):
+        cache = GraphSnapshotCache(max_entries=4, ttl=0)
+        started = threading.Event()
+        release = threading.Event()
+        builds = []
+
+        def builder():
+            builds.append(1)
+            started.set()
+            release.wait(5)
+            return "index"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_build("ai", builder)))
+                   for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # 等其余线程都在等待同一把构建锁后再放行
+        deadline = time.monotonic() + 5
+        while cache._build_locks["ai"][1] < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(results, ["index"] * 4)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        Entity.objects.create(id="a", name="人工智能", domain="ai")
+
+    def test_if_none_match_returns_304(self):
+        for url in ("/api/kg/data", "/api/kg/export"):
+            first = self.client.get(url, {"domain": "ai"})
+            etag = first["ETag"]
+            self.assertTrue(first.has_header("Last-Modified"))
+            with CaptureQueriesContext(connection) as ctx:
+                second = self.client.get(url, {"domain": "ai"}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(second.status_code, 304)
+            self.assertEqual(second.content, b"")
+            self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get("/api/kg/data", {"domain": "ai"})["ETag"]
+        Entity.objects.create(id="b", name="机器学习", domain="ai")
+        response = self.client.get("/api/kg/data", {"domain": "ai"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class StreamingExportTests(TestCase):
+    def setUp(self):
+        a = Entity.objects.create(id="a", name="人工智能", domain="ai")
+        b = Entity.objects.create(id="b", name="机器学习", domain="ai")
+        c = Entity.objects.create(id="c", name="深度学习", domain="ai")
+        Relationship.objects.create(source=a, target=b, type="包含", domain="ai")
+        Relationship.objects.create(source=b, target=c, type="包含", domain="ai")
+
+    def test_stream_matches_buffered_export(self):
+        buffered = self.client.get("/api/kg/export", {"domain": "ai"}).json()
+        response = self.client.get("/api/kg/export", {"domain": "ai", "stream": "1", "chunk_size": "2"})
+        self.assertTrue(response.streaming)
+        streamed = json.loads(b"".join(response.streaming_content))
+        key = lambda row: row["id"]
+        self.assertEqual(sorted(streamed["data"]["nodes"], key=key), sorted(buffered["data"]["nodes"], key=key))
+        self.assertEqual(sorted(streamed["data"]["links"], key=key), sorted(buffered["data"]["links"], key=key))
+        self.assertEqual(streamed["domain"], "ai")
+
+        # MySQL 的默认游标不流式读取，改为按主键分页
+        with mock.patch("backend.apps.kg_visualize.views.connection") as fake:
+            fake.vendor = "mysql"
+            response = self.client.get("/api/kg/export", {"domain": "ai", "stream": "1", "chunk_size": "2"})
+            paged = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(paged["data"]["nodes"], sorted(buffered["data"]["nodes"], key=key))
+        self.assertEqual(paged["data"]["links"], sorted(buffered["data"]["links"], key=key))
+
+
+class BulkImportTests(TestCase):
+    def post_import(self, **payload):
+        response = self.client.post("/api/kg/import", json.dumps(payload), content_type="application/json")
+        return response.json()["data"]
+
+    def test_auto_id_conflicts_and_links(self):
+        Entity.objects.create(id="a", name="人工智能")
+        Entity.objects.create(id="a_1", name="人工智能")
+        data = self.post_import(
+            nodes=[{"id": "a", "name": "AI"}, {"id": "b", "name": "ML"}, {"id": "b", "name": "ML2"}],
+            links=[{"source": "a", "target": "b", "type": "包含"}, {"source": "a", "target": "b", "type": "包含"}],
+            strategy="skip",
+            batch_size=2,
+        )
+        stats = data["import_stats"]
+        self.assertEqual(stats["entities"]["created"], 3)
+        self.assertEqual(stats["entities"]["conflicts"], 2)
+        self.assertEqual(data["entity_id_mapping"], {"a": "a_2", "b": "b_1"})
+        self.assertEqual(stats["relationships"], {"created": 1, "skipped": 1, "errors": 0})
+        self.assertTrue(Relationship.objects.filter(source_id="a_2", target_id="b_1").exists())
+
+    def test_ndjson_body(self):
+        body = "\n".join([
+            json.dumps({"id": "a", "name": "人工智能"}, ensure_ascii=False),
+            json.dumps({"source": "a", "target": "b", "type": "包含"}, ensure_ascii=False),
+            json.dumps({"id": "b", "name": "机器学习"}, ensure_ascii=False),
+        ])
+        response = self.client.post("/api/kg/import?domain=ai", body.encode("utf-8"),
+                                    content_type="application/x-ndjson")
+        stats = response.json()["data"]["import_stats"]
+        self.assertEqual(stats["entities"]["created"], 2)
+        self.assertEqual(stats["relationships"]["created"], 1)
+        self.assertEqual(Entity.objects.get(id="b").domain, "ai")
+
+    def test_merge_data_fills_missing_fields(self):
+        Entity.objects.create(id="a", name="人工智能")
+        data = self.post_import(
+            nodes=[{"id": "a", "name": "AI", "type": "概念"}],
+            links=[],
+            conflict_resolution="merge_data",
+        )
+        self.assertEqual(data["import_stats"]["entities"]["updated"], 1)
+        self.assertEqual(Entity.objects.get(id="a").type, "概念")
+
+
+class EntitySearchTests(TestCase):
+    def setUp(self):
+        Entity.objects.create(id="ml", name="机器学习", description="人工智能的一个分支")
+        Entity.objects.create(id="dl", name="深度学习", description="机器学习的一个分支")
+        Entity.objects.create(id="cv", name="计算机视觉", description="图像理解")
+
+    def search(self, q, **params):
+        response = self.client.get("/api/kg/entities", {"q": q, **params})
+        return response.json()
+
+    def test_ranked_substring_search(self):
+        result = self.search("机器学习")
+        self.assertEqual([row["id"] for row in result["data"]], ["ml", "dl"])
+        self.assertEqual(result["total"], 2)
+        self.assertEqual([row["id"] for row in self.search("视")["data"]], ["cv"])
+        self.assertEqual(self.search("机器学习", limit=1, offset=1)["data"][0]["id"], "dl")
+
+    def test_index_follows_writes(self):
+        entity = Entity.objects.get(id="cv")
+        entity.name = "图像识别"
+        entity.save()
+        self.assertEqual(self.search("计算机")["total"], 0)
+        self.assertEqual([row["id"] for row in self.search("识别")["data"]], ["cv"])
+
+        self.client.post("/api/kg/import", data=json.dumps({
+            "nodes": [{"id": "nlp", "name": "自然语言处理"}], "links": [],
+        }), content_type="application/json")
+        self.assertEqual([row["id"] for row in self.search("语言")["data"]], ["nlp"])
+
+
+    def test_search_honours_domain_and_fields(self):
+        Entity.objects.create(id="ml-cv", name="机器学习", domain="vision")
+        result = self.search("机器学习", domain="vision", fields="id,name")
+        self.assertEqual(result["total"], 1)
+        self.assertEqual(result["data"], [{"id": "ml-cv", "name": "机器学习", "score": result["data"][0]["score"]}])
+        self.assertEqual(self.search("机器学习", fields="bogus")["ret"], 1)
+
+    def test_long_description_is_fully_indexed(self):
+        Entity.objects.create(id="long", name="长描述", description="填充" * 400 + "量子纠缠")
+        self.assertEqual([row["id"] for row in self.search("量子纠缠")["data"]], ["long"])
+
+
+class ListPaginationTests(TestCase):
+    def setUp(self):
+        entities = [Entity.objects.create(id=f"e{i}", name=f"实体{i}", domain="ai") for i in range(5)]
+        for i in range(4):
+            Relationship.objects.create(source=entities[i], target=entities[i + 1], type="相关", domain="ai")
+
+    def test_keyset_pages_with_projection(self):
+        seen = []
+        after = ""
+        while after is not None:
+            result = self.client.get("/api/kg/relationships", {
+                "limit": 3, "after": after, "fields": "source,target", "domain": "ai",
+            }).json()
+            seen.extend(result["data"])
+            after = result["next"]
+        self.assertEqual(seen, [{"source": f"e{i}", "target": f"e{i + 1}"} for i in range(4)])
+
+    def test_unpaginated_list_streams(self):
+        response = self.client.get("/api/kg/entities", {"fields": "id"})
+        body = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(body["data"], [{"id": f"e{i}"} for i in range(5)])
+        self.assertEqual(self.client.get("/api/kg/entities", {"fields": "password"}).json()["ret"], 1)
+
+
+class NeighborhoodTests(TestCase):
+    def setUp(self):
+        hub = Entity.objects.create(id="hub", name="人工智能")
+        chain = Entity.objects.create(id="c1", name="机器学习")
+        Relationship.objects.create(source=hub, target=chain, type="包含")
+        Relationship.objects.create(
+            source=chain, target=Entity.objects.create(id="c2", name="深度学习"), type="包含"
+        )
+        for i in range(10):
+            leaf = Entity.objects.create(id=f"leaf{i}", name=f"应用{i}")
+            Relationship.objects.create(source=leaf, target=hub, type="应用")
+
+    def get(self, **params):
+        return self.client.get("/api/kg/entities/hub/neighborhood", params).json()
+
+    def test_depth_and_types(self):
+        data = self.get(depth=2, types="包含")["data"]
+        self.assertEqual({n["id"]: n["depth"] for n in data["nodes"]}, {"hub": 0, "c1": 1, "c2": 2})
+        self.assertEqual(len(data["links"]), 2)
+        self.assertFalse(data["truncated"])
+
+    def test_fanout_cap_bounds_hub(self):
+        data = self.get(depth=2, fanout=3)["data"]
+        self.assertTrue(data["truncated"])
+        self.assertEqual(len([n for n in data["nodes"] if n["depth"] == 1]), 3)
+        self.assertEqual(self.client.get("/api/kg/entities/nope/neighborhood").json()["ret"], 1)
+
+    def test_fanout_is_clamped(self):
+        # 请求的 fanout 超过 NEIGHBORHOOD_MAX_FANOUT 时按上限展开
+        with mock.patch("backend.apps.kg_visualize.views.NEIGHBORHOOD_MAX_FANOUT", 3):
+            capped = self.get(depth=2, fanout=10 ** 9)["data"]
+        self.assertEqual(capped, self.get(depth=2, fanout=3)["data"])
+
+    def test_fanout_applies_per_frontier_node(self):
+        # 第二跳的前沿为 hub 与 c2：hub 的关系ID更小且更多，不应挤掉 c2 的关系
+        Relationship.objects.create(source_id="c2", target=Entity.objects.create(id="c3", name="强化学习"),
+                                    type="包含")
+        data = self.client.get("/api/kg/entities/c1/neighborhood", {"depth": 2, "fanout": 3}).json()["data"]
+        depths = {n["id"]: n["depth"] for n in data["nodes"]}
+        self.assertEqual(depths["c3"], 2)
+        # hub 的 3 条关系含来时的 hub-c1
+        self.assertEqual(len([d for d in depths.values() if d == 2]), 3)
+        self.assertTrue(data["truncated"])
+
+
+class PathQueryTests(TestCase):
+    def setUp(self):
+        entities = {i: Entity.objects.create(id=i, name=i) for i in "abcdef"}
+        for source, target, rel_type in [("a", "b", "包含"), ("b", "c", "包含"), ("c", "d", "包含"),
+                                         ("a", "e", "相关"), ("e", "d", "相关"), ("f", "a", "相关")]:
+            Relationship.objects.create(source=entities[source], target=entities[target], type=rel_type)
+
+    def get(self, **params):
+        return self.client.get("/api/kg/path", params).json()["data"]
+
+    def test_shortest_path(self):
+        data = self.get(**{"from": "a", "to": "d"})
+        self.assertEqual([n["id"] for n in data["paths"][0]["nodes"]], ["a", "e", "d"])
+        self.assertEqual(data["paths"][0]["length"], 2)
+        # 限定关系类型后只能走较长的路径
+        data = self.get(**{"from": "d", "to": "a", "types": "包含"})
+        self.assertEqual([n["id"] for n in data["paths"][0]["nodes"]], ["d", "c", "b", "a"])
+        self.assertFalse(self.get(**{"from": "a", "to": "d", "types": "包含", "max_depth": 2})["found"])
+
+    def test_all_paths_and_budget(self):
+        data = self.get(**{"from": "a", "to": "d", "all": 1})
+        self.assertEqual(sorted(p["length"] for p in data["paths"]), [2, 3])
+        data = self.get(**{"from": "f", "to": "d", "budget": 1})
+        self.assertFalse(data["found"])
+        self.assertTrue(data["budget_exhausted"])
+
+    def test_csr_index(self):
+        index = GraphIndex().build()
+        for i in range(index.node_count):
+            for j, e in index.adjacent(i):
+                self.assertEqual({i, j}, {index.edge_source[e], index.edge_target[e]})
+        a = index.index["a"]
+        self.assertEqual(index.degree(a), 3)
+        self.assertEqual(len(index.adjacent(a, index.codes_for(["包含"]))), 1)
+
+    def test_centrality(self):
+        def top(metric, **params):
+            data = self.client.get("/api/kg/analytics/centrality", {"metric": metric, **params}).json()["data"]
+            return data["nodes"][0]["id"], data
+
+        self.assertEqual(top("degree")[0], "a")
+        node_id, data = top("betweenness")
+        self.assertEqual(node_id, "a")
+        self.assertTrue(data["exact"])
+        # 请求的抽样数超过 KG_BETWEENNESS_MAX_SAMPLE 时按上限计算
+        with mock.patch("backend.apps.kg_visualize.views.BETWEENNESS_MAX_SAMPLE", 2):
+            self.assertEqual(top("betweenness", sample=999999999)[1]["sampled_sources"], 2)
+        node_id, data = top("pagerank", limit=6)
+        self.assertEqual(node_id, "d")
+        self.assertAlmostEqual(sum(n["score"] for n in data["nodes"]), 1.0)
+        self.assertEqual(self.client.get("/api/kg/analytics/centrality", {"metric": "x"}).json()["ret"], 1)
+
+    def test_index_rebuilt_after_write(self):
+        self.assertFalse(self.get(**{"from": "f", "to": "d", "max_depth": 1})["found"])
+        Relationship.objects.create(source_id="f", target_id="d", type="相关")
+        self.assertTrue(self.get(**{"from": "f", "to": "d", "max_depth": 1})["found"])
+
+
+class CommunityTests(TestCase):
+    def setUp(self):
+        # 两个互不相连的三角形 + 一个孤立实体
+        entities = {i: Entity.objects.create(id=i, name=i, domain="ai") for i in "abcxyzq"}
+        for source, target in [("a", "b"), ("b", "c"), ("c", "a"), ("x", "y"), ("y", "z"), ("z", "x")]:
+            Relationship.objects.create(source=entities[source], target=entities[target], type="相关", domain="ai")
+        self.client.force_login(User.objects.create_user("admin", is_staff=True))
+
+    def get(self, **params):
+        return self.client.get("/api/kg/analytics/communities", {"domain": "ai", **params}).json()["data"]
+
+    def compute(self):
+        return self.client.post("/api/kg/analytics/communities?domain=ai").json()["data"]
+
+    def test_labels_stored_and_exposed(self):
+        data = self.get()
+        self.assertTrue(data["stale"])
+        self.assertEqual(data["entity_count"], 0)
+        data = self.compute()
+        self.assertTrue(data["recomputed"])
+        self.assertFalse(data["stale"])
+        self.assertEqual((data["component_count"], data["community_count"]), (3, 3))
+        self.assertEqual([c["size"] for c in data["communities"]], [3, 3, 1])
+        self.assertFalse(self.compute()["recomputed"])
+
+        nodes = {n["id"]: n for n in self.client.get("/api/kg/data", {"domain": "ai"}).json()["data"]["nodes"]}
+        self.assertEqual(nodes["a"]["community"], nodes["c"]["community"])
+        self.assertNotEqual(nodes["a"]["community"], nodes["x"]["community"])
+        self.assertEqual(nodes["q"]["component"], 2)
+        members = self.get(community=nodes["x"]["community"])["members"]
+        self.assertEqual([m["id"] for m in members], ["x", "y", "z"])
+
+    def test_write_makes_labels_stale(self):
+        self.compute()
+        Relationship.objects.create(source_id="c", target_id="x", type="相关", domain="ai")
+        # 读取不触发计算：返回已保存的标签并标记过期
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get()
+        self.assertTrue(data["stale"])
+        self.assertEqual(data["component_count"], 3)
+        self.assertFalse(any("INSERT" in q["sql"] or "DELETE" in q["sql"] for q in queries.captured_queries))
+        data = self.compute()
+        self.assertTrue(data["recomputed"])
+        self.assertEqual(data["component_count"], 2)
+
+    def test_scopes_do_not_invalidate_each_other(self):
+        self.compute()
+        self.client.post("/api/kg/analytics/communities?domain=all")
+        self.assertFalse(self.get()["stale"])
+        self.assertFalse(self.compute()["recomputed"])
+
+    def test_http_compute_restricted(self):
+        with mock.patch("backend.apps.kg_visualize.views.COMMUNITY_HTTP_MAX_NODES", 4):
+            self.assertEqual(self.client.post("/api/kg/analytics/communities?domain=ai").json()["ret"], 1)
+        self.client.logout()
+        self.assertEqual(self.client.post("/api/kg/analytics/communities?domain=ai").status_code, 403)
+        self.assertIsNone(self.get()["revision"])
+
+
+class LevelOfDetailTests(TestCase):
+    def setUp(self):
+        entities = {i: Entity.objects.create(id=i, name=i, type="人物" if i in "abc" else "概念", domain="ai")
+                    for i in "abcxyzq"}
+        for source, target in [("a", "b"), ("b", "c"), ("c", "a"), ("x", "y"), ("y", "z"), ("z", "x"),
+                               ("c", "x"), ("a", "x")]:
+            Relationship.objects.create(source=entities[source], target=entities[target], type="相关", domain="ai")
+
+    def get(self, **params):
+        return self.client.get("/api/kg/data", {"domain": "ai", **params}).json()
+
+    def test_clusters_and_meta_edges(self):
+        data = self.get(lod=10, group_by="type")["data"]
+        clusters = {n["cluster"]: n for n in data["nodes"]}
+        self.assertEqual({k: n["size"] for k, n in clusters.items()}, {"概念": 4, "人物": 3})
+        self.assertEqual(clusters["人物"]["internal_edges"], 3)
+        self.assertEqual([link["weight"] for link in data["links"]], [2])
+
+        # 按社区分组只使用已保存的标签，未计算时返回错误而不是在读取时计算
+        self.assertEqual(self.get(lod=2)["ret"], 1)
+        call_command("compute_kg_communities", "--domain", "ai", stdout=StringIO())
+        data = self.get(lod=2)["data"]
+        self.assertEqual(len(data["nodes"]), 2)
+        self.assertEqual(data["nodes"][-1]["cluster"], "__other__")
+        self.assertEqual(sum(n["size"] for n in data["nodes"]), 7)
+
+    def test_expand_cluster(self):
+        data = self.get(lod=10, group_by="type", expand="人物")["data"]
+        ids = {n["id"] for n in data["nodes"]}
+        self.assertEqual(ids, {"cluster:概念", "a", "b", "c"})
+        aggregated = sorted((link["source"], link["weight"]) for link in data["links"] if link["type"] == "aggregate")
+        self.assertEqual(aggregated, [("a", 1), ("c", 1)])
+        self.assertEqual(len([link for link in data["links"] if link["type"] == "相关"]), 3)
+        self.assertEqual(self.get(lod=10, group_by="type", expand="nope")["ret"], 1)
+
+
+class LayoutTests(TestCase):
+    def setUp(self):
+        entities = {i: Entity.objects.create(id=i, name=i, domain="ai") for i in "abcde"}
+        for source, target in [("a", "b"), ("b", "c"), ("c", "d"), ("d", "a")]:
+            Relationship.objects.create(source=entities[source], target=entities[target], type="相关", domain="ai")
+        self.client.force_login(User.objects.create_user("admin", is_staff=True))
+
+    def nodes(self):
+        return {n["id"]: n for n in self.client.get("/api/kg/data", {"domain": "ai"}).json()["data"]["nodes"]}
+
+    def test_layout_persisted_and_incremental(self):
+        self.assertNotIn("x", self.nodes()["a"])
+        etag = self.client.get("/api/kg/data", {"domain": "ai"})["ETag"]
+        result = self.client.post("/api/kg/analytics/layout?domain=ai").json()["data"]
+        self.assertEqual((result["mode"], result["moved"]), ("full", 5))
+        self.assertNotEqual(self.client.get("/api/kg/data", {"domain": "ai"})["ETag"], etag)
+        before = self.nodes()
+        self.assertTrue(all(isinstance(n["x"], float) and isinstance(n["y"], float) for n in before.values()))
+        self.assertFalse(self.client.get("/api/kg/analytics/layout", {"domain": "ai"}).json()["data"]["stale"])
+
+        Entity.objects.create(id="f", name="f", domain="ai")
+        Relationship.objects.create(source_id="f", target_id="a", type="相关", domain="ai")
+        self.assertTrue(self.client.get("/api/kg/analytics/layout", {"domain": "ai"}).json()["data"]["stale"])
+        result = self.client.post("/api/kg/analytics/layout?domain=ai").json()["data"]
+        self.assertEqual((result["mode"], result["moved"]), ("incremental", 2))
+        after = self.nodes()
+        self.assertEqual([(after[i]["x"], after[i]["y"]) for i in "bcde"],
+                         [(before[i]["x"], before[i]["y"]) for i in "bcde"])
+        self.assertIsInstance(after["f"]["x"], float)
+
+    def test_layout_write_takes_scope_lock(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post("/api/kg/analytics/layout?domain=ai")
+        statements = [q["sql"] for q in ctx.captured_queries]
+        lock = next(i for i, sql in enumerate(statements)
+                    if sql.startswith("UPDATE") and "kg_visualize_graphrevision" in sql and "layout:ai" in sql)
+        delete = next(i for i, sql in enumerate(statements) if sql.startswith("DELETE") and "entitylayout" in sql)
+        self.assertLess(lock, delete)
+        self.assertEqual(GraphRevision.objects.get(key="layout:ai").revision, 1)
+
+    def test_http_layout_restricted(self):
+        with mock.patch("backend.apps.kg_visualize.views.LAYOUT_HTTP_MAX_NODES", 4):
+            self.assertEqual(self.client.post("/api/kg/analytics/layout?domain=ai").json()["ret"], 1)
+        self.client.logout()
+        self.assertEqual(self.client.post("/api/kg/analytics/layout?domain=ai").status_code, 403)
+        self.assertFalse(EntityLayout.objects.exists())
+
+    def test_viewport_query(self):
+        self.client.post("/api/kg/analytics/layout?domain=ai")
+        nodes = self.nodes()
+        x, y = nodes["a"]["x"], nodes["a"]["y"]
+
+        def get(**params):
+            return self.client.get("/api/kg/data", {"domain": "ai", **params}).json()
+
+        data = get(bbox=f"{x - 1},{y - 1},{x + 1},{y + 1}")["data"]
+        self.assertEqual(data["viewport"]["in_box"], 1)
+        # 矩形外的邻居以 outside 节点返回
+        self.assertEqual({n["id"]: n["outside"] for n in data["nodes"]}, {"a": False, "b": True, "d": True})
+        self.assertEqual(len(data["links"]), 2)
+
+        xs = [n["x"] for n in nodes.values()]
+        ys = [n["y"] for n in nodes.values()]
+        everything = f"{min(xs)},{min(ys)},{max(xs)},{max(ys)}"
+        self.assertEqual(get(bbox=everything)["data"]["viewport"]["returned"], 5)
+        # 极小的缩放比例下屏幕格以原点为界只剩四个象限，每格只保留一个节点
+        data = get(bbox=everything, zoom=1e-6)["data"]
+        self.assertLessEqual(data["viewport"]["returned"], 4)
+        returned = {n["id"] for n in data["nodes"]}
+        self.assertFalse(any(n["outside"] for n in data["nodes"]))
+        self.assertTrue(all(link["source"] in returned and link["target"] in returned for link in data["links"]))
+        self.assertEqual(get(bbox="0,0,1")["ret"], 1)
+        self.assertEqual(get(bbox="0,0,1,1", zoom="nan")["ret"], 1)
+
+
+class StatsTests(TestCase):
+    def setUp(self):
+        a = Entity.objects.create(id="a", name="人工智能", type="概念", domain="ai")
+        b = Entity.objects.create(id="b", name="机器学习", type="技术", domain="ai")
+        c = Entity.objects.create(id="c", name="深度学习", type="技术", domain="ai")
+        Entity.objects.create(id="d", name="孤立实体", type="概念", domain="ai")
+        e = Entity.objects.create(id="e", name="细胞", domain="bio")
+        Relationship.objects.create(source=a, target=b, type="包含", domain="ai")
+        Relationship.objects.create(source=a, target=c, type="包含", domain="ai")
+        Relationship.objects.create(source=b, target=c, type="基于", domain="ai")
+        Relationship.objects.create(source=e, target=e, type="自指", domain="bio")
+        # 跨领域关系：另一端 e 不属于 ai，不应计入 ai 的度数分布
+        Relationship.objects.create(source=e, target=Entity.objects.create(id="f", name="基因", domain="ai"),
+                                    type="相关", domain="ai")
+
+    def test_aggregates(self):
+        data = self.client.get("/api/kg/stats", {"domain": "ai"}).json()["data"]
+        self.assertEqual((data["entity_count"], data["relationship_count"]), (5, 4))
+        self.assertEqual(data["entity_types"], {"技术": 2, "概念": 2, "": 1})
+        self.assertEqual(data["relation_types"], {"包含": 2, "基于": 1, "相关": 1})
+        degree = data["degree"]
+        self.assertEqual((degree["isolated"], degree["max"], degree["p50"], degree["p99"]), (1, 2, 2, 2))
+        self.assertEqual(degree["histogram"], {"0": 1, "1": 1, "2": 3})
+
+        data = self.client.get("/api/kg/stats").json()["data"]
+        self.assertEqual([(d["domain"], d["entities"], d["relationships"]) for d in data["domains"]],
+                         [("ai", 5, 4), ("bio", 1, 1)])
+
+    def test_cached_per_version(self):
+        self.client.get("/api/kg/stats")
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get("/api/kg/stats").json()["data"]
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn("snapshot", data["caches"])
+        Relationship.objects.create(source_id="d", target_id="a", type="相关", domain="ai")
+        self.assertEqual(self.client.get("/api/kg/stats").json()["data"]["relationship_count"], 6)
+
+
+class AIChatTests(TestCase):
+    def setUp(self):
+        a = Entity.objects.create(id="a", name="人工智能", type="概念", domain="ai")
+        b = Entity.objects.create(id="b", name="机器学习", type="技术", domain="ai")
+        Entity.objects.create(id="c", name="细胞", domain="bio")
+        self.link = Relationship.objects.create(source=a, target=b, type="包含", domain="ai")
+        chat_response_cache.clear()
+
+    def chat(self, **body):
+        response = self.client.post("/api/kg/ai-chat", json.dumps(dict({"useExternalAI": False}, **body)),
+                                    content_type="application/json")
+        return response.json()
+
+    def test_context_resolved_on_server(self):
+        self.assertIn("总实体数：2 个", self.chat(message="统计", currentDomain="ai")["response"])
+        self.assertIn("总实体数：3 个", self.chat(message="统计", currentDomain="all")["response"])
+        # 旧客户端上传的 graphData 仍然使用
+        legacy = {"nodes": [{"id": "x", "name": "X", "domain": "default"}], "links": []}
+        self.assertIn("总实体数：1 个", self.chat(message="统计", graphData=legacy)["response"])
+
+    def test_selected_ids_loaded_from_db(self):
+        with mock.patch("backend.apps.kg_visualize.views.generate_ai_response", return_value="ok") as generate:
+            self.chat(message="分析", currentDomain="ai", selectedNodeId="b", selectedLinkId=self.link.id)
+        _, graph_data, domain, node, link, _ = generate.call_args.args
+        self.assertEqual((len(graph_data["nodes"]), domain, node["name"]), (2, "ai", "机器学习"))
+        self.assertEqual((link["source"], link["target"], link["type"]), ("a", "b", "包含"))
+
+    def test_local_answers_use_cached_index(self):
+        from .assistant_index import assistant_index_cache
+
+        answer = self.chat(message="机器学习是什么", currentDomain="ai")["response"]
+        self.assertIn("找到实体：机器学习（ID: b）", answer)
+        self.assertIn("人工智能 --[包含]--> 机器学习", answer)
+        hits = assistant_index_cache.hits
+        self.assertRegex(self.chat(message="推荐", currentDomain="ai")["response"],
+                         r"推荐最活跃实体：(人工智能|机器学习) \(1 个关系\)")
+        self.assertEqual(assistant_index_cache.hits, hits + 1)
+        # 写入后索引随图谱版本重建
+        Entity.objects.create(id="d", name="强化学习", domain="ai")
+        self.assertIn("找到实体：强化学习", self.chat(message="强化学习", currentDomain="ai")["response"])
+
+    def test_external_prompt_retrieves_relevant_context(self):
+        from .assistant_index import get_assistant_index
+        from .graph_retrieval import estimate_tokens, retrieve_context
+
+        Entity.objects.bulk_create(
+            Entity(id=f"f{i}", name=f"填充实体{i}", description="与问题无关的描述" * 5, domain="ai") for i in range(40)
+        )
+        q = Entity.objects.create(id="q", name="量子纠缠", description="量子力学现象", domain="ai")
+        Relationship.objects.create(source=q, target_id="f39", type="关联", domain="ai")
+        completion = mock.MagicMock()
+        completion.choices[0].message.content = "ok"
+        with mock.patch("openai.chat.completions.create", return_value=completion) as create:
+            answer = self.chat(message="量子纠缠是什么", currentDomain="ai", useExternalAI=True)["response"]
+        self.assertEqual(answer, "ok")
+        prompt = create.call_args.kwargs["messages"][0]["content"]
+        self.assertIn("量子纠缠 (ID: q) - 量子力学现象", prompt)
+        self.assertIn("量子纠缠 --[关联]--> 填充实体39", prompt)
+        self.assertNotIn("填充实体0 ", prompt)
+
+        index = get_assistant_index({"nodes": list(Entity.objects.values()), "links": []})
+        entities, relations, info = retrieve_context(index, "实体", budget=100)
+        self.assertLessEqual(sum(map(estimate_tokens, entities + relations)), 100)
+        self.assertTrue(info["truncated"])
+        self.assertTrue(retrieve_context(index, "统计")[2]["fallback"])
+
+        # 描述与实体全文检索一样完整参与检索
+        Entity.objects.create(id="long", name="长描述", description="填充" * 400 + "暗物质", domain="ai")
+        index = get_assistant_index({"nodes": list(Entity.objects.values()), "links": []})
+        self.assertTrue(retrieve_context(index, "暗物质")[0][0].startswith("长描述 (ID: long)"))
+
+    def test_response_cache(self):
+        first = self.chat(message="统计", currentDomain="ai")
+        self.assertFalse(first["cached"])
+        again = self.chat(message=" 统计 ", currentDomain="ai")
+        self.assertEqual((again["cached"], again["response"]), (True, first["response"]))
+        self.assertFalse(self.chat(message="统计", currentDomain="all")["cached"])
+        self.assertFalse(self.chat(message="统计", currentDomain="ai", noCache=True)["cached"])
+        stats = self.client.get("/api/kg/stats").json()["data"]["caches"]["ai_chat"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["bypassed"]), (1, 2, 1))
+
+        # 图谱写入后失效
+        Entity.objects.create(id="d", name="强化学习", domain="ai")
+        answer = self.chat(message="统计", currentDomain="ai")
+        self.assertEqual((answer["cached"], "总实体数：3 个" in answer["response"]), (False, True))
+
+        # 外部AI失败时的兜底回复不缓存
+        with mock.patch("openai.chat.completions.create", side_effect=RuntimeError("offline")):
+            for _ in range(2):
+                self.assertFalse(self.chat(message="统计", currentDomain="ai", useExternalAI=True)["cached"])
+
+    def test_shared_cache_backend(self):
+        with mock.patch.object(chat_response_cache, "backend", "default"):
+            self.assertFalse(self.chat(message="帮助")["cached"])
+            self.assertTrue(self.chat(message="帮助")["cached"])
+        self.assertFalse(self.chat(message="帮助")["cached"])
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容的 /chat/completions：回复固定为 TOKENS 拼接，stream=true 时逐段以 SSE 返回"""
+    TOKENS = ["量子", "纠缠", "是一种现象"]
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        base = {"id": "chatcmpl-test", "created": 0, "model": body["model"]}
+        self.send_response(200)
+        if not body.get("stream"):
+            payload = json.dumps(dict(base, object="chat.completion", choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "".join(self.TOKENS)},
+            }])).encode()
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for token in self.TOKENS:
+            chunk = dict(base, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+class StreamingChatTests(TestCase):
+    def setUp(self):
+        Entity.objects.create(id="q", name="量子纠缠", domain="ai")
+        chat_response_cache.clear()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        settings = override_settings(CHATGPT_BASE_URL=f"http://127.0.0.1:{self.server.server_port}/v1/",
+                                     CHATGPT_API_KEY="test-key", CHATGPT_MODEL="fake-model")
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def events(self, **body):
+        response = self.client.post("/api/kg/ai-chat?stream=true", json.dumps(body), content_type="application/json")
+        self.assertTrue(response["Content-Type"].startswith("text/event-stream"))
+        text = b"".join(response.streaming_content).decode("utf-8")
+        return [json.loads(block[len("data: "):]) for block in text.split("\n\n") if block]
+
+    def test_tokens_relayed_as_events(self):
+        events = self.events(message="量子纠缠", currentDomain="ai")
+        self.assertEqual([e["content"] for e in events if e["type"] == "delta"], FakeOpenAIHandler.TOKENS)
+        self.assertEqual(events[-1], {"type": "done", "cached": False})
+        request = self.server.requests[-1]
+        self.assertEqual((request["model"], request["stream"], request["max_tokens"]), ("fake-model", True, 1500))
+
+        # 完整回复进入缓存，重复提问以一个事件返回
+        events = self.events(message="量子纠缠", currentDomain="ai")
+        self.assertEqual(events, [{"type": "delta", "content": "量子纠缠是一种现象"}, {"type": "done", "cached": True}])
+        self.assertEqual(len(self.server.requests), 1)
+
+        # 非流式请求使用同一配置
+        response = self.client.post("/api/kg/ai-chat", json.dumps({"message": "纠缠", "currentDomain": "ai"}),
+                                    content_type="application/json").json()
+        self.assertEqual(response["response"], "量子纠缠是一种现象")
+
+    def test_local_answer_is_one_event(self):
+        events = self.events(message="量子纠缠", currentDomain="ai", useExternalAI=False)
+        self.assertEqual([e["type"] for e in events], ["delta", "done"])
+        self.assertIn("找到实体：量子纠缠", events[0]["content"])
+        self.assertEqual(self.server.requests, [])
+
+
+class SaveDataModeTests(TestCase):
+    def setUp(self):
+        a = Entity.objects.create(id="a", name="人工智能", domain="ai")
+        b = Entity.objects.create(id="b", name="机器学习", domain="ai")
+        c = Entity.objects.create(id="c", name="深度学习", domain="ai")
+        Entity.objects.create(id="m", name="药物", domain="medical")
+        Relationship.objects.create(source=a, target=b, type="包含", domain="ai")
+        Relationship.objects.create(source=b, target=c, type="包含", domain="ai")
+
+    def save(self, **payload):
+        response = self.client.post("/api/kg/save-data", data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["data"]["diff"]
+
+    def test_only_diff_is_written(self):
+        created_at = Entity.objects.get(id="a").updated_at
+        diff = self.save(currentDomain="ai", nodes=[
+            {"id": "a", "name": "人工智能"},
+            {"id": "b", "name": "机器学习（修改）"},
+            {"id": "d", "name": "强化学习"},
+            {"id": "m", "name": "其它领域的ID"},
+        ], links=[
+            {"source": "a", "target": "b", "type": "包含"},
+            {"source": "a", "target": "d", "type": "包含", "description": "新增"},
+        ])
+        self.assertEqual(diff["entities"], {"added": 1, "changed": 1, "removed": 1, "unchanged": 1, "errors": 1})
+        self.assertEqual(diff["relationships"], {"added": 1, "changed": 0, "removed": 0, "unchanged": 1, "errors": 0})
+        self.assertEqual(Entity.objects.get(id="a").updated_at, created_at)
+        self.assertEqual(Entity.objects.get(id="b").name, "机器学习（修改）")
+        self.assertEqual(Entity.objects.get(id="m").domain, "medical")
+        # c 被删除，b->c 随之级联删除
+        self.assertEqual(set(Relationship.objects.values_list("source_id", "target_id")), {("a", "b"), ("a", "d")})
+
+    def test_all_domains_removes_missing(self):
+        diff = self.save(currentDomain="all", nodes=[{"id": "m", "name": "药物", "domain": "medical"}], links=[])
+        self.assertEqual(diff["entities"]["removed"], 3)
+        self.assertEqual(diff["relationships"]["removed"], 0)
+        self.assertEqual(list(Entity.objects.values_list("id", flat=True)), ["m"])
+        self.assertFalse(Relationship.objects.exists())
+
+
+class ImportCommandTests(TestCase):
+    def write_file(self, data, suffix=".json"):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            if isinstance(data, str):
+                f.write(data)
+            else:
+                json.dump(data, f, ensure_ascii=False)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_stream_import_matches_buffered_import(self):
+        # links 在 nodes 之前，流式模式需要两遍读取
+        data = {
+            "links": [{"source": "a", "target": "b", "type": "包含"}, {"source": "a", "target": "x", "type": "包含"}],
+            "meta": {"nested": [1, 2, {"k": "v"}]},
+            "nodes": [{"id": "a", "name": "人工智能"}, {"id": "b", "name": "机器学习"}],
+        }
+        path = self.write_file(data)
+        call_command("import_kg_data", path, "--domain", "ai", "--stream", "--parser", "python",
+                     "--batch-size", "1", stdout=StringIO())
+        self.assertEqual(set(Entity.objects.filter(domain="ai").values_list("id", flat=True)), {"a", "b"})
+        self.assertEqual(Relationship.objects.filter(domain="ai").count(), 1)
+
+        out = StringIO()
+        call_command("import_kg_data", path, "--domain", "ai", "--conflict-resolution", "skip", stdout=out)
+        self.assertIn("Skipped: 2", out.getvalue())
+        self.assertEqual(Entity.objects.count(), 2)
+
+    def test_csv_fast_import(self):
+        Entity.objects.create(id="a", name="人工智能", domain="ai")
+        path = self.write_file(
+            "id,name,source,target,type\n"
+            "a,人工智能,,,\n"
+            "b,机器学习,,,\n"
+            ",,a,b,包含\n"
+            ",,a,b,包含\n"
+            ",,a,missing,包含\n",
+            suffix=".csv",
+        )
+        out = StringIO()
+        call_command("import_kg_data", path, "--domain", "ai", "--format", "csv", "--fast", stdout=out)
+        self.assertEqual(set(Entity.objects.values_list("id", flat=True)), {"a", "b"})
+        self.assertEqual(Relationship.objects.count(), 1)
+        self.assertIn("Errors: 1", out.getvalue())
+        self.assertTrue(EntitySearchToken.objects.filter(entity_id="b", token="学习").exists())
+
+    def test_fast_import_indexes_only_inserted_entities(self):
+        # 已存在的实体不在本次插入之列，检索索引保持原样
+        Entity.objects.create(id="a", name="人工智能", domain="ai")
+        path = self.write_file(
+            "id,name,source,target,type\n"
+            "a,人工神经,,,\n"
+            "b,机器学习,,,\n"
+            "c,深度学习,,,\n"
+            "c,重复记录,,,\n",
+            suffix=".csv",
+        )
+        call_command("import_kg_data", path, "--domain", "ai", "--format", "csv", "--fast",
+                     "--batch-size", "1", stdout=StringIO())
+        self.assertTrue(EntitySearchToken.objects.filter(entity_id="a", token="智能").exists())
+        self.assertFalse(EntitySearchToken.objects.filter(entity_id="a", token="神经").exists())
+        self.assertTrue(EntitySearchToken.objects.filter(entity_id="b", token="学习").exists())
+        self.assertTrue(EntitySearchToken.objects.filter(entity_id="c", token="深度").exists())
+        self.assertFalse(EntitySearchToken.objects.filter(entity_id="c", token="重复").exists())
+
+    def test_import_files_with_utf8_bom(self):
+        path = self.write_file("\ufeffid,name,source,target,type\na,人工智能,,,\nb,机器学习,,,\n,,a,b,包含\n", suffix=".csv")
+        call_command("import_kg_data", path, "--domain", "ai", "--format", "csv", stdout=StringIO())
+        self.assertEqual(set(Entity.objects.filter(domain="ai").values_list("id", flat=True)), {"a", "b"})
+        self.assertEqual(Relationship.objects.filter(domain="ai").count(), 1)
+
+        lines = [json.dumps({"id": "c", "name": "深度学习"}), json.dumps({"source": "c", "target": "a", "type": "属于"})]
+        path = self.write_file("\ufeff" + "\n".join(lines) + "\n", suffix=".ndjson")
+        for extra in ((), ("--workers", "2")):
+            call_command("import_kg_data", path, "--domain", "bom", "--format", "ndjson", *extra, stdout=StringIO())
+            self.assertTrue(Entity.objects.filter(domain="bom", id="c").exists())
+            Entity.objects.filter(domain="bom").delete()
+
+    def test_parallel_import_matches_single_process(self):
+        lines = [json.dumps({"source": f"n{i}", "target": f"n{i + 1}", "type": "相关"}) for i in range(20)]
+        lines += [json.dumps({"id": f"n{i}", "name": f"节点{i}"}) for i in range(21)]
+        lines += [json.dumps({"name": "缺少ID"}), json.dumps({"source": "n0", "target": "n0", "type": "自环"})]
+        path = self.write_file("\n".join(lines) + "\n", suffix=".ndjson")
+
+        out = StringIO()
+        # 分片很小，确保记录分散在多个分片中
+        with mock.patch("backend.apps.kg_visualize.parallel_import.DEFAULT_SHARD_SIZE", 200):
+            call_command("import_kg_data", path, "--domain", "ai", "--format", "ndjson", "--workers", "2",
+                         "--batch-size", "7", stdout=out)
+        self.assertEqual(Entity.objects.filter(domain="ai").count(), 21)
+        self.assertEqual(Relationship.objects.filter(domain="ai").count(), 20)
+        self.assertEqual(out.getvalue().count("Errors: 1"), 2)
+
+    def test_parallel_csv_shard_keeps_quoted_header(self):
+        from .parallel_import import ParallelRecordReader, parse_shard
+
+        path = self.write_file('"note, extra",id,name\n"x, y",a,人工智能\n', suffix=".csv")
+        reader = ParallelRecordReader(path, "csv", workers=1)
+        start, end = reader.ranges[0]
+        rows, errors = parse_shard(path, "csv", "nodes", start, end, reader.fieldnames)
+        self.assertEqual((errors, [(r["id"], r["name"]) for r in rows]), (0, [("a", "人工智能")]))
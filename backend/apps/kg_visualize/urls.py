@@ -13,6 +13,13 @@ urlpatterns = [
     # Entity CRUD
     path('entities', views.list_or_create_entities, name='list_or_create_entities'),
     path('entities/<str:entity_id>', views.entity_detail, name='entity_detail'),
+    path('entities/<str:entity_id>/neighborhood', views.entity_neighborhood, name='entity_neighborhood'),
+
+    # Graph queries
+    path('path', views.find_path, name='find_path'),
+    path('analytics/centrality', views.centrality, name='centrality'),
+    path('analytics/communities', views.communities, name='communities'),
+    path('analytics/layout', views.layout, name='layout'),
 
     # Relationship CRUD
     path('relationships', views.list_or_create_relationships, name='list_or_create_relationships'),
@@ -29,8 +36,8 @@ urlpatterns = [
     # Data Mode
     path('save-data', views.save_data_mode, name='save_data_mode'),
     
-    # Statistics (commented out - function not implemented)
-    # path('kg/stats', views.get_stats, name='get_stats'),
+    # Statistics
+    path('stats', views.get_stats, name='get_stats'),
     
     # 用户管理API
     path('users/', user_views.user_list, name='user-list'),
@@ -1,59 +1,197 @@
 # -*- coding: utf-8 -*-
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
-from django.db import transaction, models
+from django.views.decorators.http import condition, require_http_methods
+from django.db import connection, transaction, models
 from .models import Entity, Relationship
+from .assistant_index import get_assistant_index
+from .chat_cache import cache_key as chat_cache_key, chat_response_cache
+from .graph_cache import (
+    deferred_invalidation, get_graph_revision, get_payload_revision, graph_snapshot_cache, invalidate_graph
+)
+from .graph_analytics import (
+    BETWEENNESS_MAX_SAMPLE, BETWEENNESS_SAMPLE, METRICS as CENTRALITY_METRICS, get_centrality
+)
+from .graph_communities import (
+    HTTP_MAX_NODES as COMMUNITY_HTTP_MAX_NODES, community_labels, community_members, community_summary,
+    ensure_communities, stored_revision
+)
+from .graph_diff import GraphDiff
+from .graph_index import PATH_EXPANSION_BUDGET, PathSearch, get_graph_index, graph_index_cache, timed
+from .graph_layout import HTTP_MAX_NODES as LAYOUT_HTTP_MAX_NODES, compute_layout, layout_coordinates, stored_layout
+from .graph_lod import GROUP_BY as LOD_GROUP_BY, MAX_CLUSTERS as LOD_MAX_CLUSTERS, cluster_view, get_cluster_assignment
+from .graph_queries import neighborhood
+from .graph_retrieval import distribution_lines, relation_line, retrieve_context
+from .graph_stats import get_stats as get_graph_stats, stats_cache
+from .graph_viewport import MAX_NODES as VIEWPORT_MAX_NODES, get_spatial_grid, viewport
+from .importer import GraphImporter
+from .json_stream import iter_json_array, iter_json_object
+from .line_formats import CONTENT_TYPE_FORMATS, LineFormatError, iter_records, split_records
+from .search_index import search_entities
+import csv
 import json
+import logging
+import math
 # 使用openai库调用ChatGPT API
 import openai
 
+logger = logging.getLogger(__name__)
+
+# 流式导出时每次从数据库游标读取的行数
+EXPORT_CHUNK_SIZE = getattr(settings, "KG_EXPORT_CHUNK_SIZE", 2000)
+
+# 外部AI（OpenAI 兼容接口）的请求头；密钥、地址、模型等见 settings 中的 CHATGPT_* 配置
+AI_DEFAULT_HEADERS = {"x-foo": "true"}
+
+
+def _iter_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    分块读取 values() 查询集（须含 id 列）。其它数据库用 .iterator() 的服务端游标；
+    MySQL（PyMySQL）的默认游标会把整个结果集读入客户端内存，改为按主键 keyset 分页，每次只取 chunk_size 行
+    """
+    if connection.vendor != "mysql":
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+    queryset = queryset.order_by("id")
+    last = None
+    while True:
+        page = list((queryset if last is None else queryset.filter(id__gt=last))[:chunk_size])
+        yield from page
+        if len(page) < chunk_size:
+            return
+        last = page[-1]["id"]
+
+
+def _build_graph_snapshot(domain):
+    """查询数据库并转换为D3.js可识别的格式（结果由快照缓存复用）"""
+    # 查询实体（如果指定了特定领域则过滤，否则返回所有）
+    if domain == 'all':
+        entities = Entity.objects.all().values("id", "name", "type", "description", "domain")
+        relations = Relationship.objects.all().values(
+            "id", "source_id", "target_id", "type", "description", "domain"
+        )
+    else:
+        entities = Entity.objects.filter(domain=domain).values("id", "name", "type", "description", "domain")
+        relations = Relationship.objects.filter(domain=domain).values(
+            "id", "source_id", "target_id", "type", "description", "domain"
+        )
+    # 最近一次计算的连通分量/社区标签（未计算过的实体为 None）
+    labels = community_labels(domain)
+    # 预计算的布局坐标（未布局的实体不带 x/y，d3 会把 null 当作 0）
+    coordinates = layout_coordinates(domain)
+    return {
+        "nodes": [
+            {
+                "id": e["id"],
+                "name": e["name"],
+                "type": e.get("type", ""),
+                "description": e.get("description", ""),
+                "domain": e.get("domain") or "default",
+                "component": labels.get(e["id"], (None, None))[0],
+                "community": labels.get(e["id"], (None, None))[1],
+                **(dict(zip(("x", "y"), coordinates[e["id"]])) if e["id"] in coordinates else {}),
+            } for e in entities
+        ],
+        "links": [
+            {
+                "source": r["source_id"],
+                "target": r["target_id"],
+                "type": r["type"],
+                "description": r.get("description", ""),
+                "id": r["id"],
+                "domain": r.get("domain") or "default"
+            } for r in relations
+        ]
+    }
+
+
+def _graph_snapshot(domain, derived):
+    """图谱及派生数据未变更时直接复用快照，不访问数据库（快照为共享对象，调用方不得修改）"""
+    return graph_snapshot_cache.get_or_build((domain, derived), lambda: _build_graph_snapshot(domain))
+
+
+def _request_graph_revision(request):
+    """同一请求内只查询一次修订号（etag_func、last_modified_func 与视图共用）"""
+    if not hasattr(request, "_kg_graph_revision"):
+        request._kg_graph_revision = get_payload_revision()
+    return request._kg_graph_revision
+
+
+def _graph_etag(resource):
+    """按 资源 + 领域 + 图谱修订号 + 派生数据修订号 生成强ETag"""
+    def etag_func(request, *args, **kwargs):
+        revision, derived, _ = _request_graph_revision(request)
+        return f"{resource}-{request.GET.get('domain', 'all')}-{revision}.{derived}"
+    return etag_func
+
+
+def _graph_last_modified(request, *args, **kwargs):
+    _, _, updated_at = _request_graph_revision(request)
+    return updated_at
+
+
+def _lod_response(request, domain):
+    try:
+        lod = min(max(int(request.GET["lod"]), 1), LOD_MAX_CLUSTERS)
+    except ValueError:
+        return _json_error("'lod' must be an integer")
+    group_by = request.GET.get("group_by", "community")
+    if group_by not in LOD_GROUP_BY:
+        return _json_error(f"'group_by' must be one of: {', '.join(LOD_GROUP_BY)}")
+    expand = request.GET.get("expand") or None
+
+    # 按社区分组时使用已保存的标签（可能已过期），读取从不触发计算
+    if group_by == "community" and stored_revision(domain) is None:
+        return _json_error(
+            "Community labels have not been computed for this domain; run the compute_kg_communities "
+            "command or POST /api/kg/analytics/communities first"
+        )
+    _, derived, _ = _request_graph_revision(request)
+    index = get_graph_index(domain)
+    view = cluster_view(get_cluster_assignment(index, group_by, derived), lod, expand)
+    if view is None:
+        return _json_error(f"Unknown cluster: {expand}")
+    return JsonResponse({"ret": 0, "data": view, "domain": domain})
+
+
+def _viewport_response(request, domain):
+    try:
+        bbox = [float(v) for v in request.GET["bbox"].split(",")]
+        zoom = float(request.GET["zoom"]) if request.GET.get("zoom") else None
+        limit = min(max(int(request.GET.get("limit", VIEWPORT_MAX_NODES)), 1), VIEWPORT_MAX_NODES)
+    except ValueError:
+        return _json_error("'bbox' must be x0,y0,x1,y1 and 'zoom' / 'limit' must be numbers")
+    if len(bbox) != 4 or not all(map(math.isfinite, bbox)) or (zoom is not None and not 0 < zoom < math.inf):
+        return _json_error("'bbox' must be x0,y0,x1,y1 and 'zoom' must be positive")
+
+    _, derived, _ = _request_graph_revision(request)
+    grid = get_spatial_grid(get_graph_index(domain), derived)
+    return JsonResponse({"ret": 0, "data": viewport(grid, bbox, zoom, limit), "domain": domain})
+
+
 @csrf_exempt  # 跨域请求时关闭CSRF验证
+@condition(etag_func=_graph_etag("data"), last_modified_func=_graph_last_modified)
 def get_graph_data(request): #获取知识图谱完整数据：实体+关系"""
     if request.method == 'GET':
         try:
             # 获取领域参数，默认为all（返回所有领域）
             domain = request.GET.get('domain', 'all')
-            
-            # 查询实体（如果指定了特定领域则过滤，否则返回所有）
-            if domain == 'all':
-                entities = Entity.objects.all().values("id", "name", "type", "description", "domain")
-                relations = Relationship.objects.all().values(
-                    "id", "source_id", "target_id", "type", "description", "domain"
-                )
-            else:
-                entities = Entity.objects.filter(domain=domain).values("id", "name", "type", "description", "domain")
-                relations = Relationship.objects.filter(domain=domain).values(
-                    "id", "source_id", "target_id", "type", "description", "domain"
-                )
-            # 转换为D3.js可识别的格式
-            graph_data = {
-                "nodes": [
-                    {
-                        "id": e["id"],
-                        "name": e["name"],
-                        "type": e.get("type", ""),
-                        "description": e.get("description", ""),
-                        "domain": e.get("domain") or "default"
-                    } for e in entities
-                ],
-                "links": [
-                    {
-                        "source": r["source_id"],
-                        "target": r["target_id"],
-                        "type": r["type"],
-                        "description": r.get("description", ""),
-                        "id": r["id"],
-                        "domain": r.get("domain") or "default"
-                    } for r in relations
-                ]
-            }
-            
+
+            # 分层细节：只返回聚合后的超级节点（见 graph_lod.py）
+            if request.GET.get('lod'):
+                return _lod_response(request, domain)
+            # 视口查询：只返回矩形内的节点（见 graph_viewport.py）
+            if request.GET.get('bbox'):
+                return _viewport_response(request, domain)
+
+            _, derived, _ = _request_graph_revision(request)
+            graph_data = _graph_snapshot(domain, derived)
+
             # 添加调试信息
-            print(f"后端返回数据 - 领域: {domain}, 实体数: {len(graph_data['nodes'])}, 关系数: {len(graph_data['links'])}")
-            print(f"实体领域分布: {[e.get('domain', 'default') for e in entities]}")
-            print(f"关系领域分布: {[r.get('domain', 'default') for r in relations]}")
-            
+            logger.debug("后端返回数据 - 领域: %s, 实体数: %d, 关系数: %d",
+                         domain, len(graph_data["nodes"]), len(graph_data["links"]))
+
             return JsonResponse({"ret": 0, "data": graph_data, "domain": domain})
         except Exception as e:
             return JsonResponse({"ret": 1, "msg": f"Finding data failed: {str(e)}"})
@@ -90,20 +228,109 @@ def add_entity(request):
 # Entity CRUD
 # -----------------------------
 
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 200
+LIST_MAX_LIMIT = getattr(settings, "KG_LIST_MAX_LIMIT", 5000)
+NEIGHBORHOOD_MAX_DEPTH = 5
+NEIGHBORHOOD_MAX_NODES = 2000
+NEIGHBORHOOD_MAX_FANOUT = 1000
+PATH_MAX_DEPTH = 10
+PATH_MAX_PATHS = 100
+
+# 列表接口的输出字段 -> 数据库字段
+ENTITY_LIST_FIELDS = {"id": "id", "name": "name", "type": "type", "description": "description", "domain": "domain"}
+RELATIONSHIP_LIST_FIELDS = {
+    "id": "id", "source": "source_id", "target": "target_id",
+    "type": "type", "description": "description", "domain": "domain",
+}
+
+
 def _json_error(message):
     return JsonResponse({"ret": 1, "msg": message})
 
 
+def _requested_fields(request, field_map):
+    """解析 fields=a,b；未指定时为全部字段，含未知字段时抛出 ValueError"""
+    fields = [f.strip() for f in request.GET.get("fields", "").split(",") if f.strip()] or list(field_map)
+    unknown = [f for f in fields if f not in field_map]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def _list_response(request, queryset, field_map, parse_key=str):
+    """
+    列表接口的分页与序列化（主键为游标）
+
+    - fields=a,b：只返回指定字段
+    - limit=N&after=<游标>：按主键的 keyset 分页，返回 next 游标（没有下一页时为 null）
+    - 不带 limit：按主键顺序流式输出全部结果，内存占用与结果规模无关
+    """
+    try:
+        fields = _requested_fields(request, field_map)
+    except ValueError as e:
+        return _json_error(str(e))
+    columns = list(dict.fromkeys([field_map[f] for f in fields] + ["id"]))
+
+    def rows(values):
+        for row in values:
+            yield {f: row[field_map[f]] for f in fields}
+
+    queryset = queryset.order_by("id").values(*columns)
+    limit = request.GET.get("limit")
+    if limit is None:
+        body = iter_json_object([
+            ("ret", 0),
+            ("data", iter_json_array(rows(_iter_rows(queryset)), EXPORT_CHUNK_SIZE)),
+        ])
+        return StreamingHttpResponse(body, content_type="application/json")
+
+    try:
+        limit = min(max(int(limit), 1), LIST_MAX_LIMIT)
+        after = request.GET.get("after")
+        if after not in (None, ""):
+            queryset = queryset.filter(id__gt=parse_key(after))
+    except ValueError:
+        return _json_error("'limit' and 'after' must be valid cursors")
+    page = list(queryset[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    return JsonResponse({
+        "ret": 0,
+        "data": list(rows(page)),
+        "next": page[-1]["id"] if has_more else None,
+    })
+
+
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
 def list_or_create_entities(request):
     if request.method == "GET":
         q = request.GET.get("q", "").strip().lower()
+        domain = request.GET.get("domain")
         queryset = Entity.objects.all()
+        if domain:
+            queryset = queryset.filter(domain=domain)
         if q:
+            try:
+                limit = min(max(int(request.GET.get("limit", SEARCH_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+                offset = max(int(request.GET.get("offset", 0)), 0)
+            except ValueError:
+                return _json_error("'limit' and 'offset' must be integers")
+            try:
+                fields = _requested_fields(request, ENTITY_LIST_FIELDS)
+            except ValueError as e:
+                return _json_error(str(e))
+            # 走 n-gram 倒排索引，按相关度排序分页
+            found = search_entities(
+                q, limit=limit, offset=offset, domain=domain, fields=[ENTITY_LIST_FIELDS[f] for f in fields]
+            )
+            if found is not None:
+                results, total = found
+                return JsonResponse({"ret": 0, "data": results, "total": total, "limit": limit, "offset": offset})
+            # 查询中没有可索引的字符（如只有标点），回退到子串匹配
             queryset = queryset.filter(models.Q(id__icontains=q) | models.Q(name__icontains=q) | models.Q(description__icontains=q))
-        data = list(queryset.values("id", "name", "type", "description", "domain"))
-        return JsonResponse({"ret": 0, "data": data})
+        return _list_response(request, queryset, ENTITY_LIST_FIELDS)
 
     # POST create
     try:
@@ -175,8 +402,9 @@ def entity_detail(request, entity_id: str):
     )
     relationship_count = related_relationships.count()
     
-    # 删除实体（会自动级联删除相关关系）
-    entity.delete()
+    # 删除实体（会自动级联删除相关关系；逐行的 post_delete 信号合并为一次失效）
+    with transaction.atomic(), deferred_invalidation():
+        entity.delete()
     
     return JsonResponse({
         "ret": 0, 
@@ -185,6 +413,242 @@ def entity_detail(request, entity_id: str):
     })
 
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def entity_neighborhood(request, entity_id: str):
+    """k 跳邻域：?depth=k&limit=n&fanout=m&types=a,b&domain=x"""
+    try:
+        depth = min(max(int(request.GET.get("depth", 1)), 1), NEIGHBORHOOD_MAX_DEPTH)
+        limit = min(max(int(request.GET.get("limit", 200)), 1), NEIGHBORHOOD_MAX_NODES)
+        fanout = min(max(int(request.GET.get("fanout", 50)), 1), NEIGHBORHOOD_MAX_FANOUT)
+    except ValueError:
+        return _json_error("'depth', 'limit' and 'fanout' must be integers")
+    types = [t.strip() for t in request.GET.get("types", "").split(",") if t.strip()]
+
+    data = neighborhood(entity_id, depth=depth, limit=limit, fanout=fanout, types=types,
+                        domain=request.GET.get("domain"))
+    if data is None:
+        return _json_error("entity not found")
+    return JsonResponse({"ret": 0, "data": data})
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def find_path(request):
+    """
+    两个实体之间的路径：?from=a&to=b&max_depth=k&types=x,y&domain=d
+    默认返回最短路径（双向 BFS）；all=1 时返回不超过 k 跳的全部简单路径（最多 max_paths 条）
+    """
+    source = request.GET.get("from")
+    target = request.GET.get("to")
+    if not source or not target:
+        return _json_error("'from' and 'to' are required")
+    try:
+        max_depth = min(max(int(request.GET.get("max_depth", 6)), 1), PATH_MAX_DEPTH)
+        max_paths = min(max(int(request.GET.get("max_paths", 10)), 1), PATH_MAX_PATHS)
+        budget = request.GET.get("budget")
+        budget = min(max(int(budget), 1), PATH_EXPANSION_BUDGET) if budget else None
+    except ValueError:
+        return _json_error("'max_depth', 'max_paths' and 'budget' must be integers")
+    types = [t.strip() for t in request.GET.get("types", "").split(",") if t.strip()]
+    domain = request.GET.get("domain") or "all"
+
+    # 读取修订号以同步其它进程的写入，保证 CSR 索引不过期
+    get_graph_revision()
+    index, index_ms = timed(get_graph_index, domain)
+    search = PathSearch(index, types=types, budget=budget)
+    if request.GET.get("all") in ("1", "true"):
+        found, search_ms = timed(search.all_paths, source, target, max_depth, max_paths)
+    else:
+        path, search_ms = timed(search.shortest_path, source, target, max_depth)
+        found = [path] if path else []
+
+    node_ids = {node_id for nodes, _ in found for node_id in nodes}
+    edge_ids = {edge_id for _, edges in found for edge_id in edges}
+    entities = Entity.objects.in_bulk(list(node_ids))
+    relations = Relationship.objects.in_bulk(list(edge_ids))
+    paths = [
+        {
+            "length": len(edges),
+            "nodes": [
+                {"id": e.id, "name": e.name, "type": e.type, "domain": e.domain}
+                for e in (entities.get(node_id) for node_id in nodes) if e is not None
+            ],
+            "links": [
+                {"id": r.id, "source": r.source_id, "target": r.target_id, "type": r.type,
+                 "description": r.description}
+                for r in (relations.get(edge_id) for edge_id in edges) if r is not None
+            ],
+        }
+        for nodes, edges in found
+    ]
+    return JsonResponse({
+        "ret": 0,
+        "data": {
+            "found": bool(paths),
+            "paths": paths,
+            "expanded": search.expanded,
+            "budget_exhausted": search.budget_exhausted,
+            "timing_ms": {"index": index_ms, "search": search_ms},
+        }
+    })
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def centrality(request):
+    """
+    节点中心性：?domain=d&metric=pagerank|degree|betweenness&limit=n&sample=k
+    返回分值最高的 limit 个实体；betweenness 在节点数超过 sample 时为抽样近似值
+    （sample 不超过 KG_BETWEENNESS_MAX_SAMPLE）
+    """
+    metric = request.GET.get("metric", "pagerank")
+    if metric not in CENTRALITY_METRICS:
+        return _json_error(f"'metric' must be one of: {', '.join(CENTRALITY_METRICS)}")
+    try:
+        limit = min(max(int(request.GET.get("limit", 100)), 1), LIST_MAX_LIMIT)
+        sample = min(max(int(request.GET.get("sample", BETWEENNESS_SAMPLE)), 1), BETWEENNESS_MAX_SAMPLE)
+    except ValueError:
+        return _json_error("'limit' and 'sample' must be integers")
+    domain = request.GET.get("domain") or "all"
+
+    get_graph_revision()
+    index, index_ms = timed(get_graph_index, domain)
+    (scores, info), compute_ms = timed(get_centrality, index, metric, sample)
+
+    top = scores.argsort()[::-1][:limit].tolist() if len(scores) else []
+    names = dict(Entity.objects.filter(id__in=[index.ids[i] for i in top]).values_list("id", "name"))
+    degree = index.offsets
+    return JsonResponse({
+        "ret": 0,
+        "data": {
+            "metric": metric,
+            "domain": domain,
+            "node_count": index.node_count,
+            "edge_count": index.edge_count,
+            "nodes": [
+                {
+                    "id": index.ids[i],
+                    "name": names.get(index.ids[i], index.ids[i]),
+                    "score": float(scores[i]),
+                    "degree": int(degree[i + 1] - degree[i]),
+                }
+                for i in top
+            ],
+            **info,
+            "timing_ms": {"index": index_ms, "compute": compute_ms},
+        }
+    })
+
+
+def _http_compute_guard(request, domain, max_nodes, what, command):
+    """在请求线程中同步计算派生数据前的检查：只对管理员开放，且范围内的实体数不超过 max_nodes；通过时返回 None"""
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return JsonResponse({"ret": 1, "msg": f"Computing {what} requires a staff account"}, status=403)
+    entities = Entity.objects.all() if domain == "all" else Entity.objects.filter(domain=domain)
+    node_count = entities.count()
+    if node_count > max_nodes:
+        return _json_error(
+            f"{node_count} entities exceed the limit of {max_nodes} for {what} computed over HTTP; "
+            f"run the {command} command instead"
+        )
+    return None
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def communities(request):
+    """
+    连通分量与社区：GET ?domain=d&limit=n&community=c 返回已保存的结果（图谱有写入后 stale 为 true），
+    指定 community 时同时返回该社区的成员（最多 limit 个）；
+    POST ?domain=d 在结果缺失或过期时重新计算（同一范围的并发请求只计算一次）；与布局相同，POST 只对管理员开放，
+    且范围内的实体数不超过 KG_COMMUNITY_HTTP_MAX_NODES，更大的图谱用 compute_kg_communities 命令
+    """
+    try:
+        limit = min(max(int(request.GET.get("limit", 100)), 1), LIST_MAX_LIMIT)
+        community = request.GET.get("community")
+        community = int(community) if community not in (None, "") else None
+    except ValueError:
+        return _json_error("'limit' and 'community' must be integers")
+    domain = request.GET.get("domain") or "all"
+
+    recomputed, compute_ms = False, 0.0
+    if request.method == "POST":
+        denied = _http_compute_guard(request, domain, COMMUNITY_HTTP_MAX_NODES, "communities", "compute_kg_communities")
+        if denied:
+            return denied
+        (_, recomputed), compute_ms = timed(ensure_communities, domain)
+    current, _ = get_graph_revision()
+    revision = stored_revision(domain)
+    data = {
+        "domain": domain,
+        "revision": revision,
+        "stale": revision is None or revision != current,
+        "recomputed": recomputed,
+        **community_summary(domain, limit),
+        "timing_ms": compute_ms,
+    }
+    if community is not None:
+        data["members"] = community_members(domain, community, limit)
+    return JsonResponse({"ret": 0, "data": data})
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def layout(request):
+    """
+    预计算布局：GET ?domain=d 查看布局状态；POST ?domain=d[&full=1] 计算并保存（默认增量）。
+    布局在请求线程中同步计算，POST 只对管理员开放，且范围内的实体数不超过 KG_LAYOUT_HTTP_MAX_NODES；
+    更大的图谱用 compute_kg_layout 命令离线计算。坐标随 get_graph_data 的节点返回（x / y）
+    """
+    domain = request.GET.get("domain") or "all"
+    if request.method == "POST":
+        denied = _http_compute_guard(request, domain, LAYOUT_HTTP_MAX_NODES, "a layout", "compute_kg_layout")
+        if denied:
+            return denied
+        full = request.GET.get("full") in ("1", "true")
+        result, elapsed_ms = timed(compute_layout, domain, full=full)
+        return JsonResponse({"ret": 0, "data": dict(result, domain=domain, timing_ms=elapsed_ms)})
+
+    revision, _ = get_graph_revision()
+    coordinates, meta = stored_layout(domain)
+    return JsonResponse({
+        "ret": 0,
+        "data": {
+            "domain": domain,
+            "nodes": len(coordinates),
+            "revision": meta[0] if meta else None,
+            "computed_at": meta[1] if meta else None,
+            "stale": meta is None or meta[0] != revision,
+        }
+    })
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_stats(request):
+    """
+    图谱统计：?domain=d，按领域/实体类型/关系类型的计数与度数分布（按图谱版本缓存），
+    以及各内存缓存的命中情况
+    """
+    domain = request.GET.get("domain") or "all"
+    get_graph_revision()
+    stats, elapsed_ms = timed(get_graph_stats, domain)
+    return JsonResponse({
+        "ret": 0,
+        "data": {
+            **stats,
+            "caches": {
+                "snapshot": graph_snapshot_cache.stats(),
+                "graph_index": graph_index_cache.stats(),
+                "stats": stats_cache.stats(),
+                "ai_chat": chat_response_cache.stats(),
+            },
+            "timing_ms": elapsed_ms,
+        }
+    })
+
+
 # -----------------------------
 # Relationship CRUD
 # -----------------------------
@@ -196,6 +660,7 @@ def list_or_create_relationships(request):
         source = request.GET.get("source")
         target = request.GET.get("target")
         rel_type = request.GET.get("type")
+        domain = request.GET.get("domain")
 
         qs = Relationship.objects.all()
         if source:
@@ -204,19 +669,10 @@ def list_or_create_relationships(request):
             qs = qs.filter(target_id=target)
         if rel_type:
             qs = qs.filter(type__icontains=rel_type)
+        if domain:
+            qs = qs.filter(domain=domain)
 
-        data = [
-            {
-                "id": r.id,
-                "source": r.source_id,
-                "target": r.target_id,
-                "type": r.type,
-                "description": r.description,
-                "domain": r.domain,
-            }
-            for r in qs
-        ]
-        return JsonResponse({"ret": 0, "data": data})
+        return _list_response(request, qs, RELATIONSHIP_LIST_FIELDS, parse_key=int)
 
     # POST create relationship
     try:
@@ -319,7 +775,8 @@ def relationship_detail(request, rel_id: int):
             return JsonResponse({"ret": 0, "msg": "no changes"})
 
     # DELETE
-    rel.delete()
+    with deferred_invalidation():
+        rel.delete()
     return JsonResponse({"ret": 0, "msg": "deleted"})
 
 
@@ -329,39 +786,52 @@ def relationship_detail(request, rel_id: int):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@condition(etag_func=_graph_etag("export"), last_modified_func=_graph_last_modified)
 def export_graph(request):
     # 获取领域参数，默认为all（导出所有领域）
     domain = request.GET.get('domain', 'all')
-    
-    if domain == 'all':
-        entities = list(Entity.objects.all().values("id", "name", "type", "description", "domain"))
-        links = [
-            {
-                "id": r.id,
-                "source": r.source_id,
-                "target": r.target_id,
-                "type": r.type,
-                "description": r.description,
-            }
-            for r in Relationship.objects.all()
-        ]
-    else:
-        entities = list(Entity.objects.filter(domain=domain).values("id", "name", "type", "description", "domain"))
-        links = [
-            {
-                "id": r.id,
-                "source": r.source_id,
-                "target": r.target_id,
-                "type": r.type,
-                "description": r.description,
+
+    entities = Entity.objects.all()
+    relationships = Relationship.objects.all()
+    if domain != 'all':
+        entities = entities.filter(domain=domain)
+        relationships = relationships.filter(domain=domain)
+    entities = entities.values("id", "name", "type", "description", "domain")
+    relationships = relationships.values("id", "source_id", "target_id", "type", "description")
+
+    def link_rows(rows):
+        for r in rows:
+            yield {
+                "id": r["id"],
+                "source": r["source_id"],
+                "target": r["target_id"],
+                "type": r["type"],
+                "description": r["description"],
             }
-            for r in Relationship.objects.filter(domain=domain)
-        ]
+
+    # 流式导出：分块读取并逐块输出，内存占用只与 chunk_size 相关（MySQL 上按主键分页读取，见 _iter_rows）
+    if request.GET.get('stream') in ('1', 'true'):
+        try:
+            chunk_size = int(request.GET.get('chunk_size') or EXPORT_CHUNK_SIZE)
+        except ValueError:
+            return _json_error("'chunk_size' must be an integer")
+        chunk_size = max(1, chunk_size)
+        body = iter_json_object([
+            ("ret", 0),
+            ("data", iter_json_object([
+                # 去掉默认排序，避免数据库为游标做全表排序
+                ("nodes", iter_json_array(_iter_rows(entities.order_by(), chunk_size), chunk_size)),
+                ("links", iter_json_array(link_rows(_iter_rows(relationships.order_by(), chunk_size)), chunk_size)),
+            ])),
+            ("domain", domain),
+        ])
+        return StreamingHttpResponse(body, content_type="application/json")
+
     return JsonResponse({
         "ret": 0, 
         "data": {
-            "nodes": entities, 
-            "links": links
+            "nodes": list(entities), 
+            "links": list(link_rows(relationships))
         },
         "domain": domain
     })
@@ -377,14 +847,24 @@ def import_graph(request):
     2. ID冲突解决（自动生成新ID或合并数据）
     3. 详细的导入报告
     4. 数据合并策略
+    5. NDJSON / CSV 格式（Content-Type: application/x-ndjson 或 text/csv，导入参数放在查询字符串中）
     """
-    try:
-        payload = json.loads(request.body or b"{}")
-    except json.JSONDecodeError:
-        return _json_error("Invalid JSON")
+    fmt = CONTENT_TYPE_FORMATS.get(request.content_type, "json")
+    if fmt == "json":
+        try:
+            payload = json.loads(request.body or b"{}")
+        except json.JSONDecodeError:
+            return _json_error("Invalid JSON")
+        nodes = payload.get("nodes", [])
+        links = payload.get("links", [])
+    else:
+        # 逐行读取请求体
+        payload = request.GET
+        try:
+            nodes, links = split_records(iter_records((line.decode("utf-8") for line in request), fmt))
+        except (LineFormatError, UnicodeDecodeError, csv.Error) as e:
+            return _json_error(f"Invalid {fmt.upper()} data: {e}")
 
-    nodes = payload.get("nodes", [])
-    links = payload.get("links", [])
     import_strategy = payload.get("strategy", "merge")  # merge, skip, overwrite, create_new
     domain = payload.get("domain", "default")
     conflict_resolution = payload.get("conflict_resolution", "auto_id")  # auto_id, merge_data, skip
@@ -392,178 +872,22 @@ def import_graph(request):
     if not isinstance(nodes, list) or not isinstance(links, list):
         return _json_error("'nodes' and 'links' must be arrays")
 
-    # 导入统计
-    import_stats = {
-        "entities": {"created": 0, "updated": 0, "skipped": 0, "conflicts": 0, "errors": 0},
-        "relationships": {"created": 0, "skipped": 0, "errors": 0},
-        "conflicts": []
-    }
-
-    # 处理实体导入
-    entity_id_mapping = {}  # 用于记录ID映射关系
-    
-    for node in nodes:
-        node_id = node.get("id")
-        name = node.get("name")
-        
-        if not node_id or not name:
-            import_stats["entities"]["errors"] += 1
-            continue
-
-        try:
-            # 检查是否存在相同ID的实体
-            existing_entity = Entity.objects.filter(id=node_id).first()
-            
-            if existing_entity:
-                # 处理冲突
-                if conflict_resolution == "skip":
-                    import_stats["entities"]["skipped"] += 1
-                    entity_id_mapping[node_id] = node_id
-                    continue
-                elif conflict_resolution == "merge_data":
-                    # 合并数据：保留现有数据，补充缺失字段
-                    updated = False
-                    if not existing_entity.type and node.get("type"):
-                        existing_entity.type = node.get("type")
-                        updated = True
-                    if not existing_entity.description and node.get("description"):
-                        existing_entity.description = node.get("description")
-                        updated = True
-                    if updated:
-                        existing_entity.save()
-                        import_stats["entities"]["updated"] += 1
-                    else:
-                        import_stats["entities"]["skipped"] += 1
-                    entity_id_mapping[node_id] = node_id
-                    continue
-                elif conflict_resolution == "auto_id":
-                    # 自动生成新ID
-                    import_stats["entities"]["conflicts"] += 1
-                    import_stats["conflicts"].append({
-                        "type": "entity_id_conflict",
-                        "original_id": node_id,
-                        "message": f"Entity ID '{node_id}' already exists, will generate new ID"
-                    })
-                    
-                    # 生成新ID
-                    counter = 1
-                    new_id = f"{node_id}_{counter}"
-                    while Entity.objects.filter(id=new_id).exists():
-                        counter += 1
-                        new_id = f"{node_id}_{counter}"
-                    
-                    # 创建新实体
-                    new_entity = Entity.objects.create(
-                        id=new_id,
-                        name=name,
-                        type=node.get("type", ""),
-                        description=node.get("description", ""),
-                        domain=node.get("domain", domain)
-                    )
-                    entity_id_mapping[node_id] = new_id
-                    import_stats["entities"]["created"] += 1
-                    continue
-            else:
-                # 创建新实体
-                try:
-                    Entity.objects.create(
-                        id=node_id,
-                        name=name,
-                        type=node.get("type", ""),
-                        description=node.get("description", ""),
-                        domain=node.get("domain", domain)
-                    )
-                    entity_id_mapping[node_id] = node_id
-                    import_stats["entities"]["created"] += 1
-                except Exception as e:
-                    # 如果创建失败，可能是并发问题，尝试获取现有实体
-                    existing_entity = Entity.objects.filter(id=node_id).first()
-                    if existing_entity:
-                        entity_id_mapping[node_id] = node_id
-                        import_stats["entities"]["skipped"] += 1
-                    else:
-                        import_stats["entities"]["errors"] += 1
-                        import_stats["conflicts"].append({
-                            "type": "entity_creation_error",
-                            "entity_id": node_id,
-                            "message": str(e)
-                        })
-                
-        except Exception as e:
-            import_stats["entities"]["errors"] += 1
-            import_stats["conflicts"].append({
-                "type": "entity_creation_error",
-                "entity_id": node_id,
-                "message": str(e)
-            })
-
-    # 处理关系导入
-    for link in links:
-        source = link.get("source")
-        target = link.get("target")
-        rel_type = link.get("type")
-        description = link.get("description", "")
-        
-        if not source or not target or not rel_type:
-            import_stats["relationships"]["errors"] += 1
-            continue
-            
-        if source == target:
-            import_stats["relationships"]["errors"] += 1
-            continue
-
-        try:
-            # 使用映射后的ID
-            mapped_source = entity_id_mapping.get(source)
-            mapped_target = entity_id_mapping.get(target)
-            
-            if not mapped_source or not mapped_target:
-                import_stats["relationships"]["errors"] += 1
-                continue
+    try:
+        batch_size = int(payload.get("batch_size") or 0) or None
+    except (TypeError, ValueError):
+        return _json_error("'batch_size' must be an integer")
+
+    # 批量导入：每块一次批量查询 + bulk_create/bulk_update
+    importer = GraphImporter(
+        domain=domain,
+        strategy=import_strategy,
+        conflict_resolution=conflict_resolution,
+        batch_size=batch_size,
+    )
+    import_stats = importer.run(nodes, links)
+    entity_id_mapping = importer.entity_id_mapping
 
-            src = Entity.objects.get(id=mapped_source)
-            tgt = Entity.objects.get(id=mapped_target)
-            
-            # 检查关系是否已存在
-            existing_rel = Relationship.objects.filter(
-                source=src, target=tgt, type=rel_type
-            ).first()
-            
-            if existing_rel:
-                if import_strategy == "skip":
-                    import_stats["relationships"]["skipped"] += 1
-                elif import_strategy == "merge":
-                    # 合并关系描述
-                    if not existing_rel.description and description:
-                        existing_rel.description = description
-                        existing_rel.save()
-                        import_stats["relationships"]["created"] += 1  # 算作更新
-                    else:
-                        import_stats["relationships"]["skipped"] += 1
-            else:
-                # 创建新关系
-                Relationship.objects.create(
-                    source=src, target=tgt, type=rel_type, 
-                    description=description, domain=link.get("domain", domain)
-                )
-                import_stats["relationships"]["created"] += 1
-                
-        except Entity.DoesNotExist:
-            import_stats["relationships"]["errors"] += 1
-            import_stats["conflicts"].append({
-                "type": "relationship_entity_not_found",
-                "source": source,
-                "target": target,
-                "message": "Source or target entity not found"
-            })
-        except Exception as e:
-            import_stats["relationships"]["errors"] += 1
-            import_stats["conflicts"].append({
-                "type": "relationship_creation_error",
-                "source": source,
-                "target": target,
-                "message": str(e)
-            })
+    invalidate_graph()
 
     return JsonResponse({
         "ret": 0, 
@@ -585,21 +909,54 @@ def ai_chat(request):
     try:
         data = json.loads(request.body or b"{}")
         user_message = data.get("message", "")
-        graph_data = data.get("graphData", {})
-        current_domain = data.get("currentDomain", "all")
-        selected_node = data.get("selectedNode", None)
-        selected_link = data.get("selectedLink", None)
+        current_domain = data.get("currentDomain") or "all"
         use_external_ai = data.get("useExternalAI", True)  # 默认使用外部AI
+        # stream=true 时以 Server-Sent Events 逐段返回回复
+        stream = bool(data.get("stream")) or request.GET.get("stream") == "true"
         
         if not user_message:
             return JsonResponse({"ret": 1, "msg": "消息不能为空"})
         
-        # 生成AI回复
-        ai_response = generate_ai_response(user_message, graph_data, current_domain, selected_node, selected_link, use_external_ai)
+        # 回复缓存（见 chat_cache.py）：上传 graphData 的旧客户端不缓存
+        key = revision = None
+        if not data.get("graphData"):
+            key = _chat_cache_key(data, user_message, current_domain, use_external_ai)
+            revision, _, _ = _request_graph_revision(request)
+            if data.get("noCache"):
+                chat_response_cache.bypass()
+            else:
+                cached = chat_response_cache.get(key, revision)
+                if cached is not None:
+                    if stream:
+                        return _sse_response(_sse_chat(iter([cached]), cached=True))
+                    return JsonResponse({"ret": 0, "response": cached, "cached": True})
+        
+        graph_data, assistant_index, selected_node, selected_link = _chat_context(request, data, current_domain)
+        
+        # 生成AI回复；外部AI失败时的本地兜底回复不缓存
+        try:
+            ai_response = generate_ai_response(user_message, graph_data, current_domain, selected_node,
+                                               selected_link, use_external_ai, assistant_index=assistant_index,
+                                               fallback=key is None, stream=stream)
+        except Exception:
+            key = None
+            ai_response = generate_local_ai_response(user_message, graph_data, current_domain, selected_node,
+                                                     selected_link, assistant_index)
+            if stream:
+                ai_response = iter([ai_response])
+        
+        def store(answer):
+            if key is not None:
+                chat_response_cache.set(key, revision, answer)
+        
+        if stream:
+            return _sse_response(_sse_chat(ai_response, on_complete=store))
+        store(ai_response)
         
         return JsonResponse({
             "ret": 0,
-            "response": ai_response
+            "response": ai_response,
+            "cached": False
         })
         
     except json.JSONDecodeError:
@@ -608,74 +965,119 @@ def ai_chat(request):
         return JsonResponse({"ret": 1, "msg": f"AI聊天失败: {str(e)}"})
 
 
-def generate_ai_response(user_message, graph_data, current_domain, selected_node, selected_link, use_external_ai=True):
-    """生成AI回复"""
+def _sse_event(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _sse_chat(deltas, on_complete=None, cached=False):
+    """
+    回复的增量文本 -> Server-Sent Events：每段一个 {"type": "delta", "content"} 事件，
+    结束时 {"type": "done", "cached"}；中途出错时 {"type": "error", "msg"}，不调用 on_complete
+    """
+    parts = []
+    try:
+        for delta in deltas:
+            parts.append(delta)
+            yield _sse_event({"type": "delta", "content": delta})
+    except Exception as e:
+        yield _sse_event({"type": "error", "msg": f"AI聊天失败: {str(e)}"})
+        return
+    if on_complete is not None:
+        on_complete("".join(parts))
+    yield _sse_event({"type": "done", "cached": cached})
+
+
+def _sse_response(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream; charset=utf-8")
+    # 禁止代理缓冲，事件到达即转发
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _chat_cache_key(data, user_message, current_domain, use_external_ai):
+    node_id = data.get("selectedNodeId") or (data.get("selectedNode") or {}).get("id")
+    link_id = data.get("selectedLinkId") or (data.get("selectedLink") or {}).get("id")
+    return chat_cache_key(user_message, current_domain, node_id, link_id, use_external_ai)
+
+
+def _chat_context(request, data, current_domain):
+    """
+    聊天上下文：请求只需携带 currentDomain 与 selectedNodeId / selectedLinkId，
+    图谱内容取自快照缓存，选中的实体/关系按主键从数据库读取；
+    旧客户端上传的 graphData / selectedNode / selectedLink 仍然可用。
+    返回 (graph_data, 本地助手索引, selected_node, selected_link)，快照的索引随图谱版本缓存
+    """
+    graph_data = data.get("graphData")
+    if graph_data:
+        assistant_index = get_assistant_index(graph_data)
+    else:
+        _, derived, _ = _request_graph_revision(request)
+        graph_data = _graph_snapshot(current_domain, derived)
+        assistant_index = get_assistant_index(graph_data, current_domain)
+
+    selected_node = data.get("selectedNode")
+    if data.get("selectedNodeId"):
+        selected_node = Entity.objects.filter(id=str(data["selectedNodeId"])).values(
+            "id", "name", "type", "description", "domain"
+        ).first() or selected_node
+
+    selected_link = data.get("selectedLink")
+    link_id = data.get("selectedLinkId")
+    if link_id is not None and str(link_id).isdigit():
+        row = Relationship.objects.filter(pk=int(link_id)).values(
+            "id", "source_id", "target_id", "type", "description", "domain"
+        ).first()
+        if row:
+            selected_link = {
+                "id": row["id"],
+                "source": row["source_id"],
+                "target": row["target_id"],
+                "type": row["type"],
+                "description": row["description"],
+                "domain": row["domain"] or "default",
+            }
+    return graph_data, assistant_index, selected_node, selected_link
+
+
+def _ai_setting(name):
+    """外部AI配置：settings.CHATGPT_API_KEY、CHATGPT_BASE_URL、CHATGPT_MODEL 等（可由环境变量设置）"""
+    return getattr(settings, f"CHATGPT_{name}")
+
+
+def _iter_deltas(stream):
+    """流式补全中的增量文本"""
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def generate_ai_response(user_message, graph_data, current_domain, selected_node, selected_link, use_external_ai=True,
+                         assistant_index=None, fallback=True, stream=False):
+    """
+    生成AI回复；fallback=False 时外部AI调用失败直接抛出异常，由调用方处理。
+    stream=True 时返回增量文本的迭代器：外部AI逐段返回，本地回复为一整段
+    """
     # 根据开关决定使用外部AI还是本地AI
     if not use_external_ai:
-        return generate_local_ai_response(user_message, graph_data, current_domain, selected_node, selected_link)
+        answer = generate_local_ai_response(user_message, graph_data, current_domain, selected_node, selected_link,
+                                            assistant_index)
+        return iter([answer]) if stream else answer
     
     try:    
-        # 设置API配置
-        openai.api_key = 'sk-jaRSXNMxl1xdjOzu5e8e780c79Ee40D99aE43c0b74A90fF6'
-        openai.base_url = "https://free.v36.cm/v1/"
-        openai.default_headers = {"x-foo": "true"}
-        
-        # 构建丰富的上下文信息
-        nodes = graph_data.get('nodes', [])
-        links = graph_data.get('links', [])
-        
-        # 统计信息
-        total_nodes = len(nodes)
-        total_links = len(links)
-        
-        # 领域统计
-        domain_stats = {}
-        for node in nodes:
-            domain = node.get('domain', 'default')
-            domain_stats[domain] = domain_stats.get(domain, 0) + 1
-        
-        # 关系类型统计
-        relation_types = {}
-        for link in links:
-            rel_type = link.get('type', '未知')
-            relation_types[rel_type] = relation_types.get(rel_type, 0) + 1
-        
-        # 构建实体列表（限制数量避免过长）
-        entity_list = []
-        for node in nodes[:20]:  # 最多显示20个实体
-            entity_info = f"{node.get('name', '')} (ID: {node.get('id', '')})"
-            if node.get('description'):
-                entity_info += f" - {node.get('description', '')[:50]}"
-            if node.get('domain') and node.get('domain') != 'default':
-                entity_info += f" [领域: {node.get('domain')}]"
-            entity_list.append(entity_info)
-        
-        # 构建关系列表（限制数量避免过长）
-        link_list = []
-        for link in links[:15]:  # 最多显示15个关系
-            source_name = ""
-            target_name = ""
-            
-            # 获取源实体名称
-            if isinstance(link.get('source'), dict):
-                source_name = link['source'].get('name', '')
-            else:
-                source_id = link.get('source', '')
-                source_node = next((n for n in nodes if n.get('id') == source_id), None)
-                source_name = source_node.get('name', source_id) if source_node else source_id
-            
-            # 获取目标实体名称
-            if isinstance(link.get('target'), dict):
-                target_name = link['target'].get('name', '')
-            else:
-                target_id = link.get('target', '')
-                target_node = next((n for n in nodes if n.get('id') == target_id), None)
-                target_name = target_node.get('name', target_id) if target_node else target_id
-            
-            link_info = f"{source_name} --[{link.get('type', '')}]--> {target_name}"
-            if link.get('description'):
-                link_info += f" ({link.get('description', '')[:30]})"
-            link_list.append(link_info)
+        # 设置API配置（OpenAI 兼容接口，可在 settings 中覆盖）
+        openai.api_key = _ai_setting("API_KEY")
+        openai.base_url = _ai_setting("BASE_URL")
+        openai.default_headers = AI_DEFAULT_HEADERS
+        
+        # 按问题检索相关实体及其 1 跳邻居，在 token 预算内构建上下文（见 graph_retrieval.py）
+        index = assistant_index or get_assistant_index(graph_data)
+        total_nodes = index.total_nodes
+        total_links = index.total_links
+        entity_list, link_list, retrieval = retrieve_context(index, user_message, selected_node)
+        domain_lines = distribution_lines(index.domain_stats, "个实体")
+        relation_type_lines = distribution_lines(index.relation_types, "个关系")
+        entity_scope = "关系最多" if retrieval["fallback"] else "与问题最相关"
         
         # 构建完整的上下文信息
         context = f"""
@@ -687,29 +1089,23 @@ def generate_ai_response(user_message, graph_data, current_domain, selected_node
         - 当前查看领域：{current_domain if current_domain != 'all' else '所有领域'}
         
         🏷️ 领域分布：
-        {chr(10).join([f"  - {domain}: {count} 个实体" for domain, count in domain_stats.items()])}
+        {chr(10).join([f"  - {line}" for line in domain_lines])}
         
         🔗 关系类型分布：
-        {chr(10).join([f"  - {rel_type}: {count} 个关系" for rel_type, count in relation_types.items()])}
+        {chr(10).join([f"  - {line}" for line in relation_type_lines])}
         
-        📋 实体列表（前20个）：
+        📋 实体列表（{entity_scope}的实体及其邻居，共 {len(entity_list)} 个）：
         {chr(10).join([f"  - {entity}" for entity in entity_list])}
-        {f"{chr(10)}  ... 还有 {total_nodes - 20} 个实体" if total_nodes > 20 else ""}
+        {f"{chr(10)}  ... 其余 {total_nodes - len(entity_list)} 个实体未列出" if total_nodes > len(entity_list) else ""}
         
-        🔗 关系列表（前15个）：
+        🔗 关系列表（上述实体的 {len(link_list)} 个关系）：
         {chr(10).join([f"  - {link}" for link in link_list])}
-        {f"{chr(10)}  ... 还有 {total_links - 15} 个关系" if total_links > 15 else ""}
+        {f"{chr(10)}  ... 其余 {total_links - len(link_list)} 个关系未列出" if total_links > len(link_list) else ""}
         """
         
         # 添加当前选中元素信息
         if selected_node:
-            selected_entity_links = [
-                link for link in links 
-                if (isinstance(link.get('source'), dict) and link['source'].get('id') == selected_node.get('id')) or
-                   (isinstance(link.get('source'), str) and link.get('source') == selected_node.get('id')) or
-                   (isinstance(link.get('target'), dict) and link['target'].get('id') == selected_node.get('id')) or
-                   (isinstance(link.get('target'), str) and link.get('target') == selected_node.get('id'))
-            ]
+            selected_entity_links = index.relations(selected_node.get('id'))
             
             context += f"""
             
@@ -725,24 +1121,7 @@ def generate_ai_response(user_message, graph_data, current_domain, selected_node
             if selected_entity_links:
                 context += "\n- 相关关系：\n"
                 for link in selected_entity_links[:10]:  # 最多显示10个关系
-                    source_name = ""
-                    target_name = ""
-                    
-                    if isinstance(link.get('source'), dict):
-                        source_name = link['source'].get('name', '')
-                    else:
-                        source_id = link.get('source', '')
-                        source_node = next((n for n in nodes if n.get('id') == source_id), None)
-                        source_name = source_node.get('name', source_id) if source_node else source_id
-                    
-                    if isinstance(link.get('target'), dict):
-                        target_name = link['target'].get('name', '')
-                    else:
-                        target_id = link.get('target', '')
-                        target_node = next((n for n in nodes if n.get('id') == target_id), None)
-                        target_name = target_node.get('name', target_id) if target_node else target_id
-                    
-                    context += f"  * {source_name} --[{link.get('type', '')}]--> {target_name}\n"
+                    context += f"  * {relation_line(index, link)}\n"
         
         if selected_link:
             context += f"""
@@ -770,7 +1149,7 @@ def generate_ai_response(user_message, graph_data, current_domain, selected_node
         
         # 调用ChatGPT API
         response = openai.chat.completions.create(
-            model="gpt-4o-mini",
+            model=_ai_setting("MODEL"),
             messages=[
                 {
                     "role": "system",
@@ -845,10 +1224,10 @@ def generate_ai_response(user_message, graph_data, current_domain, selected_node
 • 总关系数：{total_links} 个
 
 🏷️ 领域分布：
-{chr(10).join([f"• {domain}：{count} 个实体" for domain, count in domain_stats.items()])}
+{chr(10).join([f"• {line}" for line in domain_lines])}
 
 🔗 关系类型：
-{chr(10).join([f"• {rel_type}：{count} 个关系" for rel_type, count in relation_types.items()])}
+{chr(10).join([f"• {line}" for line in relation_type_lines])}
 
 💡 数据来源：以上信息均来自提供的知识图谱数据。"
 
@@ -884,161 +1263,59 @@ def generate_ai_response(user_message, graph_data, current_domain, selected_node
 请严格按照以上步骤进行查找和回答。"""
                 }
             ],
-            max_tokens=1500,
-            temperature=0.3
+            max_tokens=_ai_setting("MAX_TOKENS"),
+            temperature=_ai_setting("TEMPERATURE"),
+            stream=stream
         )
+        if stream:
+            return _iter_deltas(response)
         answer=response.choices[0].message.content
         return answer
         
     except Exception as e:
+        if not fallback:
+            raise
         # 如果API调用失败，使用本地回复
-        return generate_local_ai_response(user_message, graph_data, current_domain, selected_node, selected_link)
+        answer = generate_local_ai_response(user_message, graph_data, current_domain, selected_node, selected_link,
+                                            assistant_index)
+        return iter([answer]) if stream else answer
 
 
-def generate_local_ai_response(user_message, graph_data, current_domain, selected_node, selected_link):
-    """本地AI回复（当外部API不可用时）"""
+def generate_local_ai_response(user_message, graph_data, current_domain, selected_node, selected_link,
+                               assistant_index=None):
+    """本地AI回复（当外部API不可用时）；统计、检索和邻接查询都使用预计算的索引（见 assistant_index.py）"""
     message = user_message.lower()
-    nodes = graph_data.get('nodes', [])
-    links = graph_data.get('links', [])
+    index = assistant_index or get_assistant_index(graph_data)
     
     # 统计信息
-    total_nodes = len(nodes)
-    total_links = len(links)
-    
-    # 领域统计
-    domain_stats = {}
-    for node in nodes:
-        domain = node.get('domain', 'default')
-        domain_stats[domain] = domain_stats.get(domain, 0) + 1
+    total_nodes = index.total_nodes
+    total_links = index.total_links
+    domain_stats = index.domain_stats
+    relation_types = index.relation_types
     
-    # 关系类型统计
-    relation_types = {}
-    for link in links:
-        rel_type = link.get('type', '未知')
-        relation_types[rel_type] = relation_types.get(rel_type, 0) + 1
-    
-    # 智能模糊搜索实体 - 支持多种匹配策略
-    def smart_search_entities(query):
-        results = []
-        query_lower = query.lower()
-        query_words = query_lower.split()
-        
-        for node in nodes:
-            node_name = node.get('name', '').lower()
-            node_id = node.get('id', '').lower()
-            node_desc = node.get('description', '').lower()
-            node_type = node.get('type', '').lower()
-            node_domain = node.get('domain', '').lower()
-            
-            score = 0
-            
-            # 1. 精确匹配（最高分）
-            if query_lower == node_name:
-                score += 100
-            elif query_lower == node_id:
-                score += 90
-            
-            # 2. 包含匹配
-            if query_lower in node_name:
-                score += 80
-            elif query_lower in node_id:
-                score += 70
-            elif query_lower in node_desc:
-                score += 60
-            
-            # 3. 分词匹配（支持部分词匹配）
-            for word in query_words:
-                if len(word) > 1:  # 忽略单字符
-                    if word in node_name:
-                        score += 40
-                    elif word in node_desc:
-                        score += 30
-                    elif word in node_type:
-                        score += 25
-                    elif word in node_domain:
-                        score += 20
-            
-            # 4. 拼音匹配（简单实现）
-            if any(char in 'abcdefghijklmnopqrstuvwxyz' for char in query_lower):
-                # 英文查询，检查是否有英文内容
-                if any(char in 'abcdefghijklmnopqrstuvwxyz' for char in node_name):
-                    score += 15
-            
-            # 5. 语义相似度（基于关键词）
-            semantic_keywords = {
-                'ai': ['人工智能', '机器学习', '深度学习', '神经网络', '算法'],
-                'medical': ['医学', '医疗', '疾病', '治疗', '药物', '医院'],
-                'finance': ['金融', '投资', '股票', '基金', '理财', '银行'],
-                'education': ['教育', '学习', '培训', '学校', '课程'],
-                'tech': ['技术', '软件', '编程', '开发', '系统']
-            }
-            
-            for key, keywords in semantic_keywords.items():
-                if key in query_lower:
-                    for keyword in keywords:
-                        if keyword in node_name or keyword in node_desc:
-                            score += 35
-                            break
-            
-            if score > 0:
-                results.append((node, score))
-        
-        # 按分数排序并返回实体
-        results.sort(key=lambda x: x[1], reverse=True)
-        return [node for node, score in results]
+    # 智能模糊搜索实体 - 支持多种匹配策略（按相关度取前若干个）
+    def smart_search_entities(query, limit=8):
+        return index.search(query, limit)
     
     # 智能实体推荐
     def recommend_related_entities(entity_id, max_recommendations=5):
         """基于关系推荐相关实体"""
-        related_entities = set()
-        entity_relations = get_entity_relations(entity_id)
-        
-        for link in entity_relations:
-            if isinstance(link.get('source'), dict):
-                if link['source'].get('id') != entity_id:
-                    related_entities.add(link['source'].get('id'))
-            elif isinstance(link.get('source'), str) and link.get('source') != entity_id:
-                related_entities.add(link.get('source'))
-            
-            if isinstance(link.get('target'), dict):
-                if link['target'].get('id') != entity_id:
-                    related_entities.add(link['target'].get('id'))
-            elif isinstance(link.get('target'), str) and link.get('target') != entity_id:
-                related_entities.add(link.get('target'))
-        
-        recommendations = []
-        for entity_id in list(related_entities)[:max_recommendations]:
-            entity = next((n for n in nodes if n.get('id') == entity_id), None)
-            if entity:
-                recommendations.append(entity)
-        
-        return recommendations
+        return index.neighbors(entity_id, max_recommendations)
     
     # 获取实体的相关关系
     def get_entity_relations(entity_id):
-        return [
-            link for link in links 
-            if (isinstance(link.get('source'), dict) and link['source'].get('id') == entity_id) or
-               (isinstance(link.get('source'), str) and link.get('source') == entity_id) or
-               (isinstance(link.get('target'), dict) and link['target'].get('id') == entity_id) or
-               (isinstance(link.get('target'), str) and link.get('target') == entity_id)
-        ]
+        return index.relations(entity_id)
     
     # 获取实体名称
     def get_entity_name(entity_id):
-        if isinstance(entity_id, dict):
-            return entity_id.get('name', '')
-        else:
-            entity = next((n for n in nodes if n.get('id') == entity_id), None)
-            return entity.get('name', entity_id) if entity else entity_id
+        return index.name_of(entity_id)
     
     # 智能实体查询 - 支持多种查询方式
     def handle_entity_query():
         # 1. 精确实体查询
-        for node in nodes:
-            node_name = node.get('name', '').lower()
-            if node_name in message and len(node_name) > 1:
-                return generate_entity_detail_response(node)
+        node = index.name_in(message)
+        if node:
+            return generate_entity_detail_response(node)
         
         # 2. 智能模糊搜索
         search_results = smart_search_entities(message)
@@ -1166,14 +1443,9 @@ def generate_local_ai_response(user_message, graph_data, current_domain, selecte
                 return f"❌ {selected_node.get('name')} 目前没有相关推荐"
         else:
             # 推荐最活跃的实体
-            if nodes:
-                entity_activity = {}
-                for node in nodes:
-                    entity_activity[node['id']] = len(get_entity_relations(node['id']))
-                
-                most_active = max(entity_activity.items(), key=lambda x: x[1])
-                most_active_entity = next(n for n in nodes if n['id'] == most_active[0])
-                return f"⭐ 推荐最活跃实体：{most_active_entity.get('name')} ({most_active[1]} 个关系)"
+            if index.most_active:
+                most_active_entity, activity = index.most_active
+                return f"⭐ 推荐最活跃实体：{most_active_entity.get('name')} ({activity} 个关系)"
         
         return "请先选择一个实体，我可以为您推荐相关内容"
         
@@ -1352,9 +1624,10 @@ def clear_all_data(request):
             ]
         }
         
-        # 删除所有数据
-        entities.delete()
-        relationships.delete()
+        # 删除所有数据（逐行的 post_delete 信号合并为一次失效）
+        with transaction.atomic(), deferred_invalidation():
+            entities.delete()
+            relationships.delete()
         
         return JsonResponse({
             "ret": 0,
@@ -1385,91 +1658,24 @@ def save_data_mode(request):
         links = data.get("links", [])
         current_domain = data.get("currentDomain", "all")
         
-        print(f"接收到的数据 - 实体数量: {len(nodes)}, 关系数量: {len(links)}, 当前领域: {current_domain}")
-        print(f"关系数据示例: {links[:2] if links else '无关系数据'}")
+        logger.debug("接收到的数据 - 实体数量: %d, 关系数量: %d, 当前领域: %s", len(nodes), len(links), current_domain)
         
         if not isinstance(nodes, list) or not isinstance(links, list):
             return JsonResponse({"ret": 1, "msg": "数据格式错误"})
         
-        # 根据领域决定更新策略
-        if current_domain == "all":
-            # 更新所有数据
-            print("更新所有领域的数据")
-            Entity.objects.all().delete()
-            Relationship.objects.all().delete()
-        else:
-            # 只更新特定领域的数据
-            print(f"只更新领域 '{current_domain}' 的数据")
-            # 删除该领域的实体和关系
-            Entity.objects.filter(domain=current_domain).delete()
-            Relationship.objects.filter(domain=current_domain).delete()
-        
-        # 保存新数据
-        saved_entities = 0
-        saved_relationships = 0
-        
-        # 保存实体
-        for node in nodes:
-            try:
-                # 如果更新特定领域，确保实体的领域字段正确
-                if current_domain != "all":
-                    node["domain"] = current_domain
-                
-                Entity.objects.create(
-                    id=node.get("id", ""),
-                    name=node.get("name", ""),
-                    type=node.get("type", ""),
-                    description=node.get("description", ""),
-                    domain=node.get("domain", "default")
-                )
-                saved_entities += 1
-                print(f"保存实体成功: {node.get('id')} - {node.get('name')}")
-            except Exception as e:
-                print(f"保存实体失败: {e}")
-                continue
-        
-        # 保存关系
-        for i, link in enumerate(links):
-            try:
-                source_id = link.get("source", "")
-                target_id = link.get("target", "")
-                
-                print(f"处理关系 {i+1}: source={source_id}, target={target_id}, type={link.get('type', '')}")
-                
-                # 确保源实体和目标实体存在
-                source_entity = Entity.objects.filter(id=source_id).first()
-                target_entity = Entity.objects.filter(id=target_id).first()
-                
-                if source_entity and target_entity:
-                    # 如果更新特定领域，确保关系的领域字段正确
-                    if current_domain != "all":
-                        link["domain"] = current_domain
-                    
-                    Relationship.objects.create(
-                        source=source_entity,
-                        target=target_entity,
-                        type=link.get("type", ""),
-                        description=link.get("description", ""),
-                        domain=link.get("domain", "default")
-                    )
-                    saved_relationships += 1
-                    print(f"关系 {i+1} 保存成功")
-                else:
-                    print(f"关系 {i+1} 保存失败: 源实体或目标实体不存在")
-                    if not source_entity:
-                        print(f"  源实体 {source_id} 不存在")
-                    if not target_entity:
-                        print(f"  目标实体 {target_id} 不存在")
-            except Exception as e:
-                print(f"保存关系 {i+1} 失败: {e}")
-                continue
-        
+        # 只写入与数据库当前状态的差量
+        diff = GraphDiff(current_domain=current_domain).apply(nodes, links)
+        entities = diff["entities"]
+        relationships = diff["relationships"]
+        logger.debug("保存完成 - 实体: %s, 关系: %s", entities, relationships)
+
         return JsonResponse({
             "ret": 0,
             "msg": "数据保存成功",
             "data": {
-                "saved_entities": saved_entities,
-                "saved_relationships": saved_relationships
+                "saved_entities": entities["added"] + entities["changed"] + entities["unchanged"],
+                "saved_relationships": relationships["added"] + relationships["changed"] + relationships["unchanged"],
+                "diff": diff
             }
         })
         
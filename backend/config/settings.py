@@ -117,7 +117,16 @@ else:
 CHATGPT_API_KEY = env('CHATGPT_API_KEY', default='123456789')
 CHATGPT_API_URL = env('CHATGPT_API_URL', default='https://api.openai.com/v1/')
 CHATGPT_BASE_URL = env('CHATGPT_BASE_URL', default='https://api.openai.com/v1/')
-CHATGPT_MODEL = env('CHATGPT_MODEL', default='gpt-3.5-turbo')
-CHATGPT_MAX_TOKENS = env.int('CHATGPT_MAX_TOKENS', default=300)
-CHATGPT_TEMPERATURE = env.float('CHATGPT_TEMPERATURE', default=0.7)
-CHATGPT_USE_OPENAI_LIB = env.bool('CHATGPT_USE_OPENAI_LIB', default=True)
\ No newline at end of file
+CHATGPT_MODEL = env('CHATGPT_MODEL', default='gpt-4o-mini')
+CHATGPT_MAX_TOKENS = env.int('CHATGPT_MAX_TOKENS', default=1500)
+CHATGPT_TEMPERATURE = env.float('CHATGPT_TEMPERATURE', default=0.3)
+CHATGPT_USE_OPENAI_LIB = env.bool('CHATGPT_USE_OPENAI_LIB', default=True)
+# 知识图谱快照缓存配置（get_graph_data）
+KG_GRAPH_CACHE_MAX_ENTRIES = env.int('KG_GRAPH_CACHE_MAX_ENTRIES', default=32)
+KG_GRAPH_CACHE_TTL = env.int('KG_GRAPH_CACHE_TTL', default=300)  # 秒，0 表示不过期
+KG_EXPORT_CHUNK_SIZE = env.int('KG_EXPORT_CHUNK_SIZE', default=2000)  # 流式导出每块行数
+KG_IMPORT_BATCH_SIZE = env.int('KG_IMPORT_BATCH_SIZE', default=1000)  # 批量导入每块行数
+KG_LIST_MAX_LIMIT = env.int('KG_LIST_MAX_LIMIT', default=5000)  # 列表接口单页最大行数
+KG_AI_CONTEXT_TOKENS = env.int('KG_AI_CONTEXT_TOKENS', default=600)  # 外部AI提示词中检索上下文的token预算
+KG_AI_CACHE_TTL = env.int('KG_AI_CACHE_TTL', default=3600)  # AI聊天回复缓存（秒），0 表示不过期
+KG_AI_CACHE_BACKEND = env('KG_AI_CACHE_BACKEND', default=None)  # 共享回复缓存使用的 CACHES 别名，为空时使用进程内缓存
@@ -2,6 +2,11 @@
 // ȫ�ֱ���
 let graphData = { nodes: [], links: [] }; // ͼ������
 let svg, simulation; // D3 SVG������������ģ��
+// 视口模式：节点带有服务端预计算的坐标时，缩放/平移结束后只请求可见范围内的节点
+let viewportMode = false;
+let viewportTimer = null;
+let zoomBehavior;
+let currentTransform = d3.zoomIdentity;
 
 // ��ʼ��ͼ��
 function initGraph() {
@@ -16,9 +21,13 @@ function initGraph() {
         .attr('height', height);
 
     // �������Ź���
-    svg.call(d3.zoom().on('zoom', (event) => {
-        g.attr('transform', event.transform);
-    }));
+    zoomBehavior = d3.zoom()
+        .on('zoom', (event) => {
+            currentTransform = event.transform;
+            svg.select('g').attr('transform', currentTransform);
+        })
+        .on('end', (event) => scheduleViewportLoad(event.transform));
+    svg.call(zoomBehavior);
 
     const g = svg.append('g');
 
@@ -44,6 +53,12 @@ function loadGraphData() {
         .then(res => {
             if (res.ret === 0) {
                 graphData = res.data;
+                viewportMode = graphData.nodes.length > 0 && graphData.nodes.every(n => typeof n.x === 'number');
+                if (viewportMode) {
+                    // 预计算坐标以原点为中心
+                    svg.call(zoomBehavior.transform,
+                        d3.zoomIdentity.translate(svg.attr('width') / 2, svg.attr('height') / 2));
+                }
                 updateGraph(); // ������Ⱦͼ��
             } else {
                 console.error('���ݼ���ʧ��:', res.msg);
@@ -62,7 +77,12 @@ function updateGraph() {
         svg.selectAll('*').remove();
 
         // �����µ�ͼ��
-        const g = svg.append('g');
+        const g = svg.append('g').attr('transform', currentTransform);
+
+        // 视口模式下节点固定在预计算的坐标上，不再由力模拟移动
+        if (viewportMode) {
+            graphData.nodes.forEach(n => { n.fx = n.x; n.fy = n.y; });
+        }
 
         // ���ƹ�ϵ��
         const link = g.append('g')
@@ -119,6 +139,30 @@ function updateGraph() {
     }
 }
 
+// 缩放/平移结束后稍作等待再请求，连续操作只发出最后一次请求
+function scheduleViewportLoad(transform) {
+    if (!viewportMode) return;
+    clearTimeout(viewportTimer);
+    viewportTimer = setTimeout(() => loadViewport(transform), 200);
+}
+
+// 按当前可见范围请求节点（/api/kg/data?bbox=x0,y0,x1,y1&zoom=k）
+function loadViewport(transform) {
+    const [x0, y0] = transform.invert([0, 0]);
+    const [x1, y1] = transform.invert([svg.attr('width'), svg.attr('height')]);
+    fetch(`/api/kg/data?bbox=${x0},${y0},${x1},${y1}&zoom=${transform.k}`)
+        .then(response => response.json())
+        .then(res => {
+            if (res.ret === 0) {
+                graphData = res.data;
+                updateGraph();
+            } else {
+                console.error('视口数据加载失败:', res.msg);
+            }
+        })
+        .catch(error => console.error('视口数据加载失败:', error));
+}
+
 // ��ק�¼�����
 function dragstarted(event, d) {
     if (!event.active) simulation.alphaTarget(0.3).restart();